@@ -0,0 +1,77 @@
+"""
+"All Devices" dialog cost.
+
+Compares what the old dialog did on opening and after every edit (collect
+every (device, location) pair and format a line for each) with what the
+virtualized list does: count the rows of a DeviceTable and format the ~20
+rows in view. Also times the type, location and name filters, and the
+table update after adding a device.
+
+    python -m benchmarks.bench_device_list [--devices N] [--repeat N]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.suite import best_of
+from benchmarks.synthetic import generate
+from dsl.parser import parse_places
+from gui.device_list import DeviceTable
+from models.models import Device
+from models.search import PlaceIndex
+
+VISIBLE_ROWS = 20
+
+
+def row_text(device, location):
+    return f"{device.name} ({device.device_type}) - {location.name}"
+
+
+def list_all(place):
+    devices = [(device, location) for location in place.locations for device in location.devices]
+    return [row_text(device, location) for device, location in devices]
+
+
+def open_table(place, index):
+    table = DeviceTable(place, index)
+    return [row_text(*table[row]) for row in range(min(VISIBLE_ROWS, len(table)))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--devices", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    place = parse_places(generate(max(1, args.devices // 10)))[0]
+    print(f"{len(place.devices_by_id)} devices, {len(place.locations)} locations")
+    print(f"  full list          {best_of(list_all, place, args.repeat) * 1000:8.2f} ms")
+    # The app keeps one search index per place, shared by every dialog
+    index = PlaceIndex(place)
+    print(f"  virtualized open   {best_of(lambda place: open_table(place, index), place, args.repeat) * 1000:8.2f} ms")
+
+    table = DeviceTable(place, index)
+    location = place.locations[len(place.locations) // 2]
+    filters = [
+        ("type", lambda table: table.filter(device_type="Light")),
+        ("location", lambda table: table.filter(location=location)),
+        ("name prefix", lambda table: table.filter(prefix="light12")),
+        ("type + prefix", lambda table: table.filter(device_type="Light", prefix="light12")),
+    ]
+    for name, func in filters:
+        def uncached(table, func=func):
+            table.changed()
+            return func(table)
+        print(f"  filter {name:12} {best_of(uncached, table, args.repeat) * 1000:8.2f} ms  ({len(func(table))} rows)")
+
+    def add_and_show(table):
+        location.add_device(Device(name="NewLight", device_type="Light"))
+        table.changed(location)
+        return [row_text(*table[row]) for row in range(min(VISIBLE_ROWS, len(table)))]
+    print(f"  add device, redraw {best_of(add_and_show, table, args.repeat) * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Undo history cost.
+
+Applies a mix of edits (add/remove location, add/remove/edit device, add
+rule and scene) to a synthetic estate through models.history.History and
+reports the memory the history itself holds and the time to apply, undo
+and redo all of it, next to the memory a history of deep copies of the
+place would take.
+
+    python -m benchmarks.bench_history [--devices N] [--steps N]
+"""
+import argparse
+import copy
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.synthetic import generate
+from dsl.parser import parse_places
+from models.history import (History, AddDevice, AddLocation, AddRule, AddScene, EditDevice, RemoveDevice,
+                            RemoveLocation)
+from models.models import Device, Location, Rule, Scene
+
+
+def random_operation(place, rnd, step):
+    kind = rnd.randrange(7)
+    location = rnd.choice(place.locations)
+    if kind == 0:
+        return AddLocation(place, Location(name=f"Added{step}"))
+    if kind == 1 and len(place.locations) > 1:
+        return RemoveLocation(place, location)
+    if kind == 2:
+        return AddDevice(location, Device(name=f"Device{step}", device_type="Light"))
+    if kind == 3 and location.devices:
+        return RemoveDevice(location, rnd.choice(location.devices))
+    if kind == 4 and location.devices:
+        target = rnd.choice(place.locations)
+        return EditDevice(place, rnd.choice(location.devices), f"Renamed{step}", "AC", target)
+    if kind == 5:
+        return AddRule(place, Rule(name=f'"Added{step}"', condition="Sensor0_1 detects movement"))
+    return AddScene(place, Scene(name=f"Added{step}", location=location.name))
+
+
+def history_size(history):
+    """Bytes the history itself holds: the stack and the operations, not the model objects they refer to."""
+    size = sys.getsizeof(history.done)
+    for operation in history.done:
+        size += sys.getsizeof(operation)
+        if getattr(operation, "old", None) is not None:
+            size += sys.getsizeof(operation.old)
+    return size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--devices", type=int, default=100_000)
+    parser.add_argument("--steps", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    place = parse_places(generate(max(1, args.devices // 10)))[0]
+    print(f"{len(place.devices_by_id)} devices, {args.steps} edits")
+    rnd = random.Random(0)
+    operations = [random_operation(place, rnd, step) for step in range(args.steps)]
+
+    history = History(limit=args.steps)
+    start = time.perf_counter()
+    for operation in operations:
+        # Operations were drawn against the initial place; skip those no longer valid
+        try:
+            history.do(operation)
+        except ValueError:
+            pass
+    apply_time = time.perf_counter() - start
+    held = history_size(history)
+
+    start = time.perf_counter()
+    while history.undo():
+        pass
+    undo_time = time.perf_counter() - start
+    start = time.perf_counter()
+    while history.redo():
+        pass
+    redo_time = time.perf_counter() - start
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    snapshot = copy.deepcopy(place)
+    one_copy = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del snapshot
+
+    steps = len(history.done)
+    print(f"  history of {steps} edits   {held / 1e3:10.1f} KB  ({held / max(steps, 1):.0f} bytes per edit)")
+    print(f"  deep copy per edit       {one_copy * steps / 1e6:10.1f} MB  ({one_copy / 1e6:.1f} MB per copy)")
+    print(f"  apply all {apply_time * 1000:8.1f} ms, undo all {undo_time * 1000:8.1f} ms, "
+          f"redo all {redo_time * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
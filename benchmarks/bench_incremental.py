@@ -0,0 +1,69 @@
+"""
+Incremental reparse versus a full parse after each edit.
+
+Applies a series of single-block edits (renaming a device, changing a rule's
+threshold) to a generated estate, once through dsl.incremental.Document and
+once by parsing the whole edited text again, and reports the time per edit.
+
+    python -m benchmarks.bench_incremental [--locations N] [--edits N]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.synthetic import generate
+from dsl.incremental import Document
+from dsl.parser import parse_places
+
+
+def make_edits(text, count, rng):
+    """(start, end, replacement) edits on the text as it will be after the previous ones."""
+    edits = []
+    for _ in range(count):
+        if rng.random() < 0.5:
+            old = "temperature >"
+            new = "temperature <"
+        else:
+            old = ": Light"
+            new = ": Lock"
+        pos = text.find(old, rng.randrange(len(text)))
+        if pos < 0:
+            pos = text.find(old)
+        edits.append((pos, pos + len(old), new))
+        text = text[:pos] + new + text[pos + len(old):]
+    return edits
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--locations", type=int, default=5000)
+    parser.add_argument("--edits", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    text = generate(args.locations)
+    doc = Document(text)
+    edits = make_edits(text, args.edits, random.Random(42))
+    print(f"{args.locations} locations, {len(text) / 1e6:.1f} MB, {args.edits} edits")
+
+    start = time.perf_counter()
+    full = 0
+    for edit in edits:
+        full += doc.edit(*edit).full
+    incremental = (time.perf_counter() - start) / args.edits
+    print(f"  incremental {incremental * 1000:8.2f} ms/edit  ({full} full reparses)")
+
+    reparse_edits = edits[:max(1, args.edits // 20)]
+    start = time.perf_counter()
+    for start_pos, end_pos, replacement in reparse_edits:
+        text = text[:start_pos] + replacement + text[end_pos:]
+        parse_places(text)
+    reparse = (time.perf_counter() - start) / len(reparse_edits)
+    print(f"  full parse  {reparse * 1000:8.2f} ms/edit  ({reparse / incremental:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Model memory footprint.
+
+Builds the same estate with the model classes as they were before
+(@dataclass with a __dict__ and uuid4() string ids) and with the current
+slotted classes with integer ids, and reports the bytes used per device,
+alone and in an indexed Place.
+
+    python -m benchmarks.bench_memory [--devices N]
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+import uuid
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from models.constants import DEVICE_TYPES
+from models.models import Device, Location, Place
+
+
+# The models as they were before, kept as a baseline
+@dataclass
+class LegacyDevice:
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    name: str = ""
+    device_type: str = ""
+    location: Optional["LegacyLocation"] = None
+
+
+@dataclass
+class LegacyLocation:
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    name: str = ""
+    devices: List[LegacyDevice] = field(default_factory=list)
+
+    def add_device(self, device):
+        device.location = self
+        self.devices.append(device)
+
+
+def build(location_cls, device_cls, n_devices, devices_per_location=10):
+    locations = []
+    for i in range(0, n_devices, devices_per_location):
+        location = location_cls(name=f"Room{i // devices_per_location}")
+        for j in range(i, min(i + devices_per_location, n_devices)):
+            device_type = DEVICE_TYPES[j % len(DEVICE_TYPES)]
+            location.add_device(device_cls(name=f"{device_type}{j}", device_type=device_type))
+        locations.append(location)
+    return locations
+
+
+def build_place(n_devices):
+    place = Place("Estate")
+    for location in build(Location, Device, n_devices):
+        place.add_location(location)
+    return place
+
+
+def measure(func, *args):
+    gc.collect()
+    tracemalloc.start()
+    result = func(*args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--devices", type=int, default=100_000)
+    args = parser.parse_args(argv)
+    n = args.devices
+
+    legacy = measure(build, LegacyLocation, LegacyDevice, n)
+    current = measure(build, Location, Device, n)
+    indexed = measure(build_place, n)
+    print(f"{n} devices, 10 per location (bytes per device, location share included)")
+    print(f"  dataclass + uuid4 str   {legacy / n:7.1f}")
+    print(f"  slots + int ids         {current / n:7.1f}  ({1 - current / legacy:.0%} less)")
+    print(f"  ... in a Place          {indexed / n:7.1f}  (of which {(indexed - current) / n:.1f} for the id/name/type indexes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Serial versus per-place parallel loading of a multi-building estate.
+
+Generates an estate of several places of different sizes and reports the
+time to parse it and compile its rules in one process, and with
+dsl.parallel.load_places spread over worker processes. Also reports the
+serial time of the largest building alone, the lower bound of the
+parallel load, and whether load_places() estimated a pool worth starting
+(it parses serially otherwise, so both times match).
+
+    python -m benchmarks.bench_parallel [--buildings N] [--locations N] [--workers N]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.suite import best_of
+from benchmarks.synthetic import generate
+from dsl.parallel import load_places, split_places, worth_a_pool
+from dsl.parser import parse_places
+from dsl.snapshot import compile_rules
+
+
+def estate(buildings, locations):
+    """Buildings of 1x to 2x `locations` locations each."""
+    parts = []
+    for b in range(buildings):
+        size = locations + locations * b // max(1, buildings - 1)
+        parts.append(generate(size).replace("place Estate:", f"place Building{b}:", 1))
+    return "\n".join(parts)
+
+
+def load_serial(text):
+    places = parse_places(text)
+    return [compile_rules(place) for place in places]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--buildings", type=int, default=12)
+    parser.add_argument("--locations", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    text = estate(args.buildings, args.locations)
+    largest = generate(2 * args.locations if args.buildings > 1 else args.locations)
+    print(f"{args.buildings} buildings, {len(text) / 1e6:.1f} MB, {args.workers} workers "
+          f"({os.cpu_count()} CPUs)")
+    serial = best_of(load_serial, text, args.repeat)
+    parallel = best_of(lambda t: load_places(t, args.workers), text, args.repeat)
+    alone = best_of(load_serial, largest, args.repeat)
+    print(f"  serial           {serial * 1000:8.1f} ms")
+    pooled = worth_a_pool([len(piece) for _, piece in split_places(text)], args.workers)
+    print(f"  parallel         {parallel * 1000:8.1f} ms  ({serial / parallel:.2f}x, {'pool' if pooled else 'not worth a pool, serial'})")
+    print(f"  largest building {alone * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+DSL parser throughput.
+
+Generates a multi-megabyte .shl file and compares dsl.parser against the
+line-by-line regex parser it replaced (which checks no syntax) and against
+textX, on time and peak memory. textX resolves every reference by walking
+the model, so it slows down superlinearly: on the same file it runs in a
+child process that is stopped after --textx-limit seconds, and its rate is
+also shown on a small file. The streaming iter_file() is measured on the
+same file written to disk, discarding each object as it is yielded, as are
+loads from its binary snapshot.
+
+    python -m benchmarks.bench_parser [--locations N] [--textx-limit S] [--textx-locations N]
+"""
+import argparse
+import importlib.util
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.suite import best_of
+from benchmarks.synthetic import generate
+from dsl import snapshot
+from dsl.parser import iter_file, parse_dsl
+from models.models import Device, Location, Place, Rule, Scene
+
+
+def legacy_parse_dsl(text):
+    """The regex cascade formerly in SmartHomeApp.parse_dsl, kept as a baseline."""
+    lines = [l.split("//")[0].rstrip() for l in text.splitlines() if l.strip()]
+    place = None
+    current_context = None
+
+    re_place = re.compile(r"^\s*place\s+([A-Za-z0-9_\-]+)\s*:", re.IGNORECASE)
+    re_location = re.compile(r"^\s*location\s+([A-Za-z0-9_\-]+)\s*:\s*$", re.IGNORECASE)
+    re_device = re.compile(r"^\s*device\s+([A-Za-z0-9_\-]+)\s*:\s*([A-Za-z0-9_\-]+)\s*$", re.IGNORECASE)
+    re_rule = re.compile(r"^\s*rule\s+(\".*\")\s*:", re.IGNORECASE)
+    re_scene = re.compile(r"^\s*scene\s+(\".*\")\s+at\s+([A-Za-z0-9_\-]+)\s*:", re.IGNORECASE)
+    re_if = re.compile(r"^\s*if\s+(.*)", re.IGNORECASE)
+    re_do = re.compile(r"^\s*do\s+(.*)", re.IGNORECASE)
+    re_end = re.compile(r"^\s*end\s*$", re.IGNORECASE)
+
+    for line in lines:
+        line = line.strip()
+        if re_end.match(line):
+            if isinstance(current_context, (Location, Rule, Scene)):
+                current_context = None
+            continue
+        if isinstance(current_context, Location) and (m := re_device.match(line)):
+            current_context.add_device(Device(name=m.group(1), device_type=m.group(2)))
+            continue
+        elif isinstance(current_context, Rule) and (m := re_if.match(line)):
+            current_context.condition = m.group(1).strip()
+            continue
+        elif isinstance(current_context, (Rule, Scene)) and (m := re_do.match(line)):
+            current_context.actions.append(m.group(1).strip())
+            continue
+        if m := re_place.match(line):
+            place = Place(m.group(1))
+            continue
+        if not place:
+            continue
+        if m := re_location.match(line):
+            current_context = Location(name=m.group(1))
+            place.locations.append(current_context)
+            continue
+        if m := re_rule.match(line):
+            current_context = Rule(name=m.group(1))
+            place.rules.append(current_context)
+            continue
+        if m := re_scene.match(line):
+            scene_name, loc_name = m.groups()
+            current_context = Scene(name=scene_name.strip('"'), location=loc_name)
+            place.scenes.append(current_context)
+            continue
+    # Index the place as every loaded place is now, so both parsers build the same model
+    locations, place.locations = place.locations, []
+    for location in locations:
+        place.add_location(location)
+    return place
+
+
+def peak_memory(func, arg):
+    """Peak bytes allocated while running func(arg)."""
+    tracemalloc.start()
+    func(arg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def textx_parse(text):
+    from dsl.metamodel import get_metamodel
+    get_metamodel().model_from_str(text)
+
+
+def _send_time(func, arg, conn):
+    start = time.perf_counter()
+    func(arg)
+    conn.send(time.perf_counter() - start)
+
+
+def time_limited(func, arg, limit):
+    """Seconds func(arg) takes in a child process, or None if it was still running after `limit` seconds."""
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    child = multiprocessing.Process(target=_send_time, args=(func, arg, sender), daemon=True)
+    child.start()
+    child.join(limit)
+    if child.is_alive():
+        child.terminate()
+        child.join()
+        return None
+    if child.exitcode != 0:
+        raise RuntimeError(f"{func.__name__} failed in the child process (exit code {child.exitcode})")
+    return receiver.recv()
+
+
+def from_file(text, repeat):
+    """
+    Writes `text` to disk and times iter_file() (plus its peak memory when
+    nothing is kept), a first snapshot.load() that parses, compiles and writes
+    the snapshot, and the following loads that read it.
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".shl", encoding="utf-8", delete=False) as f:
+        f.write(text)
+    try:
+        consume = lambda path: deque(iter_file(path), maxlen=0)
+        streamed = best_of(consume, f.name, 1)
+        peak = peak_memory(consume, f.name)
+        cold = best_of(snapshot.load, f.name, 1)
+        warm = best_of(snapshot.load, f.name, repeat)
+    finally:
+        os.remove(f.name)
+        if os.path.exists(snapshot.snapshot_path(f.name)):
+            os.remove(snapshot.snapshot_path(f.name))
+    return streamed, peak, cold, warm
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--locations", type=int, default=5000)
+    parser.add_argument("--textx-limit", type=float, default=60,
+                        help="seconds textX may take on the large file before it is stopped (0 to skip textX)")
+    parser.add_argument("--textx-locations", type=int, default=40,
+                        help="locations of the small file textX's rate is also measured on")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    text = generate(args.locations)
+    mb = len(text) / 1e6
+    new = best_of(parse_dsl, text, args.repeat)
+    old = best_of(legacy_parse_dsl, text, args.repeat)
+    print(f"{mb:.1f} MB, {args.locations} locations")
+    print(f"  dsl.parser    {new:.3f} s  ({mb / new:.1f} MB/s)  peak {peak_memory(parse_dsl, text) / 1e6:.1f} MB")
+    print(f"  legacy regex  {old:.3f} s  ({mb / old:.1f} MB/s)  peak {peak_memory(legacy_parse_dsl, text) / 1e6:.1f} MB"
+          f"  {old / new:.2f}x, no syntax check")
+    with_textx = args.textx_limit and importlib.util.find_spec("textx") is not None
+    if args.textx_limit and not with_textx:
+        print("  textX not installed, skipped")
+    if with_textx:
+        tx = time_limited(textx_parse, text, args.textx_limit)
+        if tx is None:
+            print(f"  textX         did not finish within {args.textx_limit:.0f} s (> {args.textx_limit / new:.0f}x)")
+        else:
+            print(f"  textX         {tx:.3f} s  ({mb / tx:.2f} MB/s)  {tx / new:.0f}x")
+    streamed, peak, cold, warm = from_file(text, args.repeat)
+    print(f"  iter_file     {streamed:.3f} s  ({mb / streamed:.1f} MB/s)  peak {peak / 1e6:.1f} MB")
+    print(f"  snapshot      {warm:.3f} s  (first load, parsing and writing it: {cold:.3f} s)")
+
+    if with_textx and args.textx_locations:
+        small = generate(args.textx_locations)
+        small_mb = len(small) / 1e6
+        tx = time_limited(textx_parse, small, args.textx_limit)
+        new_small = best_of(parse_dsl, small, args.repeat)
+        print(f"{small_mb:.2f} MB, {args.textx_locations} locations")
+        print(f"  dsl.parser    {new_small:.3f} s  ({small_mb / new_small:.2f} MB/s)")
+        if tx is None:
+            print(f"  textX         did not finish within {args.textx_limit:.0f} s")
+        else:
+            print(f"  textX         {tx:.3f} s  ({small_mb / tx:.2f} MB/s)  {tx / new_small:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Saving cost.
+
+Compares how long the old save blocked the editor (generate the whole DSL
+and write it, on the Tk thread) with what the main thread does now (join
+the preview's cached blocks), and times the part left to the worker
+thread: hashing and atomically writing the file, or only hashing it when
+its content is unchanged.
+
+    python -m benchmarks.bench_save [--devices N] [--repeat N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.suite import best_of
+from benchmarks.synthetic import generate
+from dsl.generator import generate_document_text
+from dsl.parser import parse_places
+from gui.preview import DSLPreview
+from gui.saving import save_if_changed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--devices", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    places = parse_places(generate(max(1, args.devices // 10)))
+    # The preview has every block rendered already when the user saves
+    preview = DSLPreview(None, lambda: places)
+    text = preview.text()
+    print(f"{sum(len(place.devices_by_id) for place in places)} devices, {len(text) / 1e6:.1f} MB of DSL")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "home.shl")
+
+        def old_save(places):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(generate_document_text(places))
+
+        def write(text):
+            # No file content hashes to b"", so the file is always written
+            save_if_changed(path, text, known_hash=b"")
+
+        print(f"  old save, on the Tk thread      {best_of(old_save, places, args.repeat) * 1000:8.2f} ms")
+        print(f"  now, on the Tk thread           {best_of(lambda preview: preview.text(), preview, args.repeat) * 1000:8.2f} ms")
+        print(f"  now, in the worker: write       {best_of(write, text, args.repeat) * 1000:8.2f} ms")
+        digest, _ = save_if_changed(path, text)
+        print(f"  now, in the worker: unchanged   "
+              f"{best_of(lambda text: save_if_changed(path, text, digest), text, args.repeat) * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
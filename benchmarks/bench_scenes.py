@@ -0,0 +1,57 @@
+"""
+Scene activation latency.
+
+Runs an "AllOff" scene over N lights (each also switched on first, which the
+planner collapses) against a FakeActuator with a fixed per-device delay,
+standing in for the network round-trip. Reports the latency with commands
+sent one device at a time and with the SceneExecutor at a few concurrency
+limits.
+
+    python -m benchmarks.bench_scenes [--devices N] [--rtt SECONDS]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from models.models import Scene
+from runtime.engine import parse_action
+from runtime.pipeline import FakeActuator
+from runtime.scenes import SceneExecutor
+
+
+def all_off(devices):
+    actions = [f"Light{i} turn_on" for i in range(devices)] + [f"Light{i} turn_off" for i in range(devices)]
+    return Scene(name="AllOff", location="House", actions=actions)
+
+
+async def sequential(actuator, scene):
+    start = time.perf_counter()
+    for text in scene.actions:
+        action = parse_action(text)
+        await actuator.execute(action.device, [action])
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--rtt", type=float, default=0.01)
+    args = parser.parse_args(argv)
+
+    scene = all_off(args.devices)
+    print(f"{args.devices} devices, {len(scene.actions)} actions, {args.rtt * 1000:.0f} ms per device")
+    latency = asyncio.run(sequential(FakeActuator(args.rtt), scene))
+    print(f"  one at a time      {latency * 1000:8.1f} ms  ({len(scene.actions)} calls)")
+    for concurrency in (16, 64, 256):
+        actuator = FakeActuator(args.rtt)
+        result = SceneExecutor(actuator, concurrency).run_sync(scene)
+        print(f"  concurrency {concurrency:4}   {result.latency * 1000:8.1f} ms  "
+              f"({len(actuator.calls)} calls, {result.actions} actions)")
+
+
+if __name__ == "__main__":
+    main()
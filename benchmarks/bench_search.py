@@ -0,0 +1,70 @@
+"""
+Type-ahead search latency.
+
+Indexes the devices, locations, rules and scenes of a synthetic estate
+with models.search.PlaceIndex and reports the time to build the index and
+the mean latency of prefix, substring and misspelt queries, as a
+SearchCombobox issues them on every key.
+
+    python -m benchmarks.bench_search [--entities N] [--limit N] [--repeat N]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.suite import best_of
+from benchmarks.synthetic import generate
+from dsl.parser import parse_places
+from models.search import PlaceIndex
+
+# Entities per generated location: the location, 10 devices, 3 rules and 1 scene
+ENTITIES_PER_LOCATION = 15
+
+QUERIES = [
+    ("prefix", "light12"),
+    ("prefix, kind", "room4"),
+    ("substring", "ostat12_"),
+    ("short substring", "ht1"),
+    ("misspelt", "thermostta123"),
+    ("no match", "qqq"),
+]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entities", type=int, default=100_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    place = parse_places(generate(max(1, args.entities // ENTITIES_PER_LOCATION)))[0]
+    index = PlaceIndex(place)
+    print(f"{len(index)} entities, index built in {index_time(place) * 1000:.0f} ms, "
+          f"trigrams on first use in {trigram_time(place) * 1000:.0f} ms")
+
+    index.search("warm up the trigram index")
+    for name, query in QUERIES:
+        kinds = ("location",) if name == "prefix, kind" else None
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            found = index.search(query, kinds, None, args.limit)
+        mean = (time.perf_counter() - start) / args.repeat
+        print(f"  {name:16} {query!r:17} {mean * 1000:7.3f} ms  {len(found):3} results, first {found[0][0] if found else '-'}")
+
+
+def index_time(place):
+    return best_of(PlaceIndex, place, 3)
+
+
+def trigram_time(place):
+    def build(index):
+        index.grams = None
+        index._trigram_index()
+    return best_of(build, PlaceIndex(place), 3)
+
+
+if __name__ == "__main__":
+    main()
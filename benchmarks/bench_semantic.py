@@ -0,0 +1,60 @@
+"""
+Semantic check throughput.
+
+Generates an estate with the requested number of rule and scene actions,
+breaks a few of them (wrong command for the device, missing argument,
+detector that cannot detect the functionality) and reports the time
+dsl.semantic.check_text takes, next to the time it takes to parse the same
+text, and the number of problems found.
+
+    python -m benchmarks.bench_semantic [--actions N] [--repeat N]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.suite import best_of
+from benchmarks.synthetic import generate
+from dsl.parser import parse_places
+from dsl.semantic import check_text
+
+# Actions per generated location: 3 rules with 2 actions each, 1 scene with 2
+ACTIONS_PER_LOCATION = 8
+
+
+def break_some(text, every=1000):
+    """Introduces one error of each kind in every `every` locations."""
+    lines = text.split("\n")
+    for i, line in enumerate(lines):
+        if "set_to_temperature" in line and "AC" in line:
+            room = int(line.split("AC")[1].split("_")[0])
+            if room % every == 0:
+                lines[i] = line.replace("AC", "Light", 1)
+            elif room % every == 1:
+                lines[i] = line.rsplit(" ", 1)[0]
+        elif "detects temperature" in line and int(line.split("Thermostat")[1].split("_")[0]) % every == 2:
+            lines[i] = line.replace("temperature", "movement")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--actions", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    locations = max(1, args.actions // ACTIONS_PER_LOCATION)
+    text = break_some(generate(locations))
+    print(f"{locations * ACTIONS_PER_LOCATION} actions, {locations} locations, {len(text) / 1e6:.1f} MB")
+
+    problems = check_text(text)
+    check = best_of(check_text, text, args.repeat)
+    parse = best_of(parse_places, text, args.repeat)
+    print(f"  check_text   {check * 1000:8.1f} ms  ({len(problems)} problems)")
+    print(f"  parse_places {parse * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Device state store cost.
+
+Builds a DeviceStates of N devices (of every type in turn) and reports the
+memory its columns take next to a dict of states per device, the time of
+single reads, writes and applied actions, and of a bulk snapshot and
+restore.
+
+    python -m benchmarks.bench_state [--devices N] [--repeat N]
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.suite import best_of
+from models.constants import DEVICE_TYPES
+from runtime.engine import Action
+from runtime.state import ATTRIBUTES, DeviceStates
+
+OPERATIONS = 100_000
+
+
+def traced(func):
+    """(result, bytes allocated and still held) of func()."""
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def dict_states(types):
+    # The obvious alternative: a dict of the known states of every device
+    states = []
+    for device_type in types:
+        state = {attribute: False for attribute, (code, _, having) in ATTRIBUTES.items()
+                 if device_type in having and code == "b"}
+        states.append(state)
+    return states
+
+
+def per_op(func, repeat):
+    return best_of(lambda _: func(), None, repeat) / OPERATIONS * 1e9
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--devices", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    types = [DEVICE_TYPES[i % len(DEVICE_TYPES)] for i in range(args.devices)]
+    names = [f"{device_type}{i}" for i, device_type in enumerate(types)]
+    states, columns = traced(lambda: DeviceStates(types))
+    _, baseline = traced(lambda: dict_states(types))
+    named, with_names = traced(lambda: DeviceStates(types, names))
+    print(f"{args.devices} devices")
+    print(f"  columns                {columns / 1e6:8.2f} MB")
+    print(f"  dict per device        {baseline / 1e6:8.2f} MB")
+    print(f"  name index (optional)  {(with_names - columns) / 1e6:8.2f} MB")
+
+    # DEVICE_TYPES[0] is Light, so every len(DEVICE_TYPES)-th device is a light
+    lights = list(range(0, args.devices, len(DEVICE_TYPES)))
+    lights = (lights * (OPERATIONS // len(lights) + 1))[:OPERATIONS]
+    actions = [Action(names[i], "turn_on" if n % 2 else "turn_off", None) for n, i in enumerate(lights)]
+
+    def reads():
+        get = states.get
+        for i in lights:
+            get(i, "on")
+
+    def writes():
+        set_state = states.set
+        for n, i in enumerate(lights):
+            set_state(i, "on", n % 2)
+
+    def applies():
+        apply = named.apply
+        for action in actions:
+            apply(action)
+
+    print(f"  get                    {per_op(reads, args.repeat):8.0f} ns")
+    print(f"  set                    {per_op(writes, args.repeat):8.0f} ns")
+    print(f"  apply(action)          {per_op(applies, args.repeat):8.0f} ns")
+    start = time.perf_counter()
+    data = states.snapshot()
+    snapshot_time = time.perf_counter() - start
+    start = time.perf_counter()
+    states.restore(data)
+    restore_time = time.perf_counter() - start
+    print(f"  snapshot               {snapshot_time * 1000:8.2f} ms  ({len(data) / 1e6:.1f} MB)")
+    print(f"  restore                {restore_time * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
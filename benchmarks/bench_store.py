@@ -0,0 +1,93 @@
+"""
+Worker start-up cost with a shared place store.
+
+Starts worker processes that each load the same estate and dispatch a batch
+of sensor events, once by parsing the .shl file, once from its snapshot and
+once through the memory-mapped PlaceStore, and reports per worker the load
+time, the Python heap it holds afterwards and the dispatch time.
+
+    python -m benchmarks.bench_store [--locations N] [--workers N] [--events N]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.synthetic import generate
+from dsl import snapshot
+from dsl.parser import parse_file
+from runtime.engine import RuleEngine, SensorEvent
+from runtime.store import PlaceStore, StoreRuleEngine, open_store, store_path
+
+
+def load_engine(mode, path):
+    if mode == "parse":
+        return RuleEngine(parse_file(path)[0])
+    if mode == "snapshot":
+        loaded = snapshot.load(path)
+        return RuleEngine(loaded.places[0], loaded.compiled[0])
+    return StoreRuleEngine(PlaceStore(store_path(path)))
+
+
+def run(mode, path, events):
+    start = time.perf_counter()
+    engine = load_engine(mode, path)
+    loaded = time.perf_counter()
+    for event in events:
+        engine.dispatch(event)
+    return engine, loaded - start, time.perf_counter() - loaded
+
+
+def worker(mode, path, events):
+    # Workers are reused across modes: drop the previous mode's Place graph before timing
+    gc.collect()
+    # Timed without tracemalloc, which slows allocations down; the heap is measured on a second run
+    _, load, dispatch = run(mode, path, events)
+    tracemalloc.start()
+    engine = run(mode, path, events)[0]
+    heap = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del engine
+    return load, heap, dispatch
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--locations", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--events", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(42)
+    events = [SensorEvent(f"Thermostat{rng.randrange(args.locations)}_5", "temperature", rng.randrange(15, 30))
+              for _ in range(args.events)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "estate.shl")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(generate(args.locations))
+        snapshot.load(path)
+        open_store(path).close()
+        print(f"{args.locations} locations, {args.workers} workers, {args.events} events each")
+        print(f"  .shl {os.path.getsize(path) / 1e6:.1f} MB, snapshot "
+              f"{os.path.getsize(snapshot.snapshot_path(path)) / 1e6:.1f} MB, "
+              f"store {os.path.getsize(store_path(path)) / 1e6:.1f} MB (mapped, shared)")
+        with ProcessPoolExecutor(args.workers) as pool:
+            for mode in ("parse", "snapshot", "store"):
+                results = list(pool.map(worker, [mode] * args.workers, [path] * args.workers,
+                                        [events] * args.workers))
+                load = sum(r[0] for r in results) / len(results)
+                heap = sum(r[1] for r in results) / len(results)
+                dispatch = sum(r[2] for r in results) / len(results)
+                print(f"  {mode:9} load {load * 1000:8.1f} ms  heap {heap / 1e6:6.1f} MB  "
+                      f"dispatch {dispatch * 1000:6.1f} ms  (per worker)")
+
+
+if __name__ == "__main__":
+    main()
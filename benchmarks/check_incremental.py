@@ -0,0 +1,144 @@
+"""
+Incremental reparse equivalence check.
+
+Applies random edits to a generated estate through dsl.incremental.Document:
+snippets of DSL, stray keywords and comment markers, deleted or reversed
+text, at random positions and around block boundaries. After every edit the
+Document must agree with parse_places() of the resulting text on the places
+(compared as generated DSL text), the unresolved references and the syntax
+error, if any, and its block spans must still be in order and chunked as
+_Blocks promises. Blocks are kept in chunks of --chunk, small by default, so
+that chunks are split and merged often. Exits with status 1 on the first
+mismatch.
+
+    python -m benchmarks.check_incremental [--edits N] [--seed N] [--chunk N] [--locations N]
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.synthetic import generate
+from dsl import incremental
+from dsl.generator import generate_dsl_text
+from dsl.incremental import Document, References
+from dsl.parser import DSLSyntaxError, parse_places
+
+SNIPPETS = [
+    "", " ", "\n", "end", "end\n", "x", '"', "/*", "*/", "/* x */", "// c\n", "Room1", "Light0_0",
+    "location X:\n device Z1: Light\nend\n",
+    "device Q: Lock\n",
+    'rule "r": if Z1 detects light do Light0_0 turn_on end\n',
+    'scene "s" at X: do Z1 turn_on end\n',
+    "do Lock1_4 unlock\n",
+    "place P2:\nend\n",
+]
+
+
+class Mismatch(Exception):
+    pass
+
+
+def spans(doc):
+    return [item for blocks in doc.blocks for chunk in blocks.chunks for item in chunk.items()]
+
+
+def random_edit(doc, rng):
+    """(start, end, replacement), starting near a block boundary half of the time."""
+    n = len(doc.text)
+    items = spans(doc)
+    if items and rng.random() < 0.5:
+        start, end, _ = rng.choice(items)
+        pos = max(0, min(n, rng.choice([start, end, (start + end) // 2]) + rng.randint(-3, 3)))
+    else:
+        pos = rng.randint(0, n)
+    end = min(n, pos + rng.choice([0, 0, 1, 3, 10, 40]))
+    if rng.random() < 0.3:
+        replacement = doc.text[pos:end]
+        if rng.random() < 0.2:
+            replacement = replacement[::-1]
+    else:
+        replacement = rng.choice(SNIPPETS)
+    return pos, end, replacement
+
+
+def unresolved(references):
+    return sorted((obj.name, tuple(names)) for obj, names in references)
+
+
+def check_blocks(doc):
+    chunk_size = incremental._Blocks.CHUNK
+    for blocks in doc.blocks:
+        if len(blocks) != sum(len(chunk.objs) for chunk in blocks.chunks):
+            raise Mismatch("block count differs from the chunks' total")
+        for chunk in blocks.chunks:
+            if not 0 < len(chunk.objs) <= chunk_size:
+                raise Mismatch(f"chunk of {len(chunk.objs)} blocks")
+            if chunk.counts != incremental._count_kinds(chunk.objs):
+                raise Mismatch("stale location/rule/scene counts in a chunk")
+    items = spans(doc)
+    if [start for start, _, _ in items] != sorted(start for start, _, _ in items):
+        raise Mismatch("block spans out of order")
+    for start, end, _ in items:
+        if doc.text[end - 3:end] != "end":
+            raise Mismatch(f"block span does not end at an 'end': {doc.text[start:end]!r}")
+
+
+def check(doc, result):
+    try:
+        expected = parse_places(doc.text)
+    except DSLSyntaxError as e:
+        if result.error is None or str(result.error) != str(e):
+            raise Mismatch(f"expected the error {e}, got {result.error}")
+        return
+    if result.error is not None:
+        raise Mismatch(f"unexpected error {result.error}")
+    if [generate_dsl_text(place) for place in doc.places] != [generate_dsl_text(place) for place in expected]:
+        raise Mismatch("places differ from a full parse")
+    references = [entry for place in expected for entry in References(place).unresolved.values()]
+    if unresolved(doc.unresolved_references()) != unresolved(references):
+        raise Mismatch("unresolved references differ from a full parse")
+    for place in doc.places:
+        if len(place.devices_by_id) != sum(len(location.devices) for location in place.locations):
+            raise Mismatch(f"device index of {place.name} out of date")
+    if len(spans(doc)) != sum(len(p.locations) + len(p.rules) + len(p.scenes) for p in expected):
+        raise Mismatch("block count differs from a full parse")
+    check_blocks(doc)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--edits", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--chunk", type=int, default=4, help="blocks per chunk")
+    parser.add_argument("--locations", type=int, default=6)
+    args = parser.parse_args(argv)
+
+    incremental._Blocks.CHUNK = args.chunk
+    rng = random.Random(args.seed)
+    original = generate(args.locations, devices_per_location=3, rules_per_location=2)
+    doc = Document(original)
+    counts = {"incremental": 0, "full": 0, "error": 0}
+    for step in range(args.edits):
+        result = doc.edit(*random_edit(doc, rng))
+        try:
+            check(doc, result)
+        except Mismatch as e:
+            print(f"edit {step + 1} (seed {args.seed}): {e}", file=sys.stderr)
+            return 1
+        if result.error is not None:
+            counts["error"] += 1
+            # Mostly start again from valid text, so most edits are reparsed incrementally
+            if rng.random() < 0.7:
+                doc = Document(original)
+        else:
+            counts["full" if result.full else "incremental"] += 1
+    print(f"{args.edits} edits matched a full parse: {counts['incremental']} incremental, "
+          f"{counts['full']} full reparses, {counts['error']} syntax errors")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+Benchmark suite for the parser, generator, validators and file round-trips.
+
+Times every case on one synthetic document (benchmarks/synthetic.py) and
+writes the results, with the commit they were taken at, to a JSON file
+(benchmarks/results/<commit>.json by default). --compare reads an earlier
+results file and flags every case that got slower by more than --threshold;
+the exit status is 1 if any did.
+
+    python -m benchmarks.suite [--locations N] [--devices N] [--rules N] [--scenes N]
+                               [--rule-actions N] [--scene-actions N] [--places N]
+                               [--output FILE] [--compare FILE]
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.synthetic import generate
+from dsl import snapshot
+from dsl.generator import generate_document_text
+from dsl.parser import parse_file, parse_places
+from dsl.semantic import check_text
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def best_of(func, arg, repeat):
+    """Fastest of `repeat` calls of func(arg), in seconds, each after a full collection."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                             check=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "")
+
+
+# -----------------------
+# Cases
+# -----------------------
+# Each case takes the generated text and returns {name: (seconds, bytes processed)}
+def bench_parse(text, args):
+    return {"parse_dsl": (best_of(parse_places, text, args.repeat), len(text))}
+
+
+def bench_generate(text, args):
+    places = parse_places(text)
+    return {"generate_dsl_text": (best_of(generate_document_text, places, args.repeat), len(text))}
+
+
+def bench_semantic(text, args):
+    return {"check_semantics": (best_of(check_text, text, args.repeat), len(text))}
+
+
+def bench_textx(text, args):
+    if not args.textx_locations:
+        return {}
+    try:
+        from dsl.metamodel import get_metamodel
+    except ImportError:
+        print("  textX not installed, skipped", file=sys.stderr)
+        return {}
+    # textX slows down superlinearly, so it gets a document of its own
+    small = generate(args.textx_locations, args.devices, args.rules, args.scenes, args.rule_actions,
+                     args.scene_actions)
+    metamodel = get_metamodel()
+    return {"textx_model_from_str": (best_of(metamodel.model_from_str, small, 1), len(small))}
+
+
+def bench_round_trips(text, args):
+    places = parse_places(text)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "estate.shl")
+
+        def save_load_text(places):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(generate_document_text(places))
+            return parse_file(path)
+
+        loaded = snapshot.Snapshot(places, [snapshot.compile_rules(place) for place in places])
+        snap = os.path.join(tmp, "estate.shl.snap")
+
+        def save_load_snapshot(loaded):
+            snapshot.write_snapshot(loaded, snap, bytes(32))
+            return snapshot.read_snapshot(snap)
+
+        return {
+            "save_load_text": (best_of(save_load_text, places, args.repeat), len(text)),
+            "save_load_snapshot": (best_of(save_load_snapshot, loaded, args.repeat), len(text)),
+        }
+
+
+CASES = [bench_parse, bench_generate, bench_semantic, bench_textx, bench_round_trips]
+
+
+# -----------------------
+# Runner
+# -----------------------
+def run(args):
+    text = generate(args.locations, args.devices, args.rules, args.scenes, args.rule_actions, args.scene_actions,
+                    args.places)
+    results = {}
+    for case in CASES:
+        for name, (seconds, size) in case(text, args).items():
+            results[name] = {"seconds": round(seconds, 6), "mb_per_s": round(size / 1e6 / seconds, 3)}
+            print(f"  {name:22} {seconds * 1000:10.1f} ms  {size / 1e6 / seconds:8.2f} MB/s")
+    return {
+        "commit": git_commit(),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "threshold")},
+        "document_bytes": len(text),
+        "results": results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """Prints the change of every case against a baseline report; returns the names of the regressions."""
+    if baseline.get("params") != report["params"]:
+        print("warning: the baseline was run with different parameters", file=sys.stderr)
+    print(f"compared with {baseline.get('commit')} ({baseline.get('date')})")
+    regressions = []
+    for name, result in report["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            continue
+        ratio = result["seconds"] / before["seconds"]
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"  {name:22} {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--locations", type=int, default=2000)
+    parser.add_argument("--devices", type=int, default=10, help="devices per location")
+    parser.add_argument("--rules", type=int, default=3, help="rules per location")
+    parser.add_argument("--scenes", type=int, default=1, help="scenes per location")
+    parser.add_argument("--rule-actions", type=int, default=2, help="actions per rule")
+    parser.add_argument("--scene-actions", type=int, default=2, help="actions per scene")
+    parser.add_argument("--places", type=int, default=1)
+    parser.add_argument("--textx-locations", type=int, default=20,
+                        help="locations of the textX document (0 to skip)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    parser.add_argument("--threshold", type=float, default=1.15,
+                        help="slowdown ratio reported as a regression (default: 1.15)")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
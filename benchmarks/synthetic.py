@@ -0,0 +1,67 @@
+"""
+Synthetic .shl documents for the benchmarks.
+
+generate() builds an estate of numbered rooms. Every room gets the same mix
+of devices (DEVICE_TYPES in turn), rules triggered by its thermostat and
+scenes switching its devices off. The actions only use devices a room has
+once it has at least len(DEVICE_TYPES) devices, so documents of that size
+pass both the grammar and the semantic checks. Names are unique across
+places.
+"""
+from models.constants import DEVICE_TYPES
+
+
+def _rule_actions(i, r):
+    return (
+        f"AC{i}_2 set_to_temperature {18 + r}",
+        f'SmartSpeaker{i}_6 announce "Too hot in Room{i}"',
+        f"Light{i}_0 turn_on",
+        f"Alarm{i}_7 activate",
+        f"Lock{i}_4 lock",
+        f"Camera{i}_3 record",
+    )
+
+
+def _scene_actions(i):
+    return (
+        f"Light{i}_0 turn_off",
+        f"Lock{i}_4 lock",
+        f"AC{i}_2 turn_off",
+        f"Alarm{i}_7 deactivate",
+        f'SmartSpeaker{i}_6 play_music "Jazz"',
+        f"Camera{i}_3 stop",
+    )
+
+
+def generate(locations, devices_per_location=10, rules_per_location=3, scenes_per_location=1,
+             actions_per_rule=2, actions_per_scene=2, places=1):
+    """Returns the text of `places` places of `locations` rooms each."""
+    lines = []
+    for p in range(places):
+        rooms = range(p * locations, (p + 1) * locations)
+        lines.append(f"place Estate{p or ''}:")
+        for i in rooms:
+            lines.append(f"    location Room{i}:")
+            for j in range(devices_per_location):
+                device_type = DEVICE_TYPES[j % len(DEVICE_TYPES)]
+                lines.append(f"        device {device_type}{i}_{j}: {device_type}")
+            lines.append("    end")
+        lines.append("    // Rules")
+        for i in rooms:
+            for r in range(rules_per_location):
+                actions = _rule_actions(i, r)
+                lines.append(f'    rule "Rule{i}_{r}":')
+                lines.append(f"        if Thermostat{i}_5 detects temperature > {20 + r}")
+                for k in range(actions_per_rule):
+                    lines.append(f"            do {actions[k % len(actions)]}")
+                lines.append("    end")
+        lines.append("    // Scenes")
+        for i in rooms:
+            actions = _scene_actions(i)
+            for s in range(scenes_per_location):
+                lines.append(f'    scene "Night{i}_{s}" at Room{i}:')
+                for k in range(actions_per_scene):
+                    lines.append(f"        do {actions[k % len(actions)]}")
+                lines.append("    end")
+        lines.append("end")
+    return "\n".join(lines)
@@ -0,0 +1,92 @@
+"""
+Renders a Place back to DSL text.
+
+The document is made of blocks: the place header, one block per location,
+rule and scene, two comment lines and the closing "end". Every block ends
+with a newline, so a block always covers whole lines. A document with
+several places has a blank line between them.
+"""
+from runtime.instrumentation import timed
+
+RULES_COMMENT = "    // Rules\n"
+SCENES_COMMENT = "    // Scenes\n"
+PLACE_END = "end\n"
+
+
+def render_header(place):
+    return f"place {place.name}:\n"
+
+
+def render_location(location):
+    lines = [f"    location {location.name}:\n"]
+    for dev in getattr(location, "devices", []):
+        lines.append(f"        device {dev.name}: {dev.device_type}\n")
+    lines.append("    end\n")
+    return "".join(lines)
+
+
+def render_rule(rule):
+    lines = [f"    rule {rule.name}:\n", f"        if {rule.condition}\n"]
+    for action in rule.actions:
+        lines.append(f"            do {action}\n")
+    lines.append("    end\n")
+    return "".join(lines)
+
+
+def render_scene(scene):
+    # Scene header with quotes and location
+    lines = [f'    scene "{scene.name}" at {scene.location}:\n']
+    for action in scene.actions:
+        parts = action.split(maxsplit=2)  # e.g., "BedroomSmartSpeaker play_music Metallica"
+        if len(parts) == 3:
+            device, cmd, arg = parts
+            # Add quotes if argument is not a number
+            if not arg.replace('.', '', 1).isdigit() and not (arg.startswith('"') and arg.endswith('"')):
+                arg = f'"{arg.strip()}"'
+            lines.append(f"        do {device} {cmd} {arg}\n")
+        else:
+            lines.append(f"        do {action}\n")
+    lines.append("    end\n")
+    return "".join(lines)
+
+
+def iter_blocks(place, render=None):
+    """
+    Yields the text of every block of the document in order.
+    `render(obj, render_func)` may be passed to serve the location, rule and
+    scene blocks from a cache.
+    """
+    render = render or (lambda obj, func: func(obj))
+    yield render_header(place)
+    for loc in getattr(place, "locations", []):
+        yield render(loc, render_location)
+    yield RULES_COMMENT
+    for rule in getattr(place, "rules", []):
+        yield render(rule, render_rule)
+    yield SCENES_COMMENT
+    for scene in getattr(place, "scenes", []):
+        yield render(scene, render_scene)
+    yield PLACE_END
+
+
+PLACE_SEPARATOR = "\n"
+
+
+def iter_document_blocks(places, render=None):
+    """iter_blocks() of every place in turn, with a separator block between places."""
+    for i, place in enumerate(places):
+        if i:
+            yield PLACE_SEPARATOR
+        yield from iter_blocks(place, render)
+
+
+@timed("generate_dsl_text")
+def generate_dsl_text(place):
+    if not place:
+        return ""
+    return "".join(iter_blocks(place))[:-1]
+
+
+@timed("generate_document_text")
+def generate_document_text(places):
+    return "".join(iter_document_blocks(places))[:-1]
@@ -0,0 +1,419 @@
+"""
+Incremental reparsing of an edited DSL document.
+
+A Document keeps the text, the parsed places and the span of every
+location, rule and scene block. An edit only reparses the stretch of text
+between the unchanged blocks around it and splices the resulting objects
+into the existing Place, so the cost of an edit depends on the size of the
+blocks it touches, not on the size of the file.
+
+Whenever the edited stretch cannot be parsed on its own (the edit reaches a
+place header or its closing 'end', opens a comment or string that runs
+past it, or the document was invalid before) the whole text is parsed
+again, so the result is always the same as parsing the new text from
+scratch.
+"""
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, namedtuple
+
+from dsl.parser import (DSLSyntaxError, END, EOF, LOCATION, PLACE, RULE, SCENE, Parser, TextLocator,
+                        blank_comments, tokenize)
+from models.models import Location, Place, Rule, Scene
+
+
+# `full` is True when the whole text had to be parsed again; `removed` and
+# `added` are then the old and new places, otherwise the replaced blocks'
+# objects. `error` is the DSLSyntaxError of an invalid text, in which case
+# the places are left as they were.
+EditResult = namedtuple("EditResult", ["full", "removed", "added", "error"])
+
+
+class _Resync(Exception):
+    """The edited region cannot be reparsed on its own."""
+
+
+def _parse_children(parser, m):
+    """Parses location, rule and scene blocks; returns [(start, end, obj)] and the token after them."""
+    items = []
+    while True:
+        kind = m.lastgroup
+        start = m.start(kind)
+        if kind == LOCATION:
+            obj, m = parser.parse_location(m)
+        elif kind == RULE:
+            obj, m = parser.parse_rule(m)
+        elif kind == SCENE:
+            obj, m = parser.parse_scene(m)
+        else:
+            return items, m
+        items.append((start, parser.end_token.end(), obj))
+
+
+def _is_word(c):
+    return c.isalnum() or c == "_"
+
+
+def _glued(text, pos):
+    """True if `pos` falls inside a word, so the text on both sides would lex as one token."""
+    return 0 < pos < len(text) and _is_word(text[pos - 1]) and _is_word(text[pos])
+
+
+# -----------------------
+# Cross-references
+# -----------------------
+class References:
+    """
+    Tracks, for one place, which rules and scenes name each device and
+    location, so that after an edit only the rules and scenes whose
+    references may have changed are checked again.
+    """
+
+    def __init__(self, place):
+        self.place = place
+        self.by_device = defaultdict(dict)      # device name -> {id(obj): obj}
+        self.by_location = defaultdict(dict)    # location name -> {id(obj): obj}
+        self.unresolved = {}                    # id(obj) -> (obj, [missing names])
+        for obj in place.rules + place.scenes:
+            self.add(obj)
+
+    @staticmethod
+    def names(obj):
+        """(device names, location name or None) referenced by a rule or scene."""
+        devices = [action.split(maxsplit=1)[0] for action in obj.actions if action.strip()]
+        if isinstance(obj, Rule):
+            if obj.condition.strip():
+                devices.append(obj.condition.split(maxsplit=1)[0])
+            return devices, None
+        return devices, obj.location
+
+    def add(self, obj):
+        devices, location = self.names(obj)
+        for name in devices:
+            self.by_device[name][id(obj)] = obj
+        if location is not None:
+            self.by_location[location][id(obj)] = obj
+        self.check(obj)
+
+    def remove(self, obj):
+        devices, location = self.names(obj)
+        for name in devices:
+            refs = self.by_device.get(name)
+            if refs is not None:
+                refs.pop(id(obj), None)
+                if not refs:
+                    del self.by_device[name]
+        if location is not None:
+            refs = self.by_location.get(location)
+            if refs is not None:
+                refs.pop(id(obj), None)
+                if not refs:
+                    del self.by_location[location]
+        self.unresolved.pop(id(obj), None)
+
+    def check(self, obj):
+        devices, location = self.names(obj)
+        missing = [name for name in dict.fromkeys(devices) if self.place.find_device(name) is None]
+        if location is not None and self.place.find_location(location) is None:
+            missing.append(location)
+        if missing:
+            self.unresolved[id(obj)] = (obj, missing)
+        else:
+            self.unresolved.pop(id(obj), None)
+
+    def recheck(self, device_names, location_names):
+        """Checks again every rule and scene that names one of these devices or locations."""
+        objs = {}
+        for name in device_names:
+            objs.update(self.by_device.get(name, {}))
+        for name in location_names:
+            objs.update(self.by_location.get(name, {}))
+        for obj in objs.values():
+            self.check(obj)
+
+
+# -----------------------
+# Block spans
+# -----------------------
+def _count_kinds(objs):
+    """(locations, rules, scenes) among objs."""
+    locations = rules = 0
+    for obj in objs:
+        if isinstance(obj, Location):
+            locations += 1
+        elif isinstance(obj, Rule):
+            rules += 1
+    return locations, rules, len(objs) - locations - rules
+
+
+class _Chunk:
+    __slots__ = ("base", "starts", "ends", "objs", "counts")
+
+    def __init__(self, items):
+        # Positions are stored relative to `base`, so shifting the chunk is one addition
+        self.base = 0
+        self.starts = [start for start, _, _ in items]
+        self.ends = [end for _, end, _ in items]
+        self.objs = [obj for _, _, obj in items]
+        self.counts = _count_kinds(self.objs)
+
+    def items(self, lo=0, hi=None, delta=0):
+        base = self.base + delta
+        return [(start + base, end + base, obj)
+                for start, end, obj in zip(self.starts[lo:hi], self.ends[lo:hi], self.objs[lo:hi])]
+
+
+class _Blocks:
+    """
+    The (start, end, object) of one place's blocks, in text order, kept in
+    chunks of up to CHUNK blocks. Each chunk has its own position offset
+    and its counts of locations, rules and scenes. Finding a block, counting
+    the blocks of each kind before it, and replacing blocks while shifting
+    the ones after them therefore cost one step per chunk plus the work on
+    the one or two chunks involved, not one step per block.
+    """
+
+    CHUNK = 256
+
+    def __init__(self, items):
+        self.chunks = [_Chunk(items[k:k + self.CHUNK]) for k in range(0, len(items), self.CHUNK)]
+        self.size = len(items)
+
+    def __len__(self):
+        return self.size
+
+    def _find(self, i):
+        """(chunk index, index in it) of block i; block `size` is (number of chunks, 0)."""
+        for c, chunk in enumerate(self.chunks):
+            if i < len(chunk.objs):
+                return c, i
+            i -= len(chunk.objs)
+        return len(self.chunks), 0
+
+    def start(self, i):
+        c, k = self._find(i)
+        return self.chunks[c].starts[k] + self.chunks[c].base
+
+    def end(self, i):
+        c, k = self._find(i)
+        return self.chunks[c].ends[k] + self.chunks[c].base
+
+    def first_ending_at(self, pos):
+        """Index of the first block whose end is >= pos."""
+        index = 0
+        for chunk in self.chunks:
+            if chunk.ends[-1] + chunk.base >= pos:
+                return index + bisect_left(chunk.ends, pos - chunk.base)
+            index += len(chunk.objs)
+        return index
+
+    def first_starting_after(self, pos):
+        """Index of the first block whose start is > pos."""
+        index = 0
+        for chunk in self.chunks:
+            if chunk.starts[-1] + chunk.base > pos:
+                return index + bisect_right(chunk.starts, pos - chunk.base)
+            index += len(chunk.objs)
+        return index
+
+    def objs(self, i, j):
+        c, k = self._find(i)
+        found = []
+        while len(found) < j - i:
+            found.extend(self.chunks[c].objs[k:k + j - i - len(found)])
+            c, k = c + 1, 0
+        return found
+
+    def counts(self, i):
+        """(locations, rules, scenes) among the blocks before block i."""
+        c, k = self._find(i)
+        locations = rules = scenes = 0
+        for chunk in self.chunks[:c]:
+            locations += chunk.counts[0]
+            rules += chunk.counts[1]
+            scenes += chunk.counts[2]
+        if k:
+            partial = _count_kinds(self.chunks[c].objs[:k])
+            locations, rules, scenes = locations + partial[0], rules + partial[1], scenes + partial[2]
+        return locations, rules, scenes
+
+    def replace(self, i, j, items, delta):
+        """Replaces blocks i..j-1 with `items` and shifts the blocks after them by `delta`."""
+        chunks = self.chunks
+        ci, ki = self._find(i)
+        cj, kj = self._find(j)
+        # Chunks ci..last are rebuilt from what they keep around the replaced blocks
+        last = min(cj, len(chunks) - 1)
+        rebuilt = chunks[ci].items(0, ki) if ci < len(chunks) else []
+        rebuilt += items
+        if cj == last:
+            rebuilt += chunks[cj].items(kj, None, delta)
+        # Absorb the next chunk rather than leave a small one behind
+        if len(rebuilt) < self.CHUNK // 2 and last + 1 < len(chunks):
+            last += 1
+            rebuilt += chunks[last].items(0, None, delta)
+        new = [_Chunk(rebuilt[k:k + self.CHUNK]) for k in range(0, len(rebuilt), self.CHUNK)]
+        chunks[ci:last + 1] = new
+        if delta:
+            for chunk in chunks[ci + len(new):]:
+                chunk.base += delta
+        self.size += len(items) - (j - i)
+
+    def shift(self, delta):
+        for chunk in self.chunks:
+            chunk.base += delta
+
+
+def _defined_names(objs):
+    devices, locations = set(), set()
+    for obj in objs:
+        if isinstance(obj, Location):
+            locations.add(obj.name)
+            devices.update(device.name for device in obj.devices)
+    return devices, locations
+
+
+# -----------------------
+# Document
+# -----------------------
+class Document:
+    """
+    A DSL text and its places, kept up to date through edit().
+
+    `blocks[p]` holds the spans of the blocks of place p (see _Blocks), and
+    `bodies[p]` the (start, end) of the text between its header and its
+    closing 'end'.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.places = []
+        self.error = None
+        self._reparse_all()
+
+    @property
+    def place(self):
+        return self.places[0] if self.places else None
+
+    def unresolved_references(self):
+        """(rule or scene, [names]) for every rule and scene naming an undefined device or location."""
+        return [entry for refs in self.references for entry in refs.unresolved.values()]
+
+    # -----------------------------
+    # Editing
+    # -----------------------------
+    def edit(self, start, end, replacement):
+        """Replaces text[start:end] with `replacement` and updates the places. Returns an EditResult."""
+        self.text = self.text[:start] + replacement + self.text[end:]
+        if self.error is None:
+            try:
+                return self._reparse_region(start, end, len(replacement) - (end - start))
+            except _Resync:
+                pass
+        return self._reparse_all()
+
+    def _reparse_all(self):
+        old_places = self.places
+        text = blank_comments(self.text)
+        parser = Parser(tokenize(text).__next__, TextLocator(text))
+        try:
+            self._parse_document(parser)
+        except DSLSyntaxError as e:
+            self.error = e
+            return EditResult(True, old_places, old_places, e)
+        self.error = None
+        return EditResult(True, old_places, self.places, None)
+
+    def _parse_document(self, parser):
+        places, bodies, blocks = [], [], []
+        m = parser.next_token()
+        if m.lastgroup != PLACE:
+            parser.error(m, "'place <name>:'")
+        while m.lastgroup == PLACE:
+            place = Place(m.group("place_name"))
+            body_start = m.end()
+            items, m = _parse_children(parser, parser.next_token())
+            if m.lastgroup != END:
+                parser.error(m, "'location', 'rule', 'scene' or 'end'")
+            bodies.append((body_start, m.start(END)))
+            blocks.append(_Blocks(items))
+            for _, _, obj in items:
+                if isinstance(obj, Location):
+                    place.add_location(obj)
+                elif isinstance(obj, Rule):
+                    place.rules.append(obj)
+                else:
+                    place.scenes.append(obj)
+            places.append(place)
+            m = parser.next_token()
+        if m.lastgroup != EOF:
+            parser.error(m, "'place' or end of file")
+        self.places, self.bodies, self.blocks = places, bodies, blocks
+        self.references = [References(place) for place in places]
+
+    def _reparse_region(self, start, end, delta):
+        # The place whose body strictly contains the edit
+        p = bisect_right(self.bodies, (start, float("inf"))) - 1
+        if p < 0 or not (self.bodies[p][0] <= start and end < self.bodies[p][1]):
+            raise _Resync
+        blocks = self.blocks[p]
+        # Blocks touching the edit, i..j-1, and the untouched boundaries around them
+        i = blocks.first_ending_at(start)
+        j = blocks.first_starting_after(end)
+        region_start = blocks.end(i - 1) if i > 0 else self.bodies[p][0]
+        region_end = (blocks.start(j) if j < len(blocks) else self.bodies[p][1]) + delta
+
+        text = self.text
+        if _glued(text, region_start) or _glued(text, region_end):
+            raise _Resync
+        raw = text[region_start:region_end]
+        # A '//' comment on the region's last line would run on into the next block
+        if "/" in raw[raw.rfind("\n") + 1:]:
+            raise _Resync
+        region = blank_comments(raw)
+        parser = Parser(tokenize(region).__next__, TextLocator(region))
+        try:
+            items, m = _parse_children(parser, parser.next_token())
+        except DSLSyntaxError:
+            raise _Resync from None
+        if m.lastgroup != EOF:
+            raise _Resync
+
+        old = blocks.objs(i, j)
+        new = [obj for _, _, obj in items]
+        self._splice(p, blocks.counts(i), old, new)
+
+        # Block spans: replace the region's, shift everything after it
+        blocks.replace(i, j, [(s + region_start, e + region_start, obj) for s, e, obj in items], delta)
+        self.bodies[p] = (self.bodies[p][0], self.bodies[p][1] + delta)
+        self.bodies[p + 1:] = [(s + delta, e + delta) for s, e in self.bodies[p + 1:]]
+        for later in self.blocks[p + 1:]:
+            later.shift(delta)
+        return EditResult(False, old, new, None)
+
+    def _splice(self, p, before, old, new):
+        """
+        Replaces the objects of blocks `old` of place p with `new` in the
+        Place; `before` counts the (locations, rules, scenes) ahead of them.
+        """
+        place, refs = self.places[p], self.references[p]
+        n_locations, n_rules, n_scenes = before
+
+        for obj in old:
+            if isinstance(obj, Location):
+                place.remove_location(obj)
+            else:
+                refs.remove(obj)
+        new_locations = [obj for obj in new if isinstance(obj, Location)]
+        for offset, location in enumerate(new_locations):
+            place.add_location(location, n_locations + offset)
+        old_rules = sum(isinstance(obj, Rule) for obj in old)
+        old_scenes = sum(isinstance(obj, Scene) for obj in old)
+        place.rules[n_rules:n_rules + old_rules] = [obj for obj in new if isinstance(obj, Rule)]
+        place.scenes[n_scenes:n_scenes + old_scenes] = [obj for obj in new if isinstance(obj, Scene)]
+
+        for obj in new:
+            if not isinstance(obj, Location):
+                refs.add(obj)
+        old_devices, old_locations = _defined_names(old)
+        new_devices, new_locations_names = _defined_names(new)
+        refs.recheck(old_devices | new_devices, old_locations | new_locations_names)
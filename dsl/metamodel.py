@@ -0,0 +1,71 @@
+import os
+import threading
+
+from textx import TextXError, metamodel_from_file
+
+from dsl.semantic import check_text
+from runtime.instrumentation import timed, timer
+
+
+GRAMMAR_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "grammar.tx"))
+
+# -----------------------
+# Metamodel cache
+# -----------------------
+# Compiled metamodels keyed by absolute grammar path. Each entry remembers the
+# (mtime, size) stamp it was built from so an edited grammar is recompiled.
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def get_metamodel(grammar_file=GRAMMAR_FILE):
+    """
+    Returns the compiled textX metamodel for the grammar file, compiling it
+    only the first time (or again when the file changed on disk).
+    """
+    path = os.path.abspath(grammar_file)
+    stamp = _stamp(path)
+
+    with _cache_lock:
+        entry = _cache.get(path)
+        if entry and entry[0] == stamp:
+            return entry[1]
+
+        with timer("metamodel.build"):
+            metamodel = metamodel_from_file(path)
+        _cache[path] = (stamp, metamodel)
+        return metamodel
+
+
+def clear_metamodel_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+@timed("metamodel.parse")
+def validate_dsl(code, grammar_file=GRAMMAR_FILE):
+    """
+    Parses the DSL code with the cached metamodel and returns the textX model.
+    Raises the textX error unchanged if the code is not valid.
+    """
+    return get_metamodel(grammar_file).model_from_str(code)
+
+
+@timed("check_dsl")
+def check_dsl(code, grammar_file=GRAMMAR_FILE):
+    """
+    Validates the DSL code: its syntax against the grammar, then the semantic
+    checks of dsl/semantic.py. Returns a list of (message, line, col), empty
+    if the code is valid: the syntax error, or else every semantic problem.
+    Only plain values are returned, so it can run in a worker process.
+    """
+    try:
+        validate_dsl(code, grammar_file)
+    except TextXError as e:
+        return [(e.message, e.line, e.col)]
+    return [tuple(problem) for problem in check_text(code)]
@@ -0,0 +1,159 @@
+"""
+Loading and validating the places of a document in parallel.
+
+Places never refer to each other, so a document describing several
+buildings can be cut before every 'place' header and each piece handled by
+its own worker process. Pieces are submitted largest first, so with enough
+workers the wall time is set by the largest building rather than by the sum.
+
+Workers send loaded places back in the snapshot encoding (dsl/snapshot.py),
+which the main process decodes faster than it could parse the text itself,
+though not for free: loading only uses a pool where that is estimated to
+beat parsing in this process (worth_a_pool()).
+"""
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from dsl import snapshot
+from dsl.metamodel import GRAMMAR_FILE, check_dsl
+from dsl.parser import PLACE, DSLSyntaxError, blank_comments, parse_places, tokenize
+from dsl.snapshot import Snapshot, compile_rules
+
+# Lines that start a place; a comment or string can contain one too, see split_places()
+re_place_line = re.compile(r"^[ \t]*place\b", re.MULTILINE)
+
+
+def split_places(text, exact=False):
+    """
+    Cuts a document before each place header. Returns (offset, text) pieces
+    that cover the whole document.
+
+    By default a header is any line starting with 'place', which is cheap
+    to find but may also cut inside a comment or string; such a cut leaves
+    both pieces with a syntax error. With `exact` the document is tokenized
+    first and only real place headers are cut at.
+    """
+    if exact:
+        starts = [m.start(PLACE) for m in tokenize(blank_comments(text)) if m.lastgroup == PLACE]
+    else:
+        starts = [m.start() for m in re_place_line.finditer(text)]
+    # Whatever precedes the first header (comments, blank lines) stays with the first piece
+    cuts = [0] + starts[1:] + [len(text)]
+    return [(start, text[start:end]) for start, end in zip(cuts, cuts[1:])]
+
+
+def _map_largest_first(func, pieces, workers=None, pool=None):
+    """
+    Runs func(piece) for every piece in `pool`, or in a pool of `workers`
+    processes started for the call; results come back in piece order.
+    """
+    if pool is None:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pieces))) as pool:
+            return _map_largest_first(func, pieces, pool=pool)
+    order = sorted(range(len(pieces)), key=lambda i: -len(pieces[i]))
+    futures = {i: pool.submit(func, pieces[i]) for i in order}
+    return [futures[i].result() for i in range(len(pieces))]
+
+
+def _default_workers(workers):
+    return workers if workers is not None else os.cpu_count() or 1
+
+
+# -----------------------
+# Loading
+# -----------------------
+# Costs relative to parsing and compiling a piece in this process, measured
+# with benchmarks/bench_parallel.py: a worker takes 1.4 times as long, since
+# it also encodes the snapshot, the main process then decodes it in 0.42
+# times, and starting the pool costs about as much as parsing 100 kB.
+WORKER_COST = 1.4
+DECODE_COST = 0.42
+POOL_START_BYTES = 100_000
+
+
+def worth_a_pool(sizes, workers):
+    """
+    Whether loading pieces of these sizes (in characters) with `workers`
+    processes is estimated to be faster than parsing them in this process.
+    Never with fewer than three workers, nor for a few small places or one
+    that dwarfs the others.
+    """
+    if workers < 2 or len(sizes) < 2:
+        return False
+    total = sum(sizes)
+    wall = WORKER_COST * max(max(sizes), total / min(workers, len(sizes))) + DECODE_COST * total
+    return wall + POOL_START_BYTES < total
+
+
+def _load_piece(text):
+    # None tells the caller the piece does not parse on its own
+    try:
+        places = parse_places(text)
+    except DSLSyntaxError:
+        return None
+    return snapshot.dumps(Snapshot(places, [compile_rules(place) for place in places]))
+
+
+def load_places(text, workers=None):
+    """
+    Parses a document and compiles its rules, one place per worker when
+    worth_a_pool() expects that to pay off, otherwise in this process.
+    Returns a Snapshot. Raises DSLSyntaxError, with the position in the
+    whole text, if the document is invalid.
+    """
+    workers = _default_workers(workers)
+    pieces = [piece for _, piece in split_places(text)]
+    if worth_a_pool([len(piece) for piece in pieces], workers):
+        results = _map_largest_first(_load_piece, pieces, workers)
+        if None not in results:
+            places, compiled = [], []
+            for data in results:
+                loaded = snapshot.loads(data)
+                places.extend(loaded.places)
+                compiled.extend(loaded.compiled)
+            return Snapshot(places, compiled)
+    # Not worth a pool, or a piece that failed: parse serially so errors point into the whole text
+    places = parse_places(text)
+    return Snapshot(places, [compile_rules(place) for place in places])
+
+
+def load_file(path, workers=None):
+    with open(path, "r", encoding="utf-8") as f:
+        return load_places(f.read(), workers)
+
+
+# -----------------------
+# Validation
+# -----------------------
+def _shift_errors(errors, text, offset):
+    # Errors of a piece are relative to its own first line and column
+    lines = text.count("\n", 0, offset)
+    first_col = offset - (text.rfind("\n", 0, offset) + 1)
+    return [(message, line if line is None else line + lines, col if line != 1 else col + first_col)
+            for message, line, col in errors]
+
+
+def validate_places(text, workers=None, grammar_file=GRAMMAR_FILE, pool=None):
+    """
+    check_dsl() for a document, one place per worker. Returns the same list
+    of (message, line, col), with positions in the whole text. Unlike a
+    check of the whole text, names may repeat across places. Places are
+    checked one by one, with the same results, when `workers` is 1; this is
+    the validator of the editor and of validate.py alike. `pool`, a
+    ProcessPoolExecutor, is used instead of starting one for this document.
+    """
+    workers = _default_workers(workers)
+    pieces = split_places(text, exact=True)
+    if len(pieces) == 1:
+        return check_dsl(text, grammar_file)
+    check = partial(check_dsl, grammar_file=grammar_file)
+    if pool is None and workers == 1:
+        results = [check(piece) for _, piece in pieces]
+    else:
+        results = _map_largest_first(check, [piece for _, piece in pieces], workers, pool)
+    errors = []
+    for (offset, _), piece_errors in zip(pieces, results):
+        errors.extend(_shift_errors(piece_errors, text, offset))
+    return errors
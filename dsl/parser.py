@@ -0,0 +1,348 @@
+import re
+import sys
+from bisect import bisect_right
+from functools import partial
+
+from models.models import Device, Location, Place, Rule, Scene
+from runtime.instrumentation import timed
+
+
+class DSLSyntaxError(Exception):
+    def __init__(self, message, line=None, col=None):
+        self.message = message
+        self.line = line
+        self.col = col
+        where = f"{line}:{col}: " if line is not None else ""
+        super().__init__(f"{where}{message}")
+
+
+# -----------------------
+# Lexer
+# -----------------------
+# Comments are first blanked out (same length, newlines kept, so offsets and
+# line numbers are unchanged and "//" inside strings survives). The lexer then
+# makes a single pass over the text with one master pattern whose tokens are
+# whole statements ("device K1: Light", "do Speaker announce 'hi'", "end").
+
+# Group 1 is a maximal run of non-comment text (strings included), so the
+# substitution callback only runs around actual comments. Its alternatives
+# start with different characters, so the quantifiers are possessive: the
+# regex engine then keeps no backtracking state for every repetition, which
+# took 16 times the text's size in memory for a long run. Possessive
+# quantifiers need Python 3.11.
+re_comment = re.compile(r"""((?:[^"'/]++|"(?:[^"\\]|\\.)*+"|'(?:[^'\\]|\\.)*+'|/(?![/*]))++)|//[^\n]*|/\*.*?\*/""",
+                        re.DOTALL)
+re_not_newline = re.compile(r"[^\n]")
+
+
+def _blank_comment(m):
+    if m.group(1) is not None:
+        return m.group(1)
+    return re_not_newline.sub(" ", m.group())
+
+
+def blank_comments(text):
+    """Replaces every comment with spaces, keeping newlines and string contents."""
+    if "/" not in text:
+        return text
+    return re_comment.sub(_blank_comment, text)
+
+
+ID = r"[^\W\d]\w*"
+STRING = r"""(?:"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')"""
+INT = r"[-+]?\d+"
+DEVICE_TYPE = r"(?:AC|Alarm|Camera|Light|Lock|Sensor|SmartSpeaker|Thermostat)\b"
+FUNCTIONALITY = r"(?:temperature|movement|noise|light)\b"
+COMMAND = (r"(?:turn_on|turn_off|lock|unlock|set_to_temperature|play_music|announce"
+           r"|activate|deactivate|record|stop|send_alert)\b")
+
+PLACE, LOCATION, DEVICE, RULE, SCENE, IF, DO, END, EOF, ERROR = (
+    "PLACE", "LOCATION", "DEVICE", "RULE", "SCENE", "IF", "DO", "END", "EOF", "ERROR",
+)
+
+# Alternatives are ordered by how often they occur in real files
+re_statement = re.compile(rf"""
+    \s*
+    (?:
+        (?P<DEVICE>device\b\s*(?P<device_name>{ID})\s*:\s*(?P<device_type>{DEVICE_TYPE}))
+      | (?P<DO>do\b\s*(?P<do_device>{ID})\s*(?P<do_command>{COMMAND})(?:\s*(?P<do_value>{INT}|{STRING}))?)
+      | (?P<END>end\b)
+      | (?P<IF>if\b\s*(?P<if_device>{ID})\s*detects\b\s*(?P<if_functionality>{FUNCTIONALITY})
+                (?:\s*(?P<if_op>[<>=]))?(?:\s*(?P<if_value>{INT}))?)
+      | (?P<RULE>rule\b\s*(?P<rule_name>{STRING})\s*:)
+      | (?P<LOCATION>location\b\s*(?P<location_name>{ID})\s*:)
+      | (?P<SCENE>scene\b\s*(?P<scene_name>{STRING})\s*at\b\s*(?P<scene_location>{ID})\s*:)
+      | (?P<PLACE>place\b\s*(?P<place_name>{ID})\s*:)
+      | (?P<EOF>\Z)
+      | (?P<ERROR>)
+    )
+""", re.VERBOSE)
+
+
+def tokenize(text, pos=0):
+    """
+    Returns an iterator of statement matches over comment-free text (see
+    blank_comments), from `pos` up to an EOF match. An ERROR match marks text
+    that does not start a valid statement; nothing useful follows it.
+    """
+    return re_statement.finditer(text, pos)
+
+
+class TextLocator:
+    """Turns a text offset into a 1-based (line, col), indexing newlines only when needed."""
+
+    def __init__(self, text):
+        self.text = text
+        self.newlines = None
+
+    def __call__(self, pos):
+        if self.newlines is None:
+            self.newlines = [m.start() for m in re.finditer("\n", self.text)]
+        line = bisect_right(self.newlines, pos - 1)
+        line_start = self.newlines[line - 1] + 1 if line else 0
+        return line + 1, pos - line_start + 1
+
+
+CHUNK_SIZE = 1 << 20
+
+
+class StatementStream:
+    """
+    Statement tokens over text that arrives in chunks (e.g. successive
+    f.read() calls), for files too large to hold in memory.
+
+    Only the text up to the last newline received is tokenized, and a token
+    is handed out once the token after it has matched too, so a statement
+    split across chunks (or a trailing "do ... <value>" whose value is still
+    to come) is matched again when more text arrives. Consumed text is
+    dropped on every refill.
+    """
+
+    def __init__(self, chunks, max_statement=CHUNK_SIZE):
+        self.chunks = iter(chunks)
+        # An ERROR this far from the end of the window is not a partial statement
+        self.max_statement = max_statement
+        self.raw = ""       # unconsumed source text
+        self.text = ""      # blanked raw[:cut], what the statements are matched on
+        self.pos = 0
+        self.ahead = None   # already matched token at self.pos
+        self.at_eof = False
+        self.line = 1       # position of raw[0] in the file
+        self.col = 1
+
+    def next_token(self):
+        match = re_statement.match
+        while True:
+            m = self.ahead or match(self.text, self.pos)
+            self.ahead = None
+            if self.at_eof:
+                self.pos = m.end()
+                return m
+            kind = m.lastgroup
+            if kind != EOF and kind != ERROR:
+                ahead = match(self.text, m.end())
+                if ahead.lastgroup != EOF and ahead.lastgroup != ERROR:
+                    self.ahead = ahead
+                    self.pos = m.end()
+                    return m
+            elif kind == ERROR and len(self.text) - m.start(kind) > self.max_statement:
+                return m
+            self._fill()
+
+    def _fill(self):
+        consumed = self.raw[:self.pos]
+        newlines = consumed.count("\n")
+        if newlines:
+            self.line += newlines
+            self.col = self.pos - consumed.rfind("\n")
+        else:
+            self.col += self.pos
+        raw = self.raw[self.pos:]
+        while True:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.at_eof = True
+                cut = len(raw)
+                break
+            raw += chunk
+            cut = raw.rfind("\n")
+            if cut >= 0:
+                break
+        self.raw = raw
+        self.text = blank_comments(raw[:cut])
+        self.pos = 0
+        self.ahead = None
+
+    def locate(self, pos):
+        newlines = self.text.count("\n", 0, pos)
+        if newlines:
+            return self.line + newlines, pos - self.text.rfind("\n", 0, pos)
+        return self.line, self.col + pos
+
+
+# -----------------------
+# Parser
+# -----------------------
+class Parser:
+    """
+    Recursive-descent parser for grammar.tx over the statement tokens. Builds
+    the Place, Location, Device, Rule and Scene objects directly.
+
+    Tokens come from `next_token()`, either a tokenize() iterator over a whole
+    text (Parser.from_text) or a StatementStream reading a file in chunks.
+
+    Each parse_* method receives the match of the statement that opens its
+    block and returns the built object together with the next token; the
+    block's closing 'end' is left in `end_token`.
+    Only syntax is checked here; device and location references are kept as
+    plain names, as in the rest of the editor.
+    """
+
+    def __init__(self, next_token, locate):
+        self.next_token = next_token
+        self.locate = locate
+        self.end_token = None
+
+    @classmethod
+    def from_text(cls, text, pos=0):
+        text = blank_comments(text)
+        return cls(tokenize(text, pos).__next__, TextLocator(text))
+
+    def error(self, m, expected):
+        kind = m.lastgroup
+        pos = m.start(kind)
+        if kind == EOF:
+            found = "end of file"
+        else:
+            found = repr(m.string[pos:pos + 20].split("\n")[0])
+        raise DSLSyntaxError(f"Expected {expected} but found {found}", *self.locate(pos))
+
+    # -----------------------------
+    # Grammar rules
+    # -----------------------------
+    def iter_model(self):
+        """
+        Yields each Place as soon as its header is read, followed by its
+        Location, Rule and Scene objects as each block is completed. The
+        yielded children are not attached to the Place.
+        """
+        m = self.next_token()
+        if m.lastgroup != PLACE:
+            self.error(m, "'place <name>:'")
+        while m.lastgroup == PLACE:
+            m = yield from self.iter_place(m)
+        if m.lastgroup != EOF:
+            self.error(m, "'place' or end of file")
+
+    def iter_place(self, m):
+        yield Place(m.group("place_name"))
+        m = self.next_token()
+        while True:
+            kind = m.lastgroup
+            if kind == LOCATION:
+                location, m = self.parse_location(m)
+                yield location
+            elif kind == RULE:
+                rule, m = self.parse_rule(m)
+                yield rule
+            elif kind == SCENE:
+                scene, m = self.parse_scene(m)
+                yield scene
+            elif kind == END:
+                return self.next_token()
+            else:
+                self.error(m, "'location', 'rule', 'scene' or 'end'")
+
+    def parse_location(self, m):
+        location = Location(name=m.group("location_name"))
+        devices = location.devices
+        next_token = self.next_token
+        m = next_token()
+        while m.lastgroup == DEVICE:
+            name, device_type = m.group("device_name", "device_type")
+            devices.append(Device(name=name, device_type=device_type, location=location))
+            m = next_token()
+        if m.lastgroup != END:
+            self.error(m, "'device' or 'end'")
+        self.end_token = m
+        return location, self.next_token()
+
+    def parse_rule(self, m):
+        rule = Rule(name=m.group("rule_name"))
+        m = self.next_token()
+        if m.lastgroup != IF:
+            self.error(m, "'if <device> detects <functionality>'")
+        device, functionality, op, value = m.group("if_device", "if_functionality", "if_op", "if_value")
+        rule.condition = " ".join(filter(None, (device, "detects", functionality, op, value)))
+        rule.actions, m = self.parse_actions(self.next_token())
+        return rule, m
+
+    def parse_scene(self, m):
+        scene = Scene(name=m.group("scene_name")[1:-1], location=m.group("scene_location"))
+        scene.actions, m = self.parse_actions(self.next_token())
+        return scene, m
+
+    def parse_actions(self, m):
+        """Parses one or more 'do' statements and the closing 'end'."""
+        if m.lastgroup != DO:
+            self.error(m, "'do <device> <command>'")
+        actions = []
+        next_token, intern = self.next_token, sys.intern
+        while m.lastgroup == DO:
+            device, command, value = m.group("do_device", "do_command", "do_value")
+            # Rules and scenes repeat the same actions, which then share one string
+            actions.append(intern(f"{device} {command} {value}" if value else f"{device} {command}"))
+            m = next_token()
+        if m.lastgroup != END:
+            self.error(m, "'do' or 'end'")
+        self.end_token = m
+        return actions, next_token()
+
+
+# -----------------------
+# Entry points
+# -----------------------
+def build_places(items):
+    """Attaches the children yielded by Parser.iter_model() to their Place."""
+    places = []
+    place = None
+    for item in items:
+        if isinstance(item, Place):
+            place = item
+            places.append(place)
+        elif isinstance(item, Location):
+            place.add_location(item)
+        elif isinstance(item, Rule):
+            place.rules.append(item)
+        else:
+            place.scenes.append(item)
+    return places
+
+
+@timed("parse_places")
+def parse_places(text):
+    """Parses a whole DSL document and returns the list of its places."""
+    return build_places(Parser.from_text(text).iter_model())
+
+
+@timed("parse_dsl")
+def parse_dsl(text):
+    """Parses a DSL document and returns its first Place."""
+    return parse_places(text)[0]
+
+
+def iter_file(filename, chunk_size=CHUNK_SIZE):
+    """
+    Parses a DSL file while reading it, yielding each Place followed by its
+    Location, Rule and Scene objects as they complete (see
+    Parser.iter_model). Only about one chunk of the file is held in memory.
+    """
+    with open(filename, "r", encoding="utf-8") as f:
+        stream = StatementStream(iter(partial(f.read, chunk_size), ""))
+        yield from Parser(stream.next_token, stream.locate).iter_model()
+
+
+@timed("parse_file")
+def parse_file(filename, chunk_size=CHUNK_SIZE):
+    """Parses a DSL file incrementally and returns the list of its places."""
+    return build_places(iter_file(filename, chunk_size))
@@ -0,0 +1,130 @@
+"""
+Semantic checks the grammar cannot express.
+
+grammar.tx accepts any command on any device and any functionality on any
+detector; this pass enforces models/constants.py on top of it:
+
+- a condition's device must be a detector able to detect that functionality
+  (DETECTOR_FUNCTIONALITIES, e.g. only thermostats detect temperature),
+- an action's command must be one of its device's DEVICE_FUNCTIONALITIES,
+- commands in ACTIONS_WITH_ARGS need an argument of the given kind, the
+  others take none,
+- devices and scene locations must be defined in the same place.
+
+The lookup tables are built once at import; check_text() then makes one pass
+over the statements and reports every problem with its line and column.
+"""
+from collections import namedtuple
+
+from dsl.parser import (DEVICE, DO, EOF, ERROR, IF, LOCATION, PLACE, SCENE, TextLocator, blank_comments,
+                        tokenize)
+from models.constants import ACTIONS_WITH_ARGS, DETECTOR_FUNCTIONALITIES, DEVICE_FUNCTIONALITIES, SENSOR_EVENTS
+from runtime.instrumentation import timed
+
+# Same shape as dsl.metamodel.check_dsl's errors
+Problem = namedtuple("Problem", ["message", "line", "col"])
+
+
+# -----------------------
+# Lookup tables
+# -----------------------
+def _detectable(functionalities):
+    # "detects" covers the sensor events, "detects_<x>" just <x>
+    detectable = set()
+    for functionality in functionalities:
+        if functionality == "detects":
+            detectable.update(SENSOR_EVENTS)
+        elif functionality.startswith("detects_"):
+            detectable.add(functionality[len("detects_"):])
+    return frozenset(detectable)
+
+
+# device type -> functionalities it can detect
+DETECTS = {device_type: _detectable(functionalities)
+           for device_type, functionalities in DETECTOR_FUNCTIONALITIES.items()}
+
+# device type -> commands it accepts
+COMMANDS = {device_type: frozenset(f for f in functionalities if not f.startswith("detects"))
+            for device_type, functionalities in DEVICE_FUNCTIONALITIES.items()}
+
+# command -> kind of its argument ("int" or "str"); commands not listed take none
+ARG_KINDS = dict(ACTIONS_WITH_ARGS)
+
+
+def _value_kind(value):
+    if value is None:
+        return None
+    return "str" if value[0] in "\"'" else "int"
+
+
+# -----------------------
+# Checking
+# -----------------------
+def _check_uses(uses, devices, locations, report):
+    """Checks the conditions, actions and scene headers of one place against its definitions."""
+    detects, commands, arg_kinds = DETECTS, COMMANDS, ARG_KINDS
+    for pos, kind, name, what, value in uses:
+        if kind == SCENE:
+            if name not in locations:
+                report(pos, f"Unknown location '{name}'")
+            continue
+        device_type = devices.get(name)
+        if device_type is None:
+            report(pos, f"Unknown device '{name}'")
+        elif kind == IF:
+            detectable = detects.get(device_type)
+            if detectable is None:
+                report(pos, f"{name} is a {device_type}, which cannot detect anything")
+            elif what not in detectable:
+                report(pos, f"{name} is a {device_type}, which cannot detect {what}")
+        else:
+            if what not in commands.get(device_type, ()):
+                report(pos, f"{name} is a {device_type}, which does not support {what}")
+            expected = arg_kinds.get(what)
+            found = _value_kind(value)
+            if expected != found:
+                if expected is None:
+                    report(pos, f"{what} takes no argument")
+                else:
+                    report(pos, f"{what} needs a{'n' if expected == 'int' else ''} {expected} argument")
+
+
+@timed("check_semantics")
+def check_text(text):
+    """
+    Returns every semantic Problem of a DSL text, in order of position.
+    Syntax errors are left to the parser: checking stops at the first one.
+    """
+    text = blank_comments(text)
+    locate = TextLocator(text)
+    problems = []
+
+    def report(pos, message):
+        problems.append((pos, message))
+
+    devices, locations, uses = {}, set(), []
+    append = uses.append
+    for m in tokenize(text):
+        kind = m.lastgroup
+        if kind == DO:
+            append((m.start("do_device"), DO) + m.group("do_device", "do_command", "do_value"))
+        elif kind == DEVICE:
+            name, device_type = m.group("device_name", "device_type")
+            devices.setdefault(name, device_type)
+        elif kind == IF:
+            append((m.start("if_device"), IF) + m.group("if_device", "if_functionality") + (None,))
+        elif kind == LOCATION:
+            locations.add(m.group("location_name"))
+        elif kind == SCENE:
+            append((m.start("scene_location"), SCENE, m.group("scene_location"), None, None))
+        elif kind == PLACE:
+            # Definitions are scoped to their place; references may come before them
+            _check_uses(uses, devices, locations, report)
+            devices, locations, uses = {}, set(), []
+            append = uses.append
+        elif kind == EOF or kind == ERROR:
+            break
+    _check_uses(uses, devices, locations, report)
+
+    problems.sort(key=lambda problem: problem[0])
+    return [Problem(message, *locate(pos)) for pos, message in problems]
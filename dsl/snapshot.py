@@ -0,0 +1,273 @@
+"""
+Binary snapshots of parsed .shl files.
+
+A snapshot holds the places of a .shl file together with their compiled
+rules, so opening a large configuration skips both parsing and rule
+compilation. It is written next to the source as "<file>.shl.snap" and is
+only used while the SHA-256 of the source still matches the one it records.
+
+Layout (little-endian):
+
+    header    magic, version, source SHA-256, string count, blob size, int count
+    offsets   uint32[string count + 1], character offsets into the decoded blob
+    blob      every distinct string, concatenated, UTF-8
+    ints      int32[int count], the places as a flat record stream (see _encode)
+
+Object ids are not stored; loaded objects get fresh ones.
+"""
+import hashlib
+import os
+import struct
+import sys
+from array import array
+from collections import namedtuple
+
+from dsl.parser import parse_file
+from models.models import Device, Location, Place, Rule, Scene
+from runtime.conditions import Condition
+from runtime.engine import Action, CompiledRule
+from runtime.instrumentation import timed
+
+MAGIC = b"SHLSNAP\0"
+VERSION = 1
+SUFFIX = ".snap"
+
+HEADER = struct.Struct("<8sH32sIII")
+OPS = (None, ">", "<", "=")
+# Value kinds for condition and action values
+NONE, INT, STR, BIG_INT = range(4)
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+class SnapshotError(Exception):
+    pass
+
+
+# The places of a file and, for each place, the CompiledRule of every rule
+# (or the Rule itself when it could not be compiled), as RuleEngine accepts.
+Snapshot = namedtuple("Snapshot", ["places", "compiled"])
+
+
+def snapshot_path(source):
+    return source + SUFFIX
+
+
+def hash_file(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.digest()
+
+
+def compile_rules(place):
+    compiled = []
+    for rule in place.rules:
+        try:
+            compiled.append(CompiledRule(rule))
+        except ValueError:
+            compiled.append(rule)
+    return compiled
+
+
+# -----------------------
+# Encoding
+# -----------------------
+class _Strings:
+    def __init__(self):
+        self.index = {}
+        self.strings = []
+
+    def __call__(self, s):
+        i = self.index.get(s)
+        if i is None:
+            i = self.index[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+
+def _encode_value(value, ints, strings):
+    if value is None:
+        ints.extend((NONE, 0))
+    elif isinstance(value, int):
+        if INT32_MIN <= value <= INT32_MAX:
+            ints.extend((INT, value))
+        else:
+            ints.extend((BIG_INT, strings(str(value))))
+    else:
+        ints.extend((STR, strings(value)))
+
+
+def _encode(snapshot, ints, strings):
+    ints.append(len(snapshot.places))
+    for place, compiled in zip(snapshot.places, snapshot.compiled):
+        ints.extend((strings(place.name), len(place.locations), len(place.rules), len(place.scenes)))
+        for location in place.locations:
+            ints.extend((strings(location.name), len(location.devices)))
+            for device in location.devices:
+                ints.extend((strings(device.name), strings(device.device_type)))
+        for rule, item in zip(place.rules, compiled):
+            ints.extend((strings(rule.name), strings(rule.condition), len(rule.actions)))
+            ints.extend(map(strings, rule.actions))
+            if not isinstance(item, CompiledRule):
+                ints.append(0)
+                continue
+            condition = item.condition
+            ints.extend((1, strings(condition.device), strings(condition.functionality), OPS.index(condition.op)))
+            _encode_value(condition.value, ints, strings)
+            for action in item.actions:
+                ints.extend((strings(action.device), strings(action.command)))
+                _encode_value(action.value, ints, strings)
+        for scene in place.scenes:
+            ints.extend((strings(scene.name), strings(scene.location), len(scene.actions)))
+            ints.extend(map(strings, scene.actions))
+
+
+def dumps(snapshot, source_hash=bytes(32)):
+    """Encodes a Snapshot in the snapshot file format."""
+    strings = _Strings()
+    ints = array("i")
+    _encode(snapshot, ints, strings)
+    offsets = array("I", [0])
+    total = 0
+    for s in strings.strings:
+        total += len(s)
+        offsets.append(total)
+    blob = "".join(strings.strings).encode("utf-8")
+    if sys.byteorder != "little":
+        offsets.byteswap()
+        ints.byteswap()
+    header = HEADER.pack(MAGIC, VERSION, source_hash, len(strings.strings), len(blob), len(ints))
+    return b"".join((header, offsets.tobytes(), blob, ints.tobytes()))
+
+
+def write_snapshot(snapshot, path, source_hash):
+    data = dumps(snapshot, source_hash)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+# -----------------------
+# Decoding
+# -----------------------
+def _unpack(data):
+    if len(data) < HEADER.size:
+        raise SnapshotError("Truncated snapshot")
+    magic, version, source_hash, n_strings, blob_size, n_ints = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise SnapshotError("Not a snapshot or unsupported version")
+    pos = HEADER.size
+    end = pos + 4 * (n_strings + 1) + blob_size + 4 * n_ints
+    if len(data) != end:
+        raise SnapshotError("Truncated snapshot")
+    offsets = array("I")
+    offsets.frombytes(data[pos:pos + 4 * (n_strings + 1)])
+    pos += 4 * (n_strings + 1)
+    text = data[pos:pos + blob_size].decode("utf-8")
+    pos += blob_size
+    ints = array("i")
+    ints.frombytes(data[pos:end])
+    if sys.byteorder != "little":
+        offsets.byteswap()
+        ints.byteswap()
+    strings = [text[offsets[i]:offsets[i + 1]] for i in range(n_strings)]
+    return source_hash, strings, ints
+
+
+def _decode(strings, ints):
+    next_int = iter(ints).__next__
+    intern = sys.intern
+
+    def value():
+        kind, payload = next_int(), next_int()
+        if kind == INT:
+            return payload
+        if kind == STR:
+            return strings[payload]
+        if kind == BIG_INT:
+            return int(strings[payload])
+        return None
+
+    places, compiled = [], []
+    for _ in range(next_int()):
+        place = Place(strings[next_int()])
+        n_locations, n_rules, n_scenes = next_int(), next_int(), next_int()
+        for _ in range(n_locations):
+            location = Location(name=strings[next_int()])
+            location.devices = [Device(name=strings[next_int()], device_type=strings[next_int()], location=location)
+                                for _ in range(next_int())]
+            place.add_location(location)
+        rules = []
+        for _ in range(n_rules):
+            rule = Rule(name=strings[next_int()], condition=strings[next_int()])
+            rule.actions = [strings[next_int()] for _ in range(next_int())]
+            place.rules.append(rule)
+            if not next_int():
+                rules.append(rule)
+                continue
+            condition = Condition(strings[next_int()], strings[next_int()], OPS[next_int()], value())
+            actions = [Action(strings[next_int()], intern(strings[next_int()]), value()) for _ in rule.actions]
+            rules.append(CompiledRule(rule, condition, actions))
+        for _ in range(n_scenes):
+            scene = Scene(name=strings[next_int()], location=strings[next_int()])
+            scene.actions = [strings[next_int()] for _ in range(next_int())]
+            place.scenes.append(scene)
+        places.append(place)
+        compiled.append(rules)
+    return Snapshot(places, compiled)
+
+
+def loads(data, source_hash=None):
+    """
+    Decodes a snapshot. Returns None if `source_hash` is given and differs from
+    the one recorded; raises SnapshotError if the data is not a valid snapshot.
+    """
+    recorded_hash, strings, ints = _unpack(data)
+    if source_hash is not None and recorded_hash != source_hash:
+        return None
+    try:
+        return _decode(strings, ints)
+    except (IndexError, StopIteration) as e:
+        raise SnapshotError(f"Corrupt snapshot: {e}") from None
+
+
+def read_snapshot(path, source_hash=None):
+    """Reads a snapshot file, see loads()."""
+    with open(path, "rb") as f:
+        return loads(f.read(), source_hash)
+
+
+# -----------------------
+# Entry points
+# -----------------------
+@timed("snapshot.load")
+def load(source, parse=None):
+    """
+    Returns the Snapshot of a .shl file: from its snapshot file when that is
+    up to date, otherwise by parsing it (and then writing a fresh snapshot).
+    `parse(source)` returns the Snapshot of the file; by default it is parsed
+    with parse_file and its rules compiled here.
+    """
+    source_hash = hash_file(source)
+    try:
+        snapshot = read_snapshot(snapshot_path(source), source_hash)
+    except (OSError, SnapshotError):
+        snapshot = None
+    if snapshot is None:
+        if parse is None:
+            places = parse_file(source)
+            snapshot = Snapshot(places, [compile_rules(p) for p in places])
+        else:
+            snapshot = parse(source)
+        try:
+            write_snapshot(snapshot, snapshot_path(source), source_hash)
+        except OSError:
+            pass
+    return snapshot
@@ -1,17 +1,34 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, filedialog
 from models.models import *
-from textx import metamodel_from_file
-from models.constants import SENSOR_EVENTS, DEVICE_TYPES, DEVICE_FUNCTIONALITIES, DEVICE_CATEGORIES, ACTIONS_WITH_ARGS, DETECTOR_FUNCTIONALITIES
+from models.history import (History, AddPlace, AddLocation, RemoveLocation, AddDevice, RemoveDevice, EditDevice,
+                             AddRule, AddScene)
+from models.search import PlaceIndex
+from dsl.metamodel import GRAMMAR_FILE
+from dsl import parallel, snapshot
+from gui.device_list import DeviceTable, VirtualList
+from gui.preview import DSLPreview
+from gui.saving import BackgroundSaver
+from gui.search_box import SearchCombobox
+from gui.validation import BackgroundValidator
+from runtime.analysis import analyze
+from runtime.engine import CompiledRule, RuleEngine
+from runtime.instrumentation import timed
+from models.constants import SENSOR_EVENTS, DEVICE_TYPES, DEVICE_FUNCTIONALITIES, DEVICE_CATEGORIES, ACTIONS_WITH_ARGS
 import os
-import re
 
 class SmartHomeApp(tk.Tk):
     def __init__(self):
         super().__init__()
 
-        self.place = None
+        self.places = []    # every place of the open file
+        self.place = None   # the place being edited
         self.place_file = None
+        self.engines = []
+        self.compiled_rules = {}   # rule id -> CompiledRule loaded with the file, see rules_to_run()
+        self.history = History()   # undo/redo of the edits made in the editor
+        self.search_index = None   # PlaceIndex of self.place, see get_search_index()
+        self.device_table = None   # DeviceTable of self.place, see get_device_table()
 
         # Window setup
         self.title("SmartHome DSL Editor")
@@ -29,6 +46,10 @@ class SmartHomeApp(tk.Tk):
         self.create_left_panel()
         self.create_right_panel()
 
+        self.bind("<Control-z>", lambda event: self.undo())
+        self.bind("<Control-y>", lambda event: self.redo())
+        self.bind("<Control-Shift-Z>", lambda event: self.redo())
+
         # Initial prompt
         self.prompt_place_setup()
 
@@ -75,8 +96,24 @@ class SmartHomeApp(tk.Tk):
             anchor="w", pady=(0, 10)
         )
 
+        # Places (a file may describe several buildings)
+        ttk.Label(frame, text="Place", font=("Arial", 12, "bold"), style="Main.TLabel").pack(anchor="w")
+        self.place_selector = ttk.Combobox(frame, state="readonly")
+        self.place_selector.pack(fill="x", pady=5)
+        self.place_selector.bind("<<ComboboxSelected>>", self.on_place_selected)
+        self.btn_add_place = ttk.Button(frame, text="Add Place", command=self.add_place)
+        self.btn_add_place.pack(fill="x", pady=2)
+
+        history_frame = ttk.Frame(frame, style="Main.TFrame")
+        history_frame.pack(fill="x", pady=2)
+        history_frame.columnconfigure((0, 1), weight=1)
+        self.btn_undo = ttk.Button(history_frame, text="Undo", command=self.undo)
+        self.btn_redo = ttk.Button(history_frame, text="Redo", command=self.redo)
+        self.btn_undo.grid(row=0, column=0, sticky="ew", padx=(0, 1))
+        self.btn_redo.grid(row=0, column=1, sticky="ew", padx=(1, 0))
+
         # Locations
-        ttk.Label(frame, text="Locations", font=("Arial", 12, "bold"), style="Main.TLabel").pack(anchor="w")
+        ttk.Label(frame, text="Locations", font=("Arial", 12, "bold"), style="Main.TLabel").pack(anchor="w", pady=(10, 0))
         self.location_list = tk.Listbox(frame, height=10)
         self.location_list.pack(fill="x", pady=5)
 
@@ -100,6 +137,8 @@ class SmartHomeApp(tk.Tk):
         self.btn_add_scene = ttk.Button(frame, text="Add Scene", command=self.add_scene)
         self.btn_add_rule.pack(fill="x", pady=2)
         self.btn_add_scene.pack(fill="x", pady=2)
+        self.btn_analyze_rules = ttk.Button(frame, text="Check Rule Conflicts", command=self.show_rule_analysis)
+        self.btn_analyze_rules.pack(fill="x", pady=2)
 
         # File actions
         ttk.Separator(frame).pack(fill="x", pady=8)
@@ -112,6 +151,11 @@ class SmartHomeApp(tk.Tk):
         self.btn_save.pack(fill="x", pady=2)
         self.btn_save_as.pack(fill="x", pady=2)
         self.btn_open.pack(fill="x", pady=2)
+        # Saves a couple of seconds after the last edit, in the background
+        self.autosave = tk.BooleanVar(self, value=False)
+        self.btn_autosave = ttk.Checkbutton(frame, text="Autosave", variable=self.autosave,
+                                            command=self.on_autosave_toggled)
+        self.btn_autosave.pack(anchor="w", pady=2)
 
         ttk.Separator(frame).pack(fill="x", pady=8)
         self.btn_validate = ttk.Button(frame, text="Validate and Start SmartHome", command=self.validate_and_run)
@@ -128,11 +172,29 @@ class SmartHomeApp(tk.Tk):
         frame.columnconfigure(0, weight=1)
         frame.rowconfigure(1, weight=1)
 
-        ttk.Label(frame, text="DSL Preview", font=("Arial", 12, "bold"), style="Main.TLabel").grid(row=0, column=0, sticky="w", pady=(0, 5))
+        header = ttk.Frame(frame, style="Main.TFrame")
+        header.grid(row=0, column=0, sticky="ew", pady=(0, 5))
+        header.columnconfigure(0, weight=1)
+        ttk.Label(header, text="DSL Preview", font=("Arial", 12, "bold"), style="Main.TLabel").grid(row=0, column=0, sticky="w")
+        ttk.Label(header, text="Find:", style="Main.TLabel").grid(row=0, column=1, padx=(0, 5))
+        self.find_combo = SearchCombobox(header, self.search, width=30)
+        self.find_combo.grid(row=0, column=2, sticky="e")
+        self.find_combo.bind("<<ComboboxSelected>>", self.show_in_preview)
 
         self.preview_text = tk.Text(frame, wrap="word", state="disabled")
         self.preview_text.grid(row=1, column=0, sticky="nsew")
         self.preview_text.grid(row=1, column=0, sticky="nsew", pady=(5, 0))
+        self.preview_text.tag_configure("error", background="#f4c7c3")
+        self.preview_text.tag_configure("found", background="#fff2a8")
+
+        self.validation_label = ttk.Label(frame, text="", style="Main.TLabel", wraplength=400)
+        self.validation_label.grid(row=2, column=0, sticky="w", pady=(5, 0))
+
+        # The preview is validated in the background whenever it changes
+        self.validator = BackgroundValidator(self.preview_text, lambda: self.preview.text(),
+                                             self.show_validation_result)
+        self.preview = DSLPreview(self.preview_text, lambda: self.places, on_change=self.validator.schedule)
+        self.saver = BackgroundSaver(self, self.document_to_save, self.show_save_result)
 
     # -----------------------------
     # Place Setup
@@ -146,11 +208,8 @@ class SmartHomeApp(tk.Tk):
                                                     filetypes=[("SmartHome DSL", "*.shl")])
             if filename:
                 base_name = os.path.splitext(os.path.basename(filename))[0]
-                self.place = Place(base_name)
+                self.set_places([Place(base_name)])
                 self.place_file = filename
-                self.place.locations = []
-                self.place.rules = []
-                self.place.scenes = []
                 self.save_place_to_file()
         else:
             filename = filedialog.askopenfilename(title="Open Place File", filetypes=[("SmartHome DSL", "*.shl")])
@@ -166,6 +225,41 @@ class SmartHomeApp(tk.Tk):
         self.refresh_dsl_preview()
         self.enable_all_actions()
 
+    def set_places(self, places, current=0, compiled=None):
+        """Shows `places`; `compiled` optionally holds their compiled rules, as in a snapshot.Snapshot."""
+        self.saver.flush()      # a pending autosave belongs to the file being closed
+        self.history.clear()
+        self.places = places
+        self.compiled_rules = {item.rule.id: item for items in compiled or () for item in items
+                               if isinstance(item, CompiledRule)}
+        self.place = places[current] if places else None
+        self.update_place_selector()
+        self.refresh_locations_list()
+        self.refresh_dsl_preview()
+
+    def on_place_selected(self, event=None):
+        idx = self.place_selector.current()
+        if 0 <= idx < len(self.places):
+            self.place = self.places[idx]
+            self.refresh_locations_list()
+
+    def add_place(self):
+        name = simpledialog.askstring("Add Place", "Place name:", parent=self)
+        name = (name or "").strip().replace(" ", "")
+        if not name:
+            return
+        if any(place.name.lower() == name.lower() for place in self.places):
+            messagebox.showerror("Error", f"Place '{name}' already exists.")
+            return
+        self.place = Place(name)
+        self.apply(AddPlace(self.places, self.place))
+
+    def update_place_selector(self):
+        self.place_selector.config(values=[place.name for place in self.places])
+        for i, place in enumerate(self.places):
+            if place is self.place:
+                self.place_selector.current(i)
+
     # -----------------------------
     # Enable/Disable Buttons
     # -----------------------------
@@ -223,9 +317,7 @@ class SmartHomeApp(tk.Tk):
                 messagebox.showerror("Error", f"Location '{name}' already exists.", parent=dlg)
                 return
 
-            self.place.locations.append(Location(name=name))
-            self.refresh_locations_list()
-            self.refresh_dsl_preview()
+            self.apply(AddLocation(self.place, Location(name=name)))
             dlg.destroy()
 
         ttk.Button(dlg, text="Add", command=save_location).grid(row=2, column=0, padx=10, pady=10)
@@ -244,10 +336,9 @@ class SmartHomeApp(tk.Tk):
     def remove_location(self):
         idx = self.get_selected_index(self.location_list)
         if idx is not None and messagebox.askyesno("Remove Location", "Are you sure?"):
-            del self.place.locations[idx]
-            self.refresh_locations_list()
-            self.refresh_dsl_preview()
+            self.apply(RemoveLocation(self.place, self.place.locations[idx]))
 
+    @timed("refresh_locations_list")
     def refresh_locations_list(self):
         self.location_list.delete(0, tk.END)
         for loc in getattr(self.place, "locations", []):
@@ -283,10 +374,9 @@ class SmartHomeApp(tk.Tk):
         name_entry.grid(row=1, column=1, padx=10, pady=5, sticky="ew")
 
         ttk.Label(dlg, text="Select Location:").grid(row=2, column=0, padx=10, pady=5, sticky="w")
-        loc_combo = ttk.Combobox(dlg, values=[loc.name for loc in self.place.locations], state="readonly")
+        loc_combo = SearchCombobox(dlg, self.location_search())
         loc_combo.grid(row=2, column=1, padx=10, pady=5, sticky="ew")
-        if loc_combo["values"]:
-            loc_combo.current(0)
+        loc_combo.set(self.place.locations[0].name)
 
         def save_device():
             device_type = dev_type_combo.get()
@@ -297,10 +387,11 @@ class SmartHomeApp(tk.Tk):
             if not name:
                 messagebox.showerror("Error", "Device name required.", parent=dlg)
                 return
-            location = next((l for l in self.place.locations if l.name == loc_combo.get()), None)
-            if location:
-                location.add_device(Device(name=name, device_type=device_type))
-                self.refresh_dsl_preview()
+            location = self.place.find_location(loc_combo.get())
+            if not location:
+                messagebox.showerror("Error", "Selected location does not exist.", parent=dlg)
+                return
+            self.apply(AddDevice(location, Device(name=name, device_type=device_type)))
             dlg.destroy()
 
         ttk.Button(dlg, text="Add", command=save_device).grid(row=3, column=0, columnspan=2, pady=10)
@@ -327,10 +418,9 @@ class SmartHomeApp(tk.Tk):
         loc_name = simpledialog.askstring("Remove Device", f"Enter location ({', '.join(loc_names)}):")
         if not loc_name:
             return
-        location = next((l for l in self.place.locations if l.name == loc_name), None)
+        location = self.place.find_location(loc_name)
         if location and getattr(location, "devices", []):
-            location.devices.pop()
-            self.refresh_dsl_preview()
+            self.apply(RemoveDevice(location, location.devices[-1]))
 
     def show_all_devices(self):
         if not self.place:
@@ -342,51 +432,90 @@ class SmartHomeApp(tk.Tk):
         dlg.grab_set()
         dlg.attributes("-topmost", True)
         dlg.columnconfigure(0, weight=1)
-        dlg.rowconfigure(1, weight=1)
+        dlg.rowconfigure(2, weight=1)
 
         ttk.Label(dlg, text="All Devices", font=("Arial", 12, "bold")).grid(row=0, column=0, padx=10, pady=(10, 5), sticky="w")
 
+        filters = ttk.Frame(dlg)
+        filters.grid(row=1, column=0, padx=10, pady=5, sticky="ew")
+        filters.columnconfigure(1, weight=1)
+        ttk.Label(filters, text="Name:").grid(row=0, column=0, padx=(0, 5), sticky="w")
+        name_var = tk.StringVar()
+        ttk.Entry(filters, textvariable=name_var).grid(row=0, column=1, padx=(0, 10), sticky="ew")
+        ttk.Label(filters, text="Type:").grid(row=0, column=2, padx=(0, 5), sticky="w")
+        type_combo = ttk.Combobox(filters, values=["All"] + DEVICE_TYPES, state="readonly", width=14)
+        type_combo.grid(row=0, column=3, padx=(0, 10))
+        type_combo.current(0)
+        ttk.Label(filters, text="Location:").grid(row=0, column=4, padx=(0, 5), sticky="w")
+        loc_combo = SearchCombobox(filters, self.location_search(), width=16)    # empty: all locations
+        loc_combo.grid(row=0, column=5)
+
         container = ttk.LabelFrame(dlg, text="Devices")
-        container.grid(row=1, column=0, padx=10, pady=5, sticky="nsew")
+        container.grid(row=2, column=0, padx=10, pady=5, sticky="nsew")
         container.columnconfigure(0, weight=1)
         container.rowconfigure(0, weight=1)
 
-        device_listbox = tk.Listbox(container, height=10)
         empty_label = ttk.Label(container, text="No devices created yet.")
-        device_items = []
+        table = self.get_device_table()
+        rows = table     # the table itself, or the filtered list of devices
 
-        def refresh_device_list():
-            device_items.clear()
-            device_listbox.delete(0, tk.END)
-            devices = self.get_all_devices()
-            if devices:
-                empty_label.grid_forget()
-                device_listbox.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
-                for dev, loc in devices:
-                    device_items.append((dev, loc))
-                    loc_name = loc.name if loc else "No Location"
-                    device_listbox.insert(tk.END, f"{dev.name} ({dev.device_type}) - {loc_name}")
-            else:
-                device_listbox.grid_forget()
-                empty_label.grid(row=0, column=0, padx=10, pady=10, sticky="w")
+        def row_device(row):
+            if rows is table:
+                return table[row]
+            return rows[row], rows[row].location
+
+        def row_text(row):
+            dev, loc = row_device(row)
+            loc_name = loc.name if loc else "No Location"
+            return f"{dev.name} ({dev.device_type}) - {loc_name}"
 
-        def edit_selected_device():
-            if not device_items:
+        def edit_selected_device(row=None):
+            if not len(table):
                 messagebox.showinfo("No Devices", "There are no devices to edit.", parent=dlg)
                 return
-            idx = self.get_selected_index(device_listbox)
-            if idx is None:
+            if device_list.selection is None:
                 messagebox.showwarning("Select Device", "Please select a device to edit.", parent=dlg)
                 return
-            device, location = device_items[idx]
+            device, location = row_device(device_list.selection)
             self.open_edit_device_dialog(device, location, on_save=refresh_device_list, parent=dlg)
 
+        device_list = VirtualList(container, on_activate=edit_selected_device)
+
+        def refresh_device_list(*args):
+            # Called with event arguments when a filter changed, without after an edit
+            nonlocal rows
+            if args:
+                device_list.selection = None
+            device_type = type_combo.get()
+            location = self.place.find_location(loc_combo.get()) if loc_combo.get() else None
+            prefix = name_var.get().strip()
+            if device_type == "All" and location is None and not prefix:
+                rows = table
+            else:
+                rows = table.filter(device_type if device_type != "All" else None, location, prefix)
+
+            if len(table):
+                empty_label.grid_forget()
+                device_list.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
+                device_list.set_rows(len(rows), row_text)
+            else:
+                device_list.grid_forget()
+                empty_label.grid(row=0, column=0, padx=10, pady=10, sticky="w")
+
+        name_var.trace_add("write", refresh_device_list)
+        type_combo.bind("<<ComboboxSelected>>", refresh_device_list)
+        def on_location_key(event):
+            if not loc_combo.get():
+                refresh_device_list(event)
+
+        loc_combo.bind("<<ComboboxSelected>>", refresh_device_list)
+        loc_combo.bind("<KeyRelease>", on_location_key, add="+")
         refresh_device_list()
 
-        ttk.Button(dlg, text="Edit Device", command=edit_selected_device).grid(row=2, column=0, padx=10, pady=(5, 10), sticky="e")
+        ttk.Button(dlg, text="Edit Device", command=edit_selected_device).grid(row=3, column=0, padx=10, pady=(5, 10), sticky="e")
 
         dlg.update_idletasks()
-        dlg.minsize(380, dlg.winfo_reqheight())
+        dlg.minsize(520, dlg.winfo_reqheight())
         self.wait_window(dlg)
 
     # -----------------------------
@@ -418,12 +547,8 @@ class SmartHomeApp(tk.Tk):
         condition_frame = tk.Frame(dlg)
         condition_frame.grid(row=1, column=1, sticky="ew", padx=5, pady=5)
 
-        detector_devices = [
-            d.name for loc in self.place.locations for d in loc.devices
-            if d.device_type in DEVICE_CATEGORIES["Detector"]
-        ]
-
-        condition_device_combo = ttk.Combobox(condition_frame, values=detector_devices, state="readonly")
+        detectors = DEVICE_CATEGORIES["Detector"]
+        condition_device_combo = SearchCombobox(condition_frame, self.device_search(lambda device: device.device_type in detectors))
         condition_device_combo.grid(row=0, column=0, padx=2, pady=2)
 
         condition_type_combo = ttk.Combobox(condition_frame, state="readonly")
@@ -451,10 +576,7 @@ class SmartHomeApp(tk.Tk):
 
         def update_condition_options(event=None):
             device_name = condition_device_combo.get()
-            device = next(
-                (d for loc in self.place.locations for d in loc.devices if d.name == device_name),
-                None
-            )
+            device = self.place.find_device(device_name)
             if not device:
                 return
 
@@ -492,14 +614,13 @@ class SmartHomeApp(tk.Tk):
         actions_frame = tk.Frame(dlg)
         actions_frame.grid(row=2, column=1, sticky="ew", padx=5, pady=5)
 
-        all_devices = [d.name for loc in self.place.locations for d in loc.devices]
         action_rows = []
 
         def add_action_row():
             row_frame = tk.Frame(actions_frame)
             row_frame.pack(fill="x", pady=2)
 
-            dev_combo = ttk.Combobox(row_frame, values=all_devices, state="readonly")
+            dev_combo = SearchCombobox(row_frame, self.device_search())
             dev_combo.pack(side="left", padx=2)
 
             cmd_combo = ttk.Combobox(row_frame, state="readonly")
@@ -509,10 +630,7 @@ class SmartHomeApp(tk.Tk):
 
             def update_actions(event=None):
                 dev_name = dev_combo.get()
-                device = next(
-                    (d for loc in self.place.locations for d in loc.devices if d.name == dev_name),
-                    None
-                )
+                device = self.place.find_device(dev_name)
                 if device:
                     cmds = DEVICE_FUNCTIONALITIES.get(device.device_type, [])
                     cmd_combo["values"] = cmds
@@ -555,10 +673,7 @@ class SmartHomeApp(tk.Tk):
             cond_type = condition_type_combo.get()
 
             condition_str = None
-            device = next(
-                (d for loc in self.place.locations for d in loc.devices if d.name == dev_name),
-                None
-            )
+            device = self.place.find_device(dev_name)
 
             # ---- Thermostat ----
             if device and device.device_type == "Thermostat":
@@ -598,10 +713,8 @@ class SmartHomeApp(tk.Tk):
                 messagebox.showerror("Error", "Rule name or condition is missing.", parent=dlg)
                 return
 
-            self.place.rules.append(
-                Rule(name=f'"{name}"', condition=condition_str, actions=action_list)
-            )
-            self.refresh_dsl_preview()
+            rule = Rule(name=f'"{name}"', condition=condition_str, actions=action_list)
+            self.apply(AddRule(self.place, rule))
             dlg.destroy()
 
         tk.Button(dlg, text="Save", command=save_rule).grid(row=4, column=1, sticky="e", padx=5, pady=5)
@@ -622,9 +735,17 @@ class SmartHomeApp(tk.Tk):
 
         # Location
         ttk.Label(dlg, text="Location:").grid(row=0, column=0, padx=10, pady=5, sticky="w")
-        loc_combo = ttk.Combobox(dlg, values=[loc.name for loc in self.place.locations], state="readonly")
+        loc_combo = SearchCombobox(dlg, self.location_search())
         loc_combo.grid(row=0, column=1, padx=10, pady=5, sticky="ew")
 
+        def devices_in(location):
+            # A location's own devices are few enough to match directly
+            def search(query, limit):
+                query = query.strip().casefold()
+                devices = location.devices if location else []
+                return [(dev.name, dev) for dev in devices if query in dev.name.casefold()][:limit]
+            return search
+
         # Scene Name
         ttk.Label(dlg, text="Scene Name:").grid(row=1, column=0, padx=10, pady=5, sticky="w")
         name_entry = ttk.Entry(dlg)
@@ -642,7 +763,7 @@ class SmartHomeApp(tk.Tk):
             
             ttk.Label(actions_frame, text="do:").grid(row=row_index, column=0, padx=5, pady=5, sticky="w")
             
-            device_combo = ttk.Combobox(actions_frame, state="readonly")
+            device_combo = SearchCombobox(actions_frame, devices_in(self.place.find_location(loc_combo.get())))
             device_combo.grid(row=row_index, column=1, padx=5, pady=5, sticky="ew")
 
             action_combo = ttk.Combobox(actions_frame, state="readonly")
@@ -656,9 +777,7 @@ class SmartHomeApp(tk.Tk):
             def on_device_select(event):
                 selected_device_name = device_combo.get()
                 # Clear previous action and arg
-                selected_loc_name = loc_combo.get()
-                location = next((l for l in self.place.locations if l.name == selected_loc_name), None)
-                device = next((d for d in location.devices if d.name == selected_device_name), None)
+                device = self.place.find_device(selected_device_name)
                 if device:
                     action_combo['values'] = DEVICE_FUNCTIONALITIES.get(device.device_type, [])
                     action_combo.current(0 if action_combo['values'] else -1)
@@ -680,26 +799,14 @@ class SmartHomeApp(tk.Tk):
                     action_set['arg_widget'] = arg_entry
 
             action_combo.bind("<<ComboboxSelected>>", on_action_select)
-
-            # If a location is already selected, populate this new row's device list
-            selected_loc_name = loc_combo.get()
-            if selected_loc_name:
-                location = next((l for l in self.place.locations if l.name == selected_loc_name), None)
-                if location:
-                    device_names = [dev.name for dev in getattr(location, "devices", [])]
-                    device_combo['values'] = device_names
-
-
             device_combo.bind("<<ComboboxSelected>>", on_device_select)
 
         def on_location_select(event):
             loc_name = loc_combo.get()
-            location = next((l for l in self.place.locations if l.name == loc_name), None)
+            location = self.place.find_location(loc_name)
             if location:
-                device_names = [dev.name for dev in getattr(location, "devices", [])]
                 for action_set in actions:
-                    action_set['device_combo']['values'] = device_names
-                    action_set['device_combo'].set('')
+                    action_set['device_combo'].set_search(devices_in(location))
                     action_set['action_combo'].set('')
                     action_set['action_combo']['values'] = []
 
@@ -715,6 +822,9 @@ class SmartHomeApp(tk.Tk):
             if not name or not loc_name:
                 messagebox.showerror("Error", "Scene Name and Location are required.", parent=dlg)
                 return
+            if not self.place.find_location(loc_name):
+                messagebox.showerror("Error", "Selected location does not exist.", parent=dlg)
+                return
 
             scene_actions = []
             for action_set in actions:
@@ -730,8 +840,7 @@ class SmartHomeApp(tk.Tk):
 
 
             scene = Scene(name=name, location=loc_name, actions=scene_actions)
-            self.place.scenes.append(scene)
-            self.refresh_dsl_preview()
+            self.apply(AddScene(self.place, scene))
             dlg.destroy()
 
         ttk.Button(dlg, text="Save Scene", command=save_scene).grid(row=3, column=0, columnspan=2, pady=10)
@@ -740,6 +849,43 @@ class SmartHomeApp(tk.Tk):
         dlg.minsize(dlg.winfo_reqwidth(), dlg.winfo_reqheight())
         self.wait_window(dlg)
 
+    def show_rule_analysis(self):
+        if not self.place:
+            return
+        analysis = analyze(self.place)
+        if not analysis.conflicts and not analysis.loops:
+            messagebox.showinfo("Rule Analysis", "No conflicting rules or rule loops found.")
+            return
+
+        dlg = tk.Toplevel(self)
+        dlg.title("Rule Analysis")
+        dlg.transient(self)
+        dlg.columnconfigure(0, weight=1)
+        dlg.rowconfigure(1, weight=1)
+
+        ttk.Label(dlg, text=f"{len(analysis.conflicts)} conflicts, {len(analysis.loops)} possible loops",
+                  font=("Arial", 12, "bold")).grid(row=0, column=0, padx=10, pady=(10, 5), sticky="w")
+
+        container = ttk.Frame(dlg)
+        container.grid(row=1, column=0, padx=10, pady=5, sticky="nsew")
+        container.columnconfigure(0, weight=1)
+        container.rowconfigure(0, weight=1)
+        findings = tk.Listbox(container, width=90, height=15)
+        scrollbar = ttk.Scrollbar(container, orient="vertical", command=findings.yview)
+        findings.config(yscrollcommand=scrollbar.set)
+        findings.grid(row=0, column=0, sticky="nsew")
+        scrollbar.grid(row=0, column=1, sticky="ns")
+
+        for conflict in analysis.conflicts:
+            (first, first_action), (second, second_action) = conflict.first, conflict.second
+            device, functionality = conflict.trigger
+            findings.insert(tk.END, f"Conflict on {conflict.device} when {device} detects {functionality}: "
+                                    f"{first.name} does '{first_action}', {second.name} does '{second_action}'")
+        for loop in analysis.loops:
+            findings.insert(tk.END, "Possible loop: " + " -> ".join(rule.name for rule in loop.rules))
+
+        ttk.Button(dlg, text="Close", command=dlg.destroy).grid(row=2, column=0, padx=10, pady=(5, 10), sticky="e")
+
     def open_edit_device_dialog(self, device, current_location, on_save=None, parent=None):
         dlg = tk.Toplevel(self)
         dlg.title("Edit Device")
@@ -763,12 +909,12 @@ class SmartHomeApp(tk.Tk):
             device_type_combo.current(0)
 
         ttk.Label(dlg, text="Location:").grid(row=2, column=0, padx=10, pady=5, sticky="w")
-        loc_combo = ttk.Combobox(dlg, values=[loc.name for loc in self.place.locations], state="readonly")
+        loc_combo = SearchCombobox(dlg, self.location_search())
         loc_combo.grid(row=2, column=1, padx=10, pady=5, sticky="ew")
         if current_location:
             loc_combo.set(current_location.name)
-        elif loc_combo["values"]:
-            loc_combo.current(0)
+        elif self.place.locations:
+            loc_combo.set(self.place.locations[0].name)
 
         def save_changes():
             new_name = name_entry.get().strip()
@@ -779,25 +925,14 @@ class SmartHomeApp(tk.Tk):
                 messagebox.showerror("Error", "All fields are required.", parent=dlg)
                 return
 
-            target_location = next((l for l in self.place.locations if l.name == loc_name), None)
+            target_location = self.place.find_location(loc_name)
             if not target_location:
                 messagebox.showerror("Error", "Selected location does not exist.", parent=dlg)
                 return
 
-            device.name = new_name
-            device.device_type = new_type
-
-            if current_location and target_location.id != current_location.id:
-                current_location.remove_device(device)
-                target_location.add_device(device)
-            elif not current_location:
-                target_location.add_device(device)
-            else:
-                device.location = target_location
-
+            self.apply(EditDevice(self.place, device, new_name, new_type, target_location))
             if on_save:
                 on_save()
-            self.refresh_dsl_preview()
             dlg.destroy()
 
         ttk.Button(dlg, text="Save Changes", command=save_changes).grid(row=3, column=0, columnspan=2, padx=10, pady=10)
@@ -807,66 +942,106 @@ class SmartHomeApp(tk.Tk):
         self.wait_window(dlg)
 
     # -----------------------------
-    # DSL Preview
+    # Undo / Redo
     # -----------------------------
-    def refresh_dsl_preview(self):
-        self.preview_text.config(state="normal")
-        self.preview_text.delete("1.0", tk.END)
-        self.preview_text.insert("1.0", self.generate_dsl_text())
-        self.preview_text.config(state="disabled")
-
-    def generate_dsl_text(self):
-        if not self.place:
-            return ""
-        
-        lines = [f"place {self.place.name}:"]
-
-        # Locations & devices
-        for loc in getattr(self.place, "locations", []):
-            lines.append(f"    location {loc.name}:")
-            for dev in getattr(loc, "devices", []):
-                lines.append(f"        device {dev.name}: {dev.device_type}")
-            lines.append("    end")
-
-        # Rules
-        lines.append("    // Rules")
-        for rule in getattr(self.place, "rules", []):
-            lines.append(f"    rule {rule.name}:")
-            lines.append(f"        if {rule.condition}")
-            for action in rule.actions:
-                lines.append(f"            do {action}")
-            lines.append("    end")
-
-        # Scenes
-        lines.append("    // Scenes")
-        for scene in getattr(self.place, "scenes", []):
-            # Scene header with quotes and location
-            lines.append(f'    scene "{scene.name}" at {scene.location}:')
-            for action in scene.actions:
-                parts = action.split(maxsplit=2)  # e.g., "BedroomSmartSpeaker play_music Metallica"
-                if len(parts) == 3:
-                    device, cmd, arg = parts
-                    # Add quotes if argument is not a number                    
-                    if not arg.replace('.', '', 1).isdigit() and not (arg.startswith('"') and arg.endswith('"')):
-                        arg = f'"{arg.strip()}"'
-                    lines.append(f"        do {device} {cmd} {arg}")
-                else:
-                    lines.append(f"        do {action}")
-            lines.append("    end")
+    def apply(self, operation):
+        """Applies an edit (see models/history.py) so that it can be undone."""
+        self.history.do(operation)
+        self.after_operation(operation)
+
+    def undo(self):
+        operation = self.history.undo()
+        if operation is None:
+            self.bell()
+            return
+        self.after_operation(operation)
 
+    def redo(self):
+        operation = self.history.redo()
+        if operation is None:
+            self.bell()
+            return
+        self.after_operation(operation)
+
+    def after_operation(self, operation):
+        if isinstance(operation, AddPlace):
+            # Undoing the place being edited switches to another one
+            if not any(place is self.place for place in self.places):
+                self.place = self.places[-1] if self.places else None
+            self.update_place_selector()
+        if isinstance(operation, (AddPlace, AddLocation, RemoveLocation)):
+            self.refresh_locations_list()
+        self.refresh_dsl_preview(*operation.changed())
+        if self.autosave.get():
+            self.saver.schedule()
 
-        lines.append("end")
-        return "\n".join(lines)
+    # -----------------------------
+    # DSL Preview
+    # -----------------------------
+    @timed("refresh_dsl_preview")
+    def refresh_dsl_preview(self, *changed):
+        """Redraws the preview once Tk is idle; `changed` limits re-rendering to those blocks."""
+        self.preview.refresh(*changed)
+        if not changed:
+            # Anything may have changed (e.g. another file was opened): rebuilt on next use
+            self.search_index = self.device_table = None
+            return
+        if self.search_index is not None:
+            self.search_index.changed(*changed)
+        if self.device_table is not None:
+            self.device_table.changed(*changed)
+
+    def show_in_preview(self, event=None):
+        """Scrolls the preview to the block of the device, location, rule or scene picked in the Find box."""
+        obj = self.find_combo.selected()
+        if obj is None or not self.place:
+            return
+        self.preview.flush()
+        text = self.preview_text
+        start = text.search(f"place {self.place.name}:", "1.0", stopindex="end") or "1.0"
+        if isinstance(obj, Device):
+            # Device names may repeat across locations, so look under its own location
+            if obj.location is not None:
+                start = text.search(f"location {obj.location.name}:", start, stopindex="end") or start
+            header = f"device {obj.name}:"
+        elif isinstance(obj, Location):
+            header = f"location {obj.name}:"
+        elif isinstance(obj, Rule):
+            header = f"rule {obj.name}:"
+        else:
+            header = f'scene "{obj.name}" at'
+        index = text.search(header, start, stopindex="end")
+        if not index:
+            return
+        text.tag_remove("found", "1.0", "end")
+        text.tag_add("found", f"{index} linestart", f"{index} lineend")
+        text.see(index)
 
     # -----------------------------
     # Utilities
     # -----------------------------
-    def get_all_devices(self):
-        devices = []
-        for loc in getattr(self.place, "locations", []):
-            for dev in getattr(loc, "devices", []):
-                devices.append((dev, loc))
-        return devices
+    def get_search_index(self):
+        if self.search_index is None or self.search_index.place is not self.place:
+            self.search_index = PlaceIndex(self.place)
+        return self.search_index
+
+    def search(self, query, limit, kinds=None, accept=None):
+        """Type-ahead matches in the current place, as (name, object) pairs; see SearchIndex.search()."""
+        if not self.place:
+            return []
+        return self.get_search_index().search(query, kinds, accept, limit)
+
+    def device_search(self, accept=None):
+        """A search function for a SearchCombobox listing devices (those `accept` returns true for)."""
+        return lambda query, limit: self.search(query, limit, ("device",), accept)
+
+    def location_search(self):
+        return lambda query, limit: self.search(query, limit, ("location",))
+
+    def get_device_table(self):
+        if self.device_table is None or self.device_table.place is not self.place:
+            self.device_table = DeviceTable(self.place, self.get_search_index())
+        return self.device_table
 
     def get_selected_index(self, listbox):
         try:
@@ -877,15 +1052,22 @@ class SmartHomeApp(tk.Tk):
     # -----------------------------
     # File Handling
     # -----------------------------
+    @timed("load_place_from_file")
     def load_place_from_file(self, filename):
         try:
-            with open(filename, "r", encoding="utf-8") as f:
-                text = f.read()
-            self.place = self.parse_dsl(text)
+            if os.path.getsize(filename):
+                # Uses the binary snapshot next to the file when it is up to date, otherwise
+                # parses the file, its places in parallel only when they are worth a pool
+                loaded = snapshot.load(filename, parse=parallel.load_file)
+                places, compiled = loaded.places, loaded.compiled
+            else:
+                places, compiled = [Place(os.path.splitext(os.path.basename(filename))[0])], None
+            # The compiled rules are kept for the rule engine, see rules_to_run()
+            self.set_places(places, compiled=compiled)
             self.place_file = filename
-            self.refresh_locations_list()
-            self.refresh_dsl_preview()
-            messagebox.showinfo("Place Loaded", f"Loaded place '{self.place.name}'")
+            self.saver.forget(filename)     # may have changed since this session last saved it
+            names = ", ".join(place.name for place in places)
+            messagebox.showinfo("Place Loaded", f"Loaded place{'s' if len(places) > 1 else ''} '{names}'")
             self.enable_all_actions()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load file: {e}")
@@ -893,12 +1075,32 @@ class SmartHomeApp(tk.Tk):
     def save_place_to_file(self):
         if not getattr(self, "place_file", None):
             return self.save_place_as()
-        try:
-            with open(self.place_file, "w", encoding="utf-8") as f:
-                f.write(self.generate_dsl_text())
-            messagebox.showinfo("Saved", f"Place saved to {self.place_file}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save file: {e}")
+        # Written in the background; editing can go on meanwhile
+        self.saver.save(then=self.show_saved)
+
+    def document_to_save(self):
+        """(file, DSL text) to save, taken on the main thread; None if no file is open."""
+        if not self.place_file or not self.places:
+            return None
+        return self.place_file, self.preview.text()
+
+    def show_saved(self, path, written, error):
+        if error is not None:
+            messagebox.showerror("Error", f"Failed to save file: {error}")
+        elif written:
+            messagebox.showinfo("Saved", f"Place saved to {path}")
+        else:
+            messagebox.showinfo("Saved", f"No changes to save, {path} is up to date")
+
+    def show_save_result(self, path, written, error):
+        # Autosaves stay quiet unless they fail
+        if error is not None:
+            self.autosave.set(False)
+            messagebox.showerror("Error", f"Autosave failed, turned off: {error}")
+
+    def on_autosave_toggled(self):
+        if self.autosave.get() and self.history.can_undo():
+            self.saver.schedule()
 
     def save_place_as(self):
         filename = filedialog.asksaveasfilename(title="Save Place File", defaultextension=".shl",
@@ -917,106 +1119,77 @@ class SmartHomeApp(tk.Tk):
                                                 filetypes=[("SmartHome DSL", "*.shl")])
         if filename:
             base_name = os.path.splitext(os.path.basename(filename))[0]
-            self.place = Place(base_name)
+            self.set_places([Place(base_name)])
             self.place_file = filename
-            self.place.locations = []
-            self.place.rules = []
-            self.place.scenes = []
             self.save_place_to_file()
-            self.refresh_locations_list()
-            self.refresh_dsl_preview()
             self.enable_all_actions()
 
     # -----------------------------
-    # DSL Parsing
+    # Validation
     # -----------------------------
-    def parse_dsl(self, text):
-        lines = [l.split("//")[0].rstrip() for l in text.splitlines() if l.strip()]
-        place = None
-        current_context = None  # Can be a location, rule, or scene
-
-        re_place = re.compile(r"^\s*place\s+([A-Za-z0-9_\-]+)\s*:", re.IGNORECASE)
-        re_location = re.compile(r"^\s*location\s+([A-Za-z0-9_\-]+)\s*:\s*$", re.IGNORECASE)
-        re_device = re.compile(r"^\s*device\s+([A-Za-z0-9_\-]+)\s*:\s*([A-Za-z0-9_\-]+)\s*$", re.IGNORECASE)
-        re_rule = re.compile(r"^\s*rule\s+(\".*\")\s*:", re.IGNORECASE)
-        re_scene = re.compile(r"^\s*scene\s+(\".*\")\s+at\s+([A-Za-z0-9_\-]+)\s*:", re.IGNORECASE)
-        re_if = re.compile(r"^\s*if\s+(.*)", re.IGNORECASE)
-        re_do = re.compile(r"^\s*do\s+(.*)", re.IGNORECASE)
-        re_end = re.compile(r"^\s*end\s*$", re.IGNORECASE)
-
-        for line in lines:
-            line = line.strip()
-
-            # End of a block
-            if re_end.match(line):
-                if isinstance(current_context, (Location, Rule, Scene)):
-                    current_context = None # Exit the current block context
-                continue
-
-            # Inside a block, process its contents
-            if isinstance(current_context, Location) and (m := re_device.match(line)):
-                current_context.add_device(Device(name=m.group(1), device_type=m.group(2)))
-                continue
-            elif isinstance(current_context, Rule) and (m := re_if.match(line)):
-                current_context.condition = m.group(1).strip()
-                continue
-            elif isinstance(current_context, (Rule, Scene)) and (m := re_do.match(line)):
-                current_context.actions.append(m.group(1).strip())
-                continue
-
-            # Top-level block definitions
-            if m := re_place.match(line):
-                place = Place(m.group(1))
-                place.locations, place.rules, place.scenes = [], [], []
-                continue
-            if not place: continue
-
-            if m := re_location.match(line):
-                loc_name = m.group(1)
-                current_context = Location(name=loc_name)
-                place.locations.append(current_context)
-                continue
-            
-            if m := re_rule.match(line):
-                rule_name = m.group(1)
-                current_context = Rule(name=rule_name)
-                place.rules.append(current_context)
-                continue
-            
-            if m := re_scene.match(line):
-                scene_name, loc_name = m.groups()
-                current_context = Scene(name=scene_name.strip('"'), location=loc_name)
-                place.scenes.append(current_context)
-                continue
-
-        if not place:
-            place = Place(name=os.path.splitext(os.path.basename(self.place_file or "UnnamedPlace.shl"))[0])
-            place.locations, place.rules, place.scenes = [], [], []
-        return place
+    def show_validation_result(self, errors):
+        """Shows the outcome of a background validation and highlights the lines with errors."""
+        self.preview_text.tag_remove("error", "1.0", tk.END)
+        if not errors:
+            self.validation_label.config(text="No errors")
+            return
+        message, line, col = errors[0]
+        text = f"Line {line}, column {col}: {message}" if line is not None else message
+        if len(errors) > 1:
+            text += f" (and {len(errors) - 1} more)"
+        self.validation_label.config(text=text)
+        for _, line, _ in errors:
+            if line is not None:
+                self.preview_text.tag_add("error", f"{line}.0", f"{line}.0 lineend")
 
     def validate_and_run(self):
         """
-        Gets the DSL code from the preview text box, validates it against the
-        textX grammar, and shows a status message to the user.
+        Validates the DSL code of the preview against the textX grammar (in
+        the background, reusing the live validation's result when the code has
+        not changed since), then starts the rule engine.
         """
-        code = self.preview_text.get("1.0", tk.END)
+        self.preview.flush()
 
-        # The grammar file is in the parent directory of the 'gui' folder
-        grammar_file = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "grammar.tx"))
-
-        if not os.path.exists(grammar_file):
-            messagebox.showerror("Error", f"Grammar file not found at: {grammar_file}")
+        if not os.path.exists(GRAMMAR_FILE):
+            messagebox.showerror("Error", f"Grammar file not found at: {GRAMMAR_FILE}")
             return
 
+        self.validator.validate_now(self.run_validated)
+
+    def run_validated(self, errors):
+        if errors:
+            details = "\n".join(f"line {line}, column {col}: {message}" if line is not None else message
+                                for message, line, col in errors[:10])
+            if len(errors) > 10:
+                details += f"\n... and {len(errors) - 10} more"
+            messagebox.showerror("Validation Error",
+                                 f"There seem to be some errors in your program.\n\nDetails:\n{details}")
+            return
         try:
-            # Create a metamodel from the grammar file
-            metamodel = metamodel_from_file(grammar_file)
-            # Parse the code from the editor
-            metamodel.model_from_str(code)
-            messagebox.showinfo("Success", "You're SmartHome program is up and running")
+            # One engine per place: devices and rules never cross buildings
+            self.engines = [RuleEngine(place, self.rules_to_run(place)) for place in self.places]
         except Exception as e:
-            messagebox.showerror("Validation Error", f"There seem to be some errors in your program.\n\nDetails: {e}")
+            messagebox.showerror("Error", f"Failed to start the rule engine: {e}")
+            return
+        rules = sum(len(place.rules) for place in self.places)
+        messagebox.showinfo("Success", f"You're SmartHome program is up and running ({rules} rules loaded)")
 
+    def rules_to_run(self, place):
+        """
+        The rules of a place for RuleEngine: those loaded with the file are
+        already compiled (from the snapshot, or when the file was parsed);
+        rules added since are compiled by the engine.
+        """
+        rules = []
+        for rule in place.rules:
+            compiled = self.compiled_rules.get(rule.id)
+            rules.append(compiled if compiled is not None and compiled.rule is rule else rule)
+        return rules
+
+    def destroy(self):
+        self.validator.close()
+        self.saver.close()
+        super().destroy()
 
 
 if __name__ == "__main__":
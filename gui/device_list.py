@@ -0,0 +1,253 @@
+import bisect
+import tkinter as tk
+from tkinter import ttk
+
+from runtime.instrumentation import timed
+
+
+class DeviceTable:
+    """
+    The devices of a place as numbered rows, in location order, for the
+    "All Devices" dialog.
+
+    Rows are not copied: the table keeps the row offset at which each
+    location starts and reads devices straight from Location.devices, so a
+    device's name, type or location shown in a row is always current. Only
+    adding, removing or moving devices and locations changes the offsets;
+    changed() marks them stale and they are recomputed, in one pass over
+    the locations, when the table is next read.
+
+    filter() narrows the rows by device type, location and name prefix using
+    the place's indexes (see Place) and its search index (a PlaceIndex, see
+    models/search.py), so a filter visits the devices that can match rather
+    than every device.
+    """
+
+    def __init__(self, place, search):
+        self.place = place
+        self.search = search
+        self._offsets = None        # row of the first device of each location, plus the total
+        self._filters = {}          # (type, location id, prefix) -> list of devices
+
+    def changed(self, *objs):
+        """
+        Tells the table that the place was edited. `objs` are the objects
+        passed to refresh_dsl_preview(); with no arguments anything may have
+        changed. Rules and scenes do not affect the table.
+        """
+        if objs and not any(hasattr(obj, "devices") or hasattr(obj, "locations") for obj in objs):
+            return
+        self._offsets = None
+        self._filters.clear()
+
+    # -----------------------------
+    # Rows
+    # -----------------------------
+    def _row_offsets(self):
+        if self._offsets is None:
+            offsets, total = [], 0
+            for location in self.place.locations:
+                offsets.append(total)
+                total += len(location.devices)
+            offsets.append(total)
+            self._offsets = offsets
+        return self._offsets
+
+    def __len__(self):
+        return self._row_offsets()[-1]
+
+    def __getitem__(self, row):
+        """The (device, location) pair shown in a row."""
+        offsets = self._row_offsets()
+        if not 0 <= row < offsets[-1]:
+            raise IndexError(row)
+        # Empty locations share their offset with the next location; take the last of them
+        i = bisect.bisect_right(offsets, row) - 1
+        location = self.place.locations[i]
+        return location.devices[row - offsets[i]], location
+
+    # -----------------------------
+    # Filtering
+    # -----------------------------
+    @timed("device_table.filter")
+    def filter(self, device_type=None, location=None, prefix=""):
+        """
+        The devices matching every given criterion, in row order:
+        `device_type` exactly, `location` by identity, and names starting
+        with `prefix` (ignoring case). The list is cached until changed();
+        do not modify it.
+        """
+        prefix = prefix.casefold()
+        key = (device_type, location.id if location is not None else None, prefix)
+        devices = self._filters.get(key)
+        if devices is None:
+            devices = self._filters[key] = self._filter(device_type, location, prefix)
+        return devices
+
+    def _filter(self, device_type, location, prefix):
+        place = self.place
+        # Start from the smallest candidate set the indexes give, then check the other criteria
+        candidates = []
+        if location is not None:
+            candidates.append(location.devices)
+        if device_type is not None:
+            candidates.append(place.devices_by_type.get(device_type, {}).values())
+        if prefix:
+            candidates.append([place.devices_by_id[device_id] for device_id in self.search.with_prefix(prefix, "device")])
+        if not candidates:
+            return [device for loc in place.locations for device in loc.devices]
+        matches = [device for device in min(candidates, key=len)
+                   if (location is None or device.location is location)
+                   and (device_type is None or device.device_type == device_type)
+                   and (not prefix or device.name.casefold().startswith(prefix))]
+
+        # Back to row order: location order, then each location's own device order
+        if location is not None:
+            return matches
+        by_location = {}
+        for device in matches:
+            by_location.setdefault(id(device.location), set()).add(device.id)
+        ordered = []
+        for loc in place.locations:
+            ids = by_location.get(id(loc))
+            if ids is None:
+                continue
+            if len(ids) == len(loc.devices):
+                ordered.extend(loc.devices)
+            else:
+                ordered.extend(device for device in loc.devices if device.id in ids)
+        return ordered
+
+
+class VirtualList(ttk.Frame):
+    """
+    A single-selection list that only draws the rows in view, so it opens
+    and scrolls as fast with 100k rows as with 10.
+
+    set_rows() gives it a row count and a function returning the text of a
+    row; rows are rendered on demand while scrolling. `on_activate(row)` is
+    called on a double click or Return.
+    """
+
+    def __init__(self, master, height=10, row_height=20, on_activate=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.row_height = row_height
+        self.on_activate = on_activate
+        self.count = 0
+        self.row_text = None
+        self.top = 0                # first row in view
+        self.selection = None
+        self._items = []            # (background, text) canvas items, one per visible row
+
+        self.canvas = tk.Canvas(self, height=height * row_height, background="white", highlightthickness=0,
+                                takefocus=True)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.yview)
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        self.canvas.bind("<Configure>", lambda event: self.redraw())
+        self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<Double-Button-1>", self._on_activate)
+        self.canvas.bind("<Return>", self._on_activate)
+        self.canvas.bind("<Up>", lambda event: self.select(self._step(-1)))
+        self.canvas.bind("<Down>", lambda event: self.select(self._step(1)))
+        self.canvas.bind("<Prior>", lambda event: self.yview("scroll", -1, "pages"))
+        self.canvas.bind("<Next>", lambda event: self.yview("scroll", 1, "pages"))
+        self.canvas.bind("<MouseWheel>", lambda event: self.yview("scroll", -1 if event.delta > 0 else 1, "units"))
+        self.canvas.bind("<Button-4>", lambda event: self.yview("scroll", -1, "units"))
+        self.canvas.bind("<Button-5>", lambda event: self.yview("scroll", 1, "units"))
+
+    def set_rows(self, count, row_text):
+        """Shows `count` rows; row_text(row) returns the text of a row. Keeps the scroll position if it can."""
+        self.count = count
+        self.row_text = row_text
+        if self.selection is not None and self.selection >= count:
+            self.selection = None
+        self.top = max(0, min(self.top, count - self._visible_rows()))
+        self.redraw()
+
+    # -----------------------------
+    # Scrolling
+    # -----------------------------
+    def _visible_rows(self):
+        return max(1, self.canvas.winfo_height() // self.row_height)
+
+    def yview(self, *args):
+        """Scrollbar protocol: ("moveto", fraction) or ("scroll", n, "units" | "pages")."""
+        visible = self._visible_rows()
+        if args[0] == "moveto":
+            top = round(float(args[1]) * self.count)
+        else:
+            step = int(args[1]) * (visible if args[2] == "pages" else 3)
+            top = self.top + step
+        self.top = max(0, min(top, self.count - visible))
+        self.redraw()
+
+    def see(self, row):
+        visible = self._visible_rows()
+        if row < self.top:
+            self.top = row
+        elif row >= self.top + visible:
+            self.top = row - visible + 1
+        self.redraw()
+
+    # -----------------------------
+    # Selection
+    # -----------------------------
+    def select(self, row):
+        if row is None or not 0 <= row < self.count:
+            return
+        self.selection = row
+        self.see(row)
+
+    def _step(self, delta):
+        if not self.count:
+            return None
+        if self.selection is None:
+            return self.top
+        return max(0, min(self.selection + delta, self.count - 1))
+
+    def _row_at(self, y):
+        row = self.top + int(y) // self.row_height
+        return row if row < self.count else None
+
+    def _on_click(self, event):
+        self.canvas.focus_set()
+        self.select(self._row_at(event.y))
+
+    def _on_activate(self, event):
+        if event.type == tk.EventType.ButtonPress:
+            self._on_click(event)
+        if self.selection is not None and self.on_activate is not None:
+            self.on_activate(self.selection)
+
+    # -----------------------------
+    # Drawing
+    # -----------------------------
+    def redraw(self):
+        canvas, height = self.canvas, self.row_height
+        visible = self._visible_rows() + 1      # a partly shown row at the bottom
+        width = canvas.winfo_width()
+        while len(self._items) < visible:
+            y = len(self._items) * height
+            self._items.append((canvas.create_rectangle(0, y, width, y + height, width=0),
+                                canvas.create_text(4, y + height // 2, anchor="w")))
+
+        for i, (background, text) in enumerate(self._items):
+            row = self.top + i
+            if i < visible and row < self.count:
+                selected = row == self.selection
+                canvas.coords(background, 0, i * height, width, (i + 1) * height)
+                canvas.itemconfigure(background, state="normal", fill="#4d82bc" if selected else "white")
+                canvas.itemconfigure(text, state="normal", text=self.row_text(row),
+                                     fill="white" if selected else "black")
+            else:
+                canvas.itemconfigure(background, state="hidden")
+                canvas.itemconfigure(text, state="hidden")
+
+        if self.count:
+            self.scrollbar.set(self.top / self.count, min(1.0, (self.top + visible - 1) / self.count))
+        else:
+            self.scrollbar.set(0.0, 1.0)
@@ -0,0 +1,99 @@
+from dsl.generator import iter_document_blocks
+from runtime.instrumentation import count, timed
+
+
+class DSLPreview:
+    """
+    Keeps a read-only Text widget showing the DSL of the open places
+    without rewriting the whole widget on every edit.
+
+    Each location, rule and scene block is rendered once and cached until it
+    is invalidated. A redraw renders the document as a list of blocks,
+    skips the blocks shared with what is on screen at both ends, and only
+    replaces the lines in between. Redraws are coalesced: any number of
+    refresh() calls before Tk goes idle result in a single redraw.
+    `on_change` is called after every redraw that changed the widget.
+    """
+
+    def __init__(self, widget, get_places, on_change=None):
+        self.widget = widget
+        self.get_places = get_places
+        self.on_change = on_change
+        self.blocks = []        # block texts currently in the widget
+        self.line_counts = []
+        self.cache = {}         # id(obj) -> (obj, text)
+        self.pending = None
+
+    # -----------------------------
+    # Invalidation
+    # -----------------------------
+    def refresh(self, *changed):
+        """
+        Schedules a redraw. `changed` lists the Location, Rule and Scene
+        objects whose content changed; with no arguments every block is
+        rendered again.
+        """
+        if changed:
+            for obj in changed:
+                self.cache.pop(id(obj), None)
+        else:
+            self.cache.clear()
+        if self.pending is None:
+            self.pending = self.widget.after_idle(self.redraw)
+
+    def flush(self):
+        """Applies a scheduled redraw right away, e.g. before reading the widget."""
+        if self.pending is not None:
+            self.widget.after_cancel(self.pending)
+            self.redraw()
+
+    def text(self):
+        """The whole document, as generate_document_text() returns it, rendering only uncached blocks."""
+        return "".join(iter_document_blocks(self.get_places(), self._render))[:-1]
+
+    # -----------------------------
+    # Rendering
+    # -----------------------------
+    def _render(self, obj, render_func):
+        entry = self.cache.get(id(obj))
+        if entry is None or entry[0] is not obj:
+            count("preview.blocks_rendered")
+            entry = self.cache[id(obj)] = (obj, render_func(obj))
+        return entry[1]
+
+    @timed("preview.redraw")
+    def redraw(self):
+        self.pending = None
+        places = self.get_places()
+        new = list(iter_document_blocks(places, self._render))
+        if len(self.cache) > 2 * len(new):
+            # Drop the blocks of objects that are no longer in any place
+            live = {id(obj) for place in places for obj in place.locations + place.rules + place.scenes}
+            self.cache = {key: entry for key, entry in self.cache.items() if key in live}
+        old = self.blocks
+
+        # Blocks shared at the start and at the end of both documents
+        start = 0
+        limit = min(len(old), len(new))
+        while start < limit and (old[start] is new[start] or old[start] == new[start]):
+            start += 1
+        end = 0
+        limit -= start
+        while end < limit and (old[-1 - end] is new[-1 - end] or old[-1 - end] == new[-1 - end]):
+            end += 1
+        if start == len(old) == len(new):
+            return
+
+        new_counts = [text.count("\n") for text in new[start:len(new) - end]]
+        first_line = 1 + sum(self.line_counts[:start])
+        removed_lines = sum(self.line_counts[start:len(old) - end])
+
+        self.widget.config(state="normal")
+        self.widget.delete(f"{first_line}.0", f"{first_line + removed_lines}.0")
+        self.widget.insert(f"{first_line}.0", "".join(new[start:len(new) - end]))
+        self.widget.config(state="disabled")
+
+        self.blocks = new
+        self.line_counts[start:len(old) - end] = new_counts
+        if self.on_change is not None:
+            self.on_change()
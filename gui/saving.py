@@ -0,0 +1,178 @@
+import hashlib
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from dsl.snapshot import hash_file
+from runtime.instrumentation import timed
+
+
+def write_atomic(path, data):
+    """
+    Writes `data` (bytes) to `path` through a temporary file in the same
+    directory that replaces it once fully on disk, so a crash or a full disk
+    leaves either the old file or the new one, never a truncated mix.
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    try:
+        # Make the rename itself durable (not possible on every platform)
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@timed("save_file")
+def save_if_changed(path, text, known_hash=None):
+    """
+    Writes `text` to `path` unless the file already holds exactly that, and
+    returns (SHA-256 of the text, whether it was written). `known_hash` is
+    the hash of what the file is known to hold; when None the file is read
+    to find out.
+    """
+    data = text.encode("utf-8")
+    digest = hashlib.sha256(data).digest()
+    if known_hash is None:
+        try:
+            known_hash = hash_file(path)
+        except OSError:
+            pass
+    if digest == known_hash:
+        return digest, False
+    write_atomic(path, data)
+    return digest, True
+
+
+class BackgroundSaver:
+    """
+    Saves the document in a worker thread, so encoding, hashing and writing
+    a large file never block the Tk main loop.
+
+    save() takes the (path, text) to save from get_document() on the main
+    thread, where the model may be read safely, and hands it to the worker.
+    Saves run one at a time: one requested while another is running waits,
+    and a newer request replaces a waiting one, whose callbacks are then
+    called with the outcome of the newer save. A file whose content hash is
+    unchanged is not written again.
+
+    schedule() is for autosave: like BackgroundValidator.schedule() it
+    (re)starts a debounce timer, so a burst of edits is saved once, `delay`
+    ms after the last of them. The worker cannot call Tk, so its future is
+    polled from the main thread with after().
+    """
+
+    POLL_MS = 50
+
+    def __init__(self, widget, get_document, on_saved, delay=2000):
+        self.widget = widget
+        self.get_document = get_document   # returns (path, text), or None when there is nothing to save
+        self.on_saved = on_saved           # called with (path, written, error) after every save() without then
+        self.delay = delay
+        self.executor = None
+        self.timer = None
+        self.future = None
+        self.running = None     # (path, callbacks) of the save in the worker
+        self.waiting = None     # (path, text, callbacks) of the save to start once it is done
+        self.hashes = {}        # path -> SHA-256 of what this saver last found or wrote there
+
+    def schedule(self):
+        """Saves once no further schedule() call came in for `delay` ms."""
+        if self.timer is not None:
+            self.widget.after_cancel(self.timer)
+        self.timer = self.widget.after(self.delay, self.save)
+
+    def save(self, then=None):
+        """
+        Saves the current document now (in the background), then calls
+        then(path, written, error), or on_saved if `then` is None.
+        """
+        if self.timer is not None:
+            self.widget.after_cancel(self.timer)
+            self.timer = None
+        document = self.get_document()
+        if document is None:
+            return
+        path, text = document
+        callbacks = [then or self.on_saved]
+        if self.future is None:
+            self._start(path, text, callbacks)
+            return
+        if self.waiting is not None:
+            callbacks = self.waiting[2] + callbacks
+        self.waiting = (path, text, callbacks)
+
+    def flush(self):
+        """Starts a scheduled save right away, e.g. before the document it would save is replaced."""
+        if self.timer is not None:
+            self.save()
+
+    def forget(self, path=None):
+        """Drops the known hash of `path` (of every file if None), e.g. when it may have been changed elsewhere."""
+        if path is None:
+            self.hashes.clear()
+        else:
+            self.hashes.pop(path, None)
+
+    def _start(self, path, text, callbacks):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        self.future = self.executor.submit(save_if_changed, path, text, self.hashes.get(path))
+        self.running = (path, callbacks)
+        self.widget.after(self.POLL_MS, self._poll, self.future)
+
+    def _poll(self, future):
+        if future is not self.future:
+            return
+        if not future.done():
+            self.widget.after(self.POLL_MS, self._poll, future)
+            return
+        (path, callbacks), self.future, self.running = self.running, None, None
+        try:
+            digest, written = future.result()
+            self.hashes[path] = digest
+            error = None
+        except Exception as e:
+            # Whatever is on disk now is unknown
+            self.hashes.pop(path, None)
+            written, error = False, e
+        if self.waiting is not None:
+            waiting, self.waiting = self.waiting, None
+            self._start(*waiting)
+        for then in callbacks:
+            then(path, written, error)
+
+    def close(self):
+        """Writes a scheduled or waiting save right away and waits for the worker to finish."""
+        if self.timer is not None:
+            self.widget.after_cancel(self.timer)
+            self.timer = None
+            document = self.get_document()
+            if document is not None:
+                self.waiting = (*document, [])
+        if self.waiting is not None:
+            path, text, _ = self.waiting
+            self.waiting = None
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1)
+            self.executor.submit(save_if_changed, path, text, None)
+        self.future = self.running = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
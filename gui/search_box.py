@@ -0,0 +1,59 @@
+from tkinter import ttk
+
+
+class SearchCombobox(ttk.Combobox):
+    """
+    A Combobox to pick a device, location, rule or scene by typing part of
+    its name.
+
+    The drop-down list holds the matches for the text typed so far, as
+    returned by search(query, limit) (a list of (name, object) pairs, see
+    SearchIndex.search), rather than every name of the place. Return, or
+    leaving the box, completes the text to the best match and fires
+    <<ComboboxSelected>> like picking it from the list does (once per
+    completed text, so tabbing through the box does not fire it again).
+    """
+
+    def __init__(self, master, search, limit=50, **kwargs):
+        # The list is refreshed when opened too: the place may have changed since the last key
+        kwargs.setdefault("postcommand", self.update_matches)
+        super().__init__(master, **kwargs)
+        self.search = search
+        self.limit = limit
+        self.matches = []       # (name, object) pairs in the list
+        self.completed = None   # text complete() last fired <<ComboboxSelected>> for
+        self.bind("<KeyRelease>", self._on_key)
+        self.bind("<Return>", self.complete)
+        self.bind("<FocusOut>", self.complete)
+        self.update_matches()
+
+    def set_search(self, search):
+        """Searches with another function from now on (e.g. another location's devices) and clears the box."""
+        self.search = search
+        self.set("")
+        self.completed = None
+        self.update_matches()
+
+    def update_matches(self):
+        self.matches = self.search(self.get(), self.limit)
+        self["values"] = [name for name, _ in self.matches]
+
+    def selected(self):
+        """The object whose name is in the box, or None."""
+        text = self.get()
+        return next((obj for name, obj in self.matches if name == text), None)
+
+    def _on_key(self, event):
+        # Keys that move in or close the list keep it as it is
+        if event.keysym not in ("Up", "Down", "Return", "Escape", "Tab"):
+            self.update_matches()
+
+    def complete(self, event=None):
+        text = self.get()
+        if not text or not self.matches:
+            return
+        if self.selected() is None:
+            self.set(self.matches[0][0])
+        if self.get() != self.completed:
+            self.completed = self.get()
+            self.event_generate("<<ComboboxSelected>>")
@@ -0,0 +1,93 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from dsl.parallel import validate_places
+
+
+class BackgroundValidator:
+    """
+    Validates the DSL preview in a worker process, so the textX parse of a
+    large file never blocks the Tk main loop. The worker checks it with
+    validate_places(), place by place, as validate.py does.
+
+    schedule() (re)starts a debounce timer: a burst of edits is validated
+    once, `delay` ms after the last of them. Every run gets a new generation
+    number; a run still queued when a newer one is submitted is cancelled,
+    and the result of one already running is dropped. The worker cannot
+    call Tk, so its future is polled from the main thread with after().
+    """
+
+    POLL_MS = 50
+
+    def __init__(self, widget, get_text, on_result, delay=400):
+        self.widget = widget
+        self.get_text = get_text
+        self.on_result = on_result  # called with a list of (message, line, col), empty if valid
+        self.delay = delay
+        self.executor = None
+        self.generation = 0
+        self.timer = None
+        self.future = None
+        self.future_text = None
+        self.last = None            # (text, result) of the last finished run
+        self.waiting = []           # callbacks for the next result, see validate_now()
+
+    def schedule(self):
+        """Validates the text once no further schedule() call came in for `delay` ms."""
+        if self.timer is not None:
+            self.widget.after_cancel(self.timer)
+        self.timer = self.widget.after(self.delay, self.start)
+
+    def validate_now(self, then):
+        """Validates the current text without waiting for the debounce, then calls then(result)."""
+        if self.timer is not None:
+            self.widget.after_cancel(self.timer)
+            self.timer = None
+        if self.future is None and self.last is not None and self.last[0] == self.get_text():
+            then(self.last[1])
+            return
+        self.waiting.append(then)
+        if self.future is None or self.future_text != self.get_text():
+            self.start()
+
+    def start(self):
+        self.timer = None
+        text = self.get_text()
+        self.generation += 1
+        if self.future is not None:
+            self.future.cancel()
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=1)
+        self.future = self.executor.submit(validate_places, text, 1)
+        self.future_text = text
+        self.widget.after(self.POLL_MS, self._poll, self.generation, self.future)
+
+    def _poll(self, generation, future):
+        if generation != self.generation:
+            return  # a newer run superseded this one
+        if not future.done():
+            self.widget.after(self.POLL_MS, self._poll, generation, future)
+            return
+        text, self.future, self.future_text = self.future_text, None, None
+        try:
+            result = future.result()
+        except BrokenProcessPool as e:
+            self.executor = None
+            result = [(f"Validation worker failed: {e}", None, None)]
+        except Exception as e:
+            # Still a result: whoever waits for one (a save, a run) must hear back
+            result = [(f"Validation failed: {e}", None, None)]
+        self.last = (text, result)
+        self.on_result(result)
+        waiting, self.waiting = self.waiting, []
+        for then in waiting:
+            then(result)
+
+    def close(self):
+        if self.timer is not None:
+            self.widget.after_cancel(self.timer)
+            self.timer = None
+        self.generation += 1
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -1,6 +1,7 @@
 import tkinter as tk
 from gui.app import SmartHomeApp
 
-# Launch GUI
-app = SmartHomeApp()
-app.mainloop()
+# Launch GUI (guarded: validation worker processes import this module when they are spawned)
+if __name__ == "__main__":
+    app = SmartHomeApp()
+    app.mainloop()
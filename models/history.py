@@ -0,0 +1,228 @@
+"""
+Undo/redo history of model edits.
+
+Every edit the editor makes is an operation object that can apply and
+revert itself. An operation only holds references to the objects it
+touches plus the few values it overwrites (a device's old name, a list
+position), never a copy of the place, so a history entry costs the same
+on a ten-device house and on a 100k-device estate, and undoing or redoing
+it costs what the edit itself did.
+
+Operations are applied and reverted strictly in stack order, so the
+positions they record stay valid: when an operation is reverted, the
+model is exactly as it was right after it was applied.
+"""
+from collections import deque
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from models.models import Device, Location, Place, Rule, Scene
+
+
+def _position(items, obj):
+    # By identity, in C: list.index() would compare dataclasses field by field
+    # and match any equal-looking item. Raises ValueError if obj is not there.
+    if items and items[-1] is obj:
+        return len(items) - 1       # an undone append
+    return list(map(id, items)).index(id(obj))
+
+
+# -----------------------
+# Operations
+# -----------------------
+# Each has apply(), revert() and changed(), the objects to pass to
+# refresh_dsl_preview() after either.
+@dataclass(slots=True)
+class AddPlace:
+    places: List[Place]
+    place: Place
+
+    def apply(self):
+        self.places.append(self.place)
+
+    def revert(self):
+        del self.places[_position(self.places, self.place)]
+
+    def changed(self):
+        return (self.place,)
+
+
+@dataclass(slots=True)
+class AddLocation:
+    place: Place
+    location: Location
+    position: Optional[int] = None
+
+    def apply(self):
+        if self.position is None:
+            self.position = len(self.place.locations)
+        self.place.add_location(self.location, self.position)
+
+    def revert(self):
+        self.place.remove_location(self.location)
+
+    def changed(self):
+        return (self.location,)
+
+
+@dataclass(slots=True)
+class RemoveLocation:
+    place: Place
+    location: Location
+    position: Optional[int] = None
+
+    def apply(self):
+        self.position = _position(self.place.locations, self.location)
+        self.place.remove_location(self.location)
+
+    def revert(self):
+        self.place.add_location(self.location, self.position)
+
+    def changed(self):
+        return (self.location,)
+
+
+@dataclass(slots=True)
+class AddDevice:
+    location: Location
+    device: Device
+    position: Optional[int] = None
+
+    def apply(self):
+        if self.position is None:
+            self.position = len(self.location.devices)
+        self.location.add_device(self.device, self.position)
+
+    def revert(self):
+        self.location.remove_device(self.device)
+
+    def changed(self):
+        return (self.location,)
+
+
+@dataclass(slots=True)
+class RemoveDevice:
+    location: Location
+    device: Device
+    position: Optional[int] = None
+
+    def apply(self):
+        self.position = _position(self.location.devices, self.device)
+        self.location.remove_device(self.device)
+
+    def revert(self):
+        self.location.add_device(self.device, self.position)
+
+    def changed(self):
+        return (self.location,)
+
+
+@dataclass(slots=True)
+class EditDevice:
+    """Renames, retypes and/or moves a device; the old values are taken when applied."""
+    place: Place
+    device: Device
+    name: str
+    device_type: str
+    location: Location
+    # (name, device type, location, position in it) before the edit
+    old: Optional[Tuple[str, str, Optional[Location], Optional[int]]] = field(default=None, repr=False)
+
+    def apply(self):
+        device = self.device
+        location = device.location
+        position = _position(location.devices, device) if location is not None else None
+        self.old = (device.name, device.device_type, location, position)
+        self.place.update_device(device, name=self.name, device_type=self.device_type)
+        self.place.move_device(device, self.location)
+
+    def revert(self):
+        name, device_type, location, position = self.old
+        self.place.update_device(self.device, name=name, device_type=device_type)
+        if location is not None:
+            self.place.move_device(self.device, location, position)
+
+    def changed(self):
+        old_location = self.old[2] if self.old else None
+        if old_location is None or old_location is self.location:
+            return (self.location,)
+        return (old_location, self.location)
+
+
+@dataclass(slots=True)
+class AddRule:
+    place: Place
+    rule: Rule
+
+    def apply(self):
+        self.place.rules.append(self.rule)
+
+    def revert(self):
+        del self.place.rules[_position(self.place.rules, self.rule)]
+
+    def changed(self):
+        return (self.rule,)
+
+
+@dataclass(slots=True)
+class AddScene:
+    place: Place
+    scene: Scene
+
+    def apply(self):
+        self.place.scenes.append(self.scene)
+
+    def revert(self):
+        del self.place.scenes[_position(self.place.scenes, self.scene)]
+
+    def changed(self):
+        return (self.scene,)
+
+
+# -----------------------
+# History
+# -----------------------
+class History:
+    """
+    Undo and redo stacks of operations. do() applies an operation and
+    forgets whatever had been undone; only the last `limit` operations can
+    be undone.
+    """
+
+    def __init__(self, limit=1000):
+        self.done = deque(maxlen=limit)
+        self.undone = []
+
+    def do(self, operation):
+        operation.apply()
+        self.done.append(operation)
+        self.undone.clear()
+        return operation
+
+    def undo(self):
+        """Reverts the last operation and returns it, or returns None if there is nothing to undo."""
+        if not self.done:
+            return None
+        operation = self.done.pop()
+        operation.revert()
+        self.undone.append(operation)
+        return operation
+
+    def redo(self):
+        """Applies the last undone operation again and returns it, or returns None."""
+        if not self.undone:
+            return None
+        operation = self.undone.pop()
+        operation.apply()
+        self.done.append(operation)
+        return operation
+
+    def clear(self):
+        self.done.clear()
+        self.undone.clear()
+
+    def can_undo(self):
+        return bool(self.done)
+
+    def can_redo(self):
+        return bool(self.undone)
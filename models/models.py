@@ -1,22 +1,32 @@
 from dataclasses import dataclass, field
-from typing import List, Optional
-import uuid
+from random import getrandbits
+import sys
+from typing import Dict, List, Optional, Union
 
+from models.constants import DEVICE_CATEGORIES
 
-def uid() -> str:
-    return str(uuid.uuid4())
+
+def uid() -> int:
+    # Random 128-bit id, as unique as a UUID4 but stored as an int (44 bytes)
+    # instead of a 36-character string (85 bytes). getrandbits() also avoids
+    # the system call uuid.uuid4() makes per id.
+    return getrandbits(128)
 
 
 # -----------------------
 # Device
 # -----------------------
-@dataclass
+@dataclass(slots=True)
 class Device:
-    id: str = field(default_factory=uid)
+    id: int = field(default_factory=uid)
     name: str = ""
     device_type: str = ""
     location: Optional["Location"] = None  # Actual object reference
 
+    def __post_init__(self):
+        # A handful of type names shared by every device (update_device() interns renames)
+        self.device_type = sys.intern(self.device_type)
+
     def __str__(self):
         loc = self.location.name if self.location else "No Location"
         return f"{self.name} ({self.device_type}) @ {loc}"
@@ -25,18 +35,30 @@ class Device:
 # -----------------------
 # Location
 # -----------------------
-@dataclass
+@dataclass(slots=True)
 class Location:
-    id: str = field(default_factory=uid)
+    id: int = field(default_factory=uid)
     name: str = ""
     devices: List[Device] = field(default_factory=list)
+    # Set by Place.add_location(); keeps the place's device indexes up to date
+    place: Optional["Place"] = field(default=None, repr=False, compare=False)
 
-    def add_device(self, device: Device):
+    def add_device(self, device: Device, position: Optional[int] = None):
         device.location = self
-        self.devices.append(device)
+        if position is None:
+            self.devices.append(device)
+        else:
+            self.devices.insert(position, device)
+        if self.place is not None:
+            self.place._index_device(device)
 
     def remove_device(self, device: Device):
-        self.devices = [d for d in self.devices if d.id != device.id]
+        for i, d in enumerate(self.devices):
+            if d.id == device.id:
+                del self.devices[i]
+                if self.place is not None:
+                    self.place._unindex_device(d)
+                break
 
     def __str__(self):
         return self.name
@@ -45,9 +67,9 @@ class Location:
 # -----------------------
 # Rule
 # -----------------------
-@dataclass
+@dataclass(slots=True)
 class Rule:
-    id: str = field(default_factory=uid)
+    id: int = field(default_factory=uid)
     name: str = ""
     condition: str = ""  # DSL condition
     actions: List[str] = field(default_factory=list)
@@ -59,9 +81,9 @@ class Rule:
 # -----------------------
 # Scene
 # -----------------------
-@dataclass
+@dataclass(slots=True)
 class Scene:
-    id: str = field(default_factory=uid)
+    id: int = field(default_factory=uid)
     name: str = ""
     location: str = ""  # keep as a string for now; can convert later
     actions: List[str] = field(default_factory=list)
@@ -73,10 +95,161 @@ class Scene:
 # -----------------------
 # Place
 # -----------------------
-@dataclass
+def _index_remove(index, key, obj):
+    bucket = index.get(key)
+    if bucket is not None and bucket.pop(obj.id, None) is not None and not bucket:
+        del index[key]
+
+
+# Names are nearly always unique, so a name maps to its object, and to a list
+# of them only while several share it: a list per name took 64 bytes a device
+def _name_add(index, name, obj):
+    bucket = index.get(name)
+    if bucket is None:
+        index[name] = obj
+    elif type(bucket) is list:
+        bucket.append(obj)
+    else:
+        index[name] = [bucket, obj]
+
+
+def _name_remove(index, name, obj):
+    bucket = index.get(name)
+    if bucket is obj:
+        del index[name]
+    elif type(bucket) is list:
+        for i, other in enumerate(bucket):
+            if other is obj:
+                del bucket[i]
+                break
+        if len(bucket) == 1:
+            index[name] = bucket[0]
+
+
+def _name_first(index, name):
+    bucket = index.get(name)
+    return bucket[0] if type(bucket) is list else bucket
+
+
+@dataclass(slots=True)
 class Place:
+    """
+    A place and its locations, rules and scenes.
+
+    Locations and devices are indexed by id and by name, and devices by
+    device type. The indexes are kept up to date as long as locations and
+    devices are changed through add_location/remove_location,
+    Location.add_device/remove_device, update_device and move_device rather
+    than by editing the lists directly. Name indexes map a name to its
+    object, or to a list of them when the name is shared; the type index
+    maps to {id: object} buckets. Categories (DEVICE_CATEGORIES) are looked
+    up through the types they group.
+    """
     name: str
-    id: str = field(default_factory=uid)
+    id: int = field(default_factory=uid)
     locations: List[Location] = field(default_factory=list)
     rules: List[Rule] = field(default_factory=list)
     scenes: List[Scene] = field(default_factory=list)
+
+    locations_by_id: Dict[int, Location] = field(default_factory=dict, init=False, repr=False, compare=False)
+    locations_by_name: Dict[str, Union[Location, List[Location]]] = field(default_factory=dict, init=False, repr=False, compare=False)
+    devices_by_id: Dict[int, Device] = field(default_factory=dict, init=False, repr=False, compare=False)
+    devices_by_name: Dict[str, Union[Device, List[Device]]] = field(default_factory=dict, init=False, repr=False, compare=False)
+    devices_by_type: Dict[str, Dict[int, Device]] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        locations, self.locations = self.locations, []
+        for location in locations:
+            self.add_location(location)
+
+    # -----------------------------
+    # Locations
+    # -----------------------------
+    def add_location(self, location: Location, position: Optional[int] = None):
+        location.place = self
+        if position is None:
+            self.locations.append(location)
+        else:
+            self.locations.insert(position, location)
+        self.locations_by_id[location.id] = location
+        _name_add(self.locations_by_name, location.name, location)
+        for device in location.devices:
+            device.location = location
+        self._index_devices(location.devices)
+
+    def remove_location(self, location: Location):
+        loc = self.locations_by_id.get(location.id)
+        if loc is None:
+            return
+        # Found by identity, in C: list.index() would compare locations field by field
+        del self.locations[list(map(id, self.locations)).index(id(loc))]
+        del self.locations_by_id[loc.id]
+        _name_remove(self.locations_by_name, loc.name, loc)
+        for device in loc.devices:
+            self._unindex_device(device)
+        loc.place = None
+
+    def get_location(self, location_id: int) -> Optional[Location]:
+        return self.locations_by_id.get(location_id)
+
+    def find_location(self, name: str) -> Optional[Location]:
+        """The location with this name (the first one added, if several share it)."""
+        return _name_first(self.locations_by_name, name)
+
+    # -----------------------------
+    # Devices
+    # -----------------------------
+    def _index_device(self, device: Device):
+        self._index_devices((device,))
+
+    def _index_devices(self, devices):
+        # Runs for every device of every loaded file, hence the local names
+        by_id, by_name, by_type = self.devices_by_id, self.devices_by_name, self.devices_by_type
+        for device in devices:
+            device_id, name, device_type = device.id, device.name, device.device_type
+            by_id[device_id] = device
+            if name in by_name:
+                _name_add(by_name, name, device)
+            else:
+                by_name[name] = device
+            bucket = by_type.get(device_type)
+            if bucket is None:
+                by_type[device_type] = {device_id: device}
+            else:
+                bucket[device_id] = device
+
+    def _unindex_device(self, device: Device):
+        self.devices_by_id.pop(device.id, None)
+        _name_remove(self.devices_by_name, device.name, device)
+        _index_remove(self.devices_by_type, device.device_type, device)
+
+    def get_device(self, device_id: int) -> Optional[Device]:
+        return self.devices_by_id.get(device_id)
+
+    def find_device(self, name: str) -> Optional[Device]:
+        """The device with this name (the first one added, if several share it)."""
+        return _name_first(self.devices_by_name, name)
+
+    def devices_of_type(self, device_type: str) -> List[Device]:
+        return list(self.devices_by_type.get(device_type, {}).values())
+
+    def devices_in_category(self, category: str) -> List[Device]:
+        by_type = self.devices_by_type
+        return [device for device_type in DEVICE_CATEGORIES.get(category, ())
+                for device in by_type.get(device_type, {}).values()]
+
+    def update_device(self, device: Device, name: Optional[str] = None, device_type: Optional[str] = None):
+        """Renames and/or retypes a device of this place."""
+        self._unindex_device(device)
+        if name is not None:
+            device.name = name
+        if device_type is not None:
+            device.device_type = sys.intern(device_type)
+        self._index_device(device)
+
+    def move_device(self, device: Device, target: Location, position: Optional[int] = None):
+        if device.location is target:
+            return
+        if device.location is not None:
+            device.location.remove_device(device)
+        target.add_device(device, position)
@@ -0,0 +1,274 @@
+"""
+Type-ahead search over the names of a place's devices, locations, rules
+and scenes.
+
+Names are matched ignoring case, in three tiers:
+
+    prefix      names starting with the query, from a sorted name list
+    substring   names containing the query, from a trigram index: a name
+                contains the query only if it contains every trigram
+                (3-character slice) of it, so only names in the
+                intersection of the query's trigram sets are checked
+    fuzzy       when nothing else matched: names sharing most of the
+                query's trigrams, which tolerates a typo or two (queries
+                of 4+ characters)
+
+A tier is only searched if the previous ones found fewer than `limit`
+results, so the common case, a prefix, costs one binary search however
+many names there are. Substring matches are ranked shortest first, unless
+there are more than RANKED_CANDIDATES of them (a short, common query),
+in which case the first `limit` found are returned unranked. The trigram
+index, the costly part to build, is only built by the first query that
+needs it.
+
+The sorted list plays the part of a prefix trie: the names under a trie
+node are a contiguous slice of it, found by bisection, and it takes a
+fraction of the memory of a node per character.
+"""
+import bisect
+import heapq
+from collections import Counter
+from itertools import islice
+
+from models.models import Location, Place, Rule, Scene
+
+KINDS = ("device", "location", "rule", "scene")
+
+# Above this many substring candidates, results are not ranked, see above
+RANKED_CANDIDATES = 1000
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def display_name(obj):
+    # Rule names keep their quotes in the model
+    return obj.name.strip('"') if isinstance(obj, Rule) else obj.name
+
+
+class SearchIndex:
+    """
+    Names of arbitrary objects, each under a unique key and with a kind
+    ("device", "location", ...) queries can be restricted to. add()
+    replaces the entry of a key already indexed; both add() and remove()
+    only touch the entry's own name and trigrams.
+    """
+
+    def __init__(self):
+        self.entries = {}       # key -> (casefolded name, name, object, kind)
+        self.names = []         # sorted (casefolded name, key)
+        self.grams = None       # trigram -> set of keys, see _trigram_index()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def add(self, key, name, obj, kind=None):
+        folded = name.casefold()
+        old = self.entries.get(key)
+        if old is not None:
+            if old[0] == folded:
+                self.entries[key] = (folded, name, obj, kind)
+                return
+            self.remove(key)
+        self.entries[key] = (folded, name, obj, kind)
+        bisect.insort(self.names, (folded, key))
+        if self.grams is not None:
+            self._index_trigrams(key, folded)
+
+    def _index_trigrams(self, key, folded):
+        grams = self.grams
+        for gram in trigrams(folded):
+            bucket = grams.get(gram)
+            if bucket is None:
+                grams[gram] = {key}
+            else:
+                bucket.add(key)
+
+    def add_many(self, items):
+        """add() for many (key, name, object, kind) tuples at once; sorts the name list once."""
+        entries, new = self.entries, []
+        for key, name, obj, kind in items:
+            if key in entries:
+                self.add(key, name, obj, kind)
+                continue
+            folded = name.casefold()
+            entries[key] = (folded, name, obj, kind)
+            new.append((folded, key))
+            if self.grams is not None:
+                self._index_trigrams(key, folded)
+        self.names.extend(new)
+        self.names.sort()
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        folded = entry[0]
+        del self.names[bisect.bisect_left(self.names, (folded, key))]
+        if self.grams is not None:
+            for gram in trigrams(folded):
+                bucket = self.grams[gram]
+                bucket.discard(key)
+                if not bucket:
+                    del self.grams[gram]
+
+    def clear(self):
+        self.entries.clear()
+        self.names.clear()
+        self.grams = None
+
+    def _trigram_index(self):
+        if self.grams is None:
+            self.grams = {}
+            for key, entry in self.entries.items():
+                self._index_trigrams(key, entry[0])
+        return self.grams
+
+    # -----------------------------
+    # Queries
+    # -----------------------------
+    def with_prefix(self, prefix, kind=None):
+        """Keys whose name starts with `prefix` (casefolded), in name order."""
+        names, entries = self.names, self.entries
+        for i in range(bisect.bisect_left(names, (prefix,)), len(names)):
+            folded, key = names[i]
+            if not folded.startswith(prefix):
+                break
+            if kind is None or entries[key][3] == kind:
+                yield key
+
+    def search(self, query, kinds=None, accept=None, limit=20):
+        """
+        Up to `limit` (name, object) pairs matching `query`: prefix matches
+        in name order, then substring matches, or fuzzy matches if there
+        are none of either.
+        `kinds` restricts the kinds searched and `accept(object)` filters
+        the objects. An empty query lists names in order.
+        """
+        query = query.strip().casefold()
+        entries = self.entries
+        keys, seen = [], set()
+
+        def wanted(key):
+            entry = entries[key]
+            return (kinds is None or entry[3] in kinds) and (accept is None or accept(entry[2]))
+
+        for key in self.with_prefix(query):
+            if len(keys) == limit:
+                break
+            if wanted(key):
+                keys.append(key)
+                seen.add(key)
+
+        grams = trigrams(query)
+        if len(keys) < limit and grams:
+            index = self._trigram_index()
+            postings = sorted((index.get(gram, set()) for gram in grams), key=len)
+            candidates = postings[0].intersection(*postings[1:]) if len(postings) > 1 else postings[0]
+            found = (key for key in candidates if key not in seen and query in entries[key][0] and wanted(key))
+            if len(candidates) > RANKED_CANDIDATES:
+                found = list(islice(found, limit - len(keys)))
+            else:
+                found = heapq.nsmallest(limit - len(keys), found, key=lambda key: (len(entries[key][0]), key))
+            keys.extend(found)
+
+        if not keys and len(grams) > 1:
+            keys = self._fuzzy(grams, wanted, limit)
+
+        return [(entries[key][1], entries[key][2]) for key in keys]
+
+    def _fuzzy(self, grams, wanted, limit):
+        # A typo changes up to 3 trigrams, a swap of two characters 4. A name
+        # sharing at least `need` of the query's n trigrams has one of the
+        # n - need + 1 rarest of them, so only those sets are scanned.
+        need = max((len(grams) + 1) // 2, len(grams) - 4)
+        index = self._trigram_index()
+        postings = sorted((index.get(gram, set()) for gram in grams), key=len)
+        scan, rest = postings[:len(postings) - need + 1], postings[len(postings) - need + 1:]
+        counts = Counter()
+        for bucket in scan:
+            counts.update(bucket)
+        scored = []
+        for key, shared in counts.items():
+            for bucket in rest:
+                if key in bucket:
+                    shared += 1
+            if shared >= need and wanted(key):
+                scored.append((-shared, len(self.entries[key][0]), key))
+        return [key for _, _, key in heapq.nsmallest(limit, scored)]
+
+
+class PlaceIndex(SearchIndex):
+    """
+    A SearchIndex of one place's devices, locations, rules and scenes,
+    keyed by their ids, built when created and kept current by changed().
+    """
+
+    def __init__(self, place):
+        super().__init__()
+        self.place = place
+        self.location_devices = {}      # location id -> ids of its devices in the index
+        self.rebuild()
+
+    def rebuild(self):
+        self.clear()
+        self.location_devices.clear()
+        items = []
+        for location in self.place.locations:
+            items.append((location.id, location.name, location, "location"))
+            items.extend((device.id, device.name, device, "device") for device in location.devices)
+            self.location_devices[location.id] = {device.id for device in location.devices}
+        items.extend((rule.id, display_name(rule), rule, "rule") for rule in self.place.rules)
+        items.extend((scene.id, scene.name, scene, "scene") for scene in self.place.scenes)
+        self.add_many(items)
+
+    def changed(self, *objs):
+        """
+        Updates the index for the Location, Rule and Scene objects that were
+        added, removed or edited (a location covers its devices); with no
+        arguments the whole place is indexed again.
+        """
+        if not objs:
+            self.rebuild()
+            return
+        for obj in objs:
+            if isinstance(obj, Location):
+                self._sync_location(obj)
+            elif isinstance(obj, Rule):
+                self._sync_item(obj, self.place.rules, "rule")
+            elif isinstance(obj, Scene):
+                self._sync_item(obj, self.place.scenes, "scene")
+            elif isinstance(obj, Place) and obj is self.place:
+                self.rebuild()
+
+    def _sync_item(self, obj, items, kind):
+        # Rules and scenes have no back reference to their place; an undone one is no longer in its list
+        if any(item is obj for item in items):
+            self.add(obj.id, display_name(obj), obj, kind)
+        else:
+            self.remove(obj.id)
+
+    def _sync_location(self, location):
+        indexed = self.location_devices.pop(location.id, set())
+        if location.place is not self.place:
+            # Removed from the place, with its devices
+            self.remove(location.id)
+            current = set()
+        else:
+            self.add(location.id, location.name, location, "location")
+            current = set()
+            for device in location.devices:
+                current.add(device.id)
+                self.add(device.id, device.name, device, "device")
+            self.location_devices[location.id] = current
+        for device_id in indexed - current:
+            entry = self.entries.get(device_id)
+            # A device moved to another location of the place stays indexed under it
+            if entry is not None:
+                moved_to = entry[2].location
+                if moved_to is None or moved_to is location or moved_to.place is not self.place:
+                    self.remove(device_id)
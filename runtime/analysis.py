@@ -0,0 +1,236 @@
+"""
+Static analysis of a place's rules: conflicts and feedback loops.
+
+Conflicts
+    Two rules on the same trigger (detector device and functionality) whose
+    conditions can hold for the same reading, and whose actions send
+    contradictory commands to the same device: opposite commands
+    (OPPOSITE_COMMANDS) or the same command with different values
+    ("AC set_to_temperature 18" vs "... 22"). Messages and songs
+    (CONTENT_COMMANDS) are not settings: two rules announcing different
+    things do not contradict each other.
+
+Loops
+    A rule's action can change what detectors in the same location read
+    (COMMAND_EFFECTS, e.g. "AC turn_on" changes the temperature), which can
+    trigger rules listening to those detectors, whose actions can in turn
+    retrigger the first rule. The rules and the (location, functionality)
+    pairs they affect or listen to form a dependency graph; every strongly
+    connected component of it that contains a rule is a potential loop.
+
+Both passes are linear in the number of rules and actions, plus the number
+of conflicts reported.
+"""
+import heapq
+from collections import defaultdict, namedtuple
+
+from runtime.engine import CompiledRule
+
+OPPOSITE_COMMANDS = {
+    "turn_on": "turn_off", "turn_off": "turn_on",
+    "lock": "unlock", "unlock": "lock",
+    "activate": "deactivate", "deactivate": "activate",
+    "record": "stop", "stop": "record",
+}
+
+# Commands whose value is content to play rather than a state to set
+CONTENT_COMMANDS = frozenset({"announce", "play_music"})
+
+# (device type, command) -> functionalities of the same location it can change
+COMMAND_EFFECTS = {
+    ("AC", "turn_on"): ("temperature",),
+    ("AC", "turn_off"): ("temperature",),
+    ("AC", "set_to_temperature"): ("temperature",),
+    ("Light", "turn_on"): ("light",),
+    ("Light", "turn_off"): ("light",),
+    ("Alarm", "activate"): ("noise",),
+    ("SmartSpeaker", "play_music"): ("noise",),
+    ("SmartSpeaker", "announce"): ("noise",),
+}
+
+INFINITY = float("inf")
+
+# `first` and `second` are (Rule, action text) pairs
+Conflict = namedtuple("Conflict", ["trigger", "device", "first", "second"])
+# The rules of one strongly connected component, in rule order
+Loop = namedtuple("Loop", ["rules"])
+Analysis = namedtuple("Analysis", ["conflicts", "loops"])
+
+
+def _compiled_rules(place):
+    for rule in place.rules:
+        try:
+            yield CompiledRule(rule)
+        except ValueError:
+            pass  # reported by validation, nothing to analyse
+
+
+def _interval(condition):
+    """
+    Readings for which a condition holds, as (low, high) bounds that are each
+    a (value, inclusive) pair. Readings need not be integers, so "> 25" and
+    "< 26" overlap.
+    """
+    if condition.op is None or condition.value is None:
+        return (-INFINITY, False), (INFINITY, False)
+    if condition.op == ">":
+        return (condition.value, False), (INFINITY, False)
+    if condition.op == "<":
+        return (-INFINITY, False), (condition.value, False)
+    return (condition.value, True), (condition.value, True)
+
+
+def _ends_before(high, low):
+    """Whether a range with upper bound `high` ends before one with lower bound `low` starts."""
+    return high[0] < low[0] or (high[0] == low[0] and not (high[1] and low[1]))
+
+
+# -----------------------
+# Conflicts
+# -----------------------
+def find_conflicts(place):
+    """Returns a Conflict for every pair of rules that can send contradictory commands at once."""
+    # (trigger, device) -> [(low, high, command, value, rule, action text)]
+    buckets = defaultdict(list)
+    for compiled in _compiled_rules(place):
+        condition = compiled.condition
+        trigger = (condition.device, condition.functionality)
+        low, high = _interval(condition)
+        for action, text in zip(compiled.actions, compiled.rule.actions):
+            buckets[trigger, action.device].append((low, high, action.command, action.value, compiled.rule, text))
+
+    conflicts = []
+    for (trigger, device), items in buckets.items():
+        if len(items) > 1:
+            _sweep(trigger, device, items, conflicts)
+    return conflicts
+
+
+def _sweep(trigger, device, items, conflicts):
+    # Items are visited by increasing low end (an inclusive bound before an
+    # exclusive one at the same value); `active` holds those whose range
+    # still covers it, grouped by command and value, so each item is only
+    # compared with the items it actually conflicts with. `ending` orders
+    # upper bounds the same way, an exclusive one first.
+    items.sort(key=lambda item: (item[0][0], not item[0][1]))
+    active = defaultdict(dict)      # command -> {value: {seq: item}}
+    ending = []                     # heap of (high, seq, item)
+    for seq, item in enumerate(items):
+        low, high, command, value, rule, text = item
+        while ending and _ends_before(ending[0][0], low):
+            _, old_seq, old = heapq.heappop(ending)
+            by_value = active[old[2]]
+            del by_value[old[3]][old_seq]
+            if not by_value[old[3]]:
+                del by_value[old[3]]
+
+        found = []
+        for other in active.get(OPPOSITE_COMMANDS.get(command), {}).values():
+            found.extend(other.values())
+        if command not in CONTENT_COMMANDS:
+            for other_value, other in active.get(command, {}).items():
+                if other_value != value:
+                    found.extend(other.values())
+        for other in found:
+            if other[4] is not rule:
+                conflicts.append(Conflict(trigger, device, (other[4], other[5]), (rule, text)))
+
+        active[command].setdefault(value, {})[seq] = item
+        heapq.heappush(ending, (high, seq, item))
+
+
+# -----------------------
+# Loops
+# -----------------------
+def strongly_connected_components(graph):
+    """
+    Tarjan's algorithm, iteratively (rule graphs are deeper than the
+    recursion limit). `graph` maps each node to its successors; every
+    successor must also be a key. Returns the components as lists.
+    """
+    index, low, on_stack = {}, {}, set()
+    stack, components = [], []
+    counter = 0
+    for root in graph:
+        if root in index:
+            continue
+        work = [(root, iter(graph[root]))]
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, successors = work[-1]
+            for succ in successors:
+                if succ not in index:
+                    index[succ] = low[succ] = counter
+                    counter += 1
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(graph[succ])))
+                    break
+                if succ in on_stack and index[succ] < low[node]:
+                    low[node] = index[succ]
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    if low[node] < low[parent]:
+                        low[parent] = low[node]
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+def dependency_graph(place):
+    """
+    The rule dependency graph: rule ids point to the (location id,
+    functionality) pairs their actions change, and those pairs to the ids of
+    the rules triggered by a detector of that location and functionality.
+    Returns the graph and {rule id: Rule}.
+    """
+    graph, rules = {}, {}
+    listeners = defaultdict(list)
+    for compiled in _compiled_rules(place):
+        rule_key = ("rule", compiled.rule.id)
+        rules[rule_key] = compiled.rule
+        detector = place.find_device(compiled.condition.device)
+        if detector is not None and detector.location is not None:
+            listeners["effect", detector.location.id, compiled.condition.functionality].append(rule_key)
+        effects = graph[rule_key] = []
+        for action in compiled.actions:
+            device = place.find_device(action.device)
+            if device is None or device.location is None:
+                continue
+            for functionality in COMMAND_EFFECTS.get((device.device_type, action.command), ()):
+                effect_key = ("effect", device.location.id, functionality)
+                if effect_key not in effects:
+                    effects.append(effect_key)
+    for effects in list(graph.values()):
+        for effect_key in effects:
+            graph.setdefault(effect_key, listeners.get(effect_key, []))
+    return graph, rules
+
+
+def find_loops(place):
+    """Returns a Loop for every group of rules that can keep retriggering each other."""
+    graph, rules = dependency_graph(place)
+    order = {rule.id: i for i, rule in enumerate(place.rules)}
+    loops = []
+    for component in strongly_connected_components(graph):
+        # A component of one node has no cycle: rules never point to themselves directly
+        if len(component) > 1:
+            members = sorted((rules[key] for key in component if key in rules), key=lambda rule: order[rule.id])
+            loops.append(Loop(members))
+    return loops
+
+
+def analyze(place):
+    return Analysis(find_conflicts(place), find_loops(place))
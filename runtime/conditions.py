@@ -0,0 +1,82 @@
+import re
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+
+# -----------------------
+# Condition
+# -----------------------
+# A rule condition compiled once from its DSL text, e.g.
+# "Thermo detects temperature > 25" -> Condition("Thermo", "temperature", ">", 25).
+# `op` and `value` are None for plain event conditions ("Sensor detects movement").
+Condition = namedtuple("Condition", ["device", "functionality", "op", "value"])
+
+re_condition = re.compile(r"^\s*(\w+)\s+detects\s+(\w+)\s*(?:([<>=])\s*)?(-?\d+)?\s*$")
+
+
+def compile_condition(text):
+    m = re_condition.match(text)
+    if not m:
+        raise ValueError(f"Invalid rule condition: {text!r}")
+    device, functionality, op, value = m.groups()
+    return Condition(device, functionality, op, int(value) if value is not None else None)
+
+
+def is_threshold(condition):
+    return condition.op is not None and condition.value is not None
+
+
+# -----------------------
+# Threshold Index
+# -----------------------
+class _SortedThresholds:
+    __slots__ = ("keys", "items")
+
+    def __init__(self):
+        self.keys = []
+        self.items = []
+
+    def add(self, key, item):
+        # Equal thresholds keep insertion order (i.e. rule order)
+        pos = bisect_right(self.keys, key)
+        self.keys.insert(pos, key)
+        self.items.insert(pos, item)
+
+
+class ThresholdIndex:
+    """
+    Threshold rules of a single (device, functionality) pair, one sorted array
+    per comparison operator. `matching(reading)` bisects each array once, so a
+    reading resolves all triggered rules in O(log n + k).
+    """
+
+    def __init__(self):
+        self.gt = _SortedThresholds()
+        self.lt = _SortedThresholds()
+        self.eq = _SortedThresholds()
+
+    def add(self, condition, item):
+        if condition.op == ">":
+            self.gt.add(condition.value, item)
+        elif condition.op == "<":
+            self.lt.add(condition.value, item)
+        elif condition.op == "=":
+            self.eq.add(condition.value, item)
+        else:
+            raise ValueError(f"Unknown comparison operator: {condition.op!r}")
+
+    def matching(self, reading):
+        """Returns the items whose condition holds for the reading: '>' rules, then '<', then '='."""
+        # reading > threshold: every threshold strictly below the reading
+        found = self.gt.items[:bisect_left(self.gt.keys, reading)]
+        # reading < threshold: every threshold strictly above the reading
+        found += self.lt.items[bisect_right(self.lt.keys, reading):]
+        # reading = threshold
+        eq_keys = self.eq.keys
+        lo = bisect_left(eq_keys, reading)
+        if lo < len(eq_keys) and eq_keys[lo] == reading:
+            found += self.eq.items[lo:bisect_right(eq_keys, reading, lo)]
+        return found
+
+    def __len__(self):
+        return len(self.gt.keys) + len(self.lt.keys) + len(self.eq.keys)
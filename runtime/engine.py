@@ -0,0 +1,112 @@
+import sys
+from collections import defaultdict, namedtuple
+
+from runtime.conditions import ThresholdIndex, compile_condition, is_threshold
+
+
+# -----------------------
+# Events & Actions
+# -----------------------
+# A sensor event: `device` is the detector's name, `event` one of SENSOR_EVENTS
+# (or "temperature" for thermostats) and `value` the reading, if any.
+SensorEvent = namedtuple("SensorEvent", ["device", "event", "value"], defaults=[None])
+
+# A command to send to an actuator, e.g. Action("KitchenLight", "turn_on", None)
+Action = namedtuple("Action", ["device", "command", "value"])
+
+
+def parse_value(text):
+    if text.lstrip("-").isdigit():
+        return int(text)
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "\"'":
+        return text[1:-1]
+    return text
+
+
+def parse_action(text):
+    """Turns an action string such as 'Speaker announce "Hi"' into an Action."""
+    parts = text.split(maxsplit=2)
+    if len(parts) < 2:
+        raise ValueError(f"Invalid action: {text!r}")
+    value = parse_value(parts[2].strip()) if len(parts) == 3 else None
+    return Action(parts[0], sys.intern(parts[1]), value)
+
+
+# -----------------------
+# Compiled Rule
+# -----------------------
+class CompiledRule:
+    __slots__ = ("rule", "condition", "actions")
+
+    def __init__(self, rule, condition=None, actions=None):
+        # `condition` and `actions` may be given already compiled (e.g. from a snapshot)
+        self.rule = rule
+        self.condition = condition if condition is not None else compile_condition(rule.condition)
+        self.actions = tuple(actions) if actions is not None else tuple(parse_action(a) for a in rule.actions)
+
+
+# -----------------------
+# Rule Engine
+# -----------------------
+class RuleEngine:
+    """
+    Runs the rules of a Place against incoming sensor events.
+
+    Rules are compiled once and indexed by (detector device, functionality),
+    so dispatching an event only looks at the rules that listen to it.
+    Threshold rules ("detects temperature > 25") live in a ThresholdIndex per
+    key, so a reading only visits the rules it actually triggers.
+    """
+
+    def __init__(self, place, compiled=None):
+        """
+        `compiled` optionally replaces place.rules with a list holding, for
+        each rule, its CompiledRule (e.g. from a snapshot) or the Rule itself
+        to compile it here.
+        """
+        self.place = place
+        self.index = defaultdict(list)
+        self.thresholds = defaultdict(ThresholdIndex)
+        for rule in compiled if compiled is not None else place.rules:
+            if isinstance(rule, CompiledRule):
+                self.add_compiled(rule)
+            else:
+                self.add_rule(rule)
+
+    def add_rule(self, rule):
+        return self.add_compiled(CompiledRule(rule))
+
+    def add_compiled(self, compiled):
+        condition = compiled.condition
+        key = (condition.device, condition.functionality)
+        if is_threshold(condition):
+            self.thresholds[key].add(condition, compiled)
+        else:
+            self.index[key].append(compiled)
+        return compiled
+
+    def dispatch(self, event):
+        """
+        Returns the actions fired by a single event. Plain rules fire in rule
+        order, followed by the threshold rules matched by the event's value.
+        """
+        key = (event.device, event.event)
+        fired = []
+        rules = self.index.get(key)
+        if rules:
+            for compiled in rules:
+                fired.extend(compiled.actions)
+        if event.value is not None:
+            thresholds = self.thresholds.get(key)
+            if thresholds is not None:
+                for compiled in thresholds.matching(event.value):
+                    fired.extend(compiled.actions)
+        return fired
+
+    def run(self, events):
+        """Dispatches every event and yields (event, actions) for those that fired."""
+        dispatch = self.dispatch
+        for event in events:
+            actions = dispatch(event)
+            if actions:
+                yield event, actions
@@ -0,0 +1,174 @@
+"""
+Lightweight timers and counters for the editor's hot paths.
+
+Disabled by default; timed() functions then only pay one flag check per
+call, and timer() returns a shared no-op context manager. Enable it with the
+SMARTHOME_INSTRUMENT environment variable (or enable()):
+
+    SMARTHOME_INSTRUMENT=stats        timers and counters only
+    SMARTHOME_INSTRUMENT=cprofile     plus a cProfile capture (<file>.prof)
+    SMARTHOME_INSTRUMENT=tracemalloc  plus the top allocation sites
+
+An unknown mode in the variable is reported on stderr and ignored.
+
+The aggregated stats are written as JSON when the process exits, to
+SMARTHOME_INSTRUMENT_FILE (default "smarthome-stats-{pid}.json"; "{pid}" is
+replaced by the process id). Only the process that enabled instrumentation
+writes a file: worker pools exit without running exit handlers.
+"""
+import atexit
+import functools
+import json
+import os
+import sys
+import time
+
+MODES = ("stats", "cprofile", "tracemalloc")
+DEFAULT_OUTPUT = "smarthome-stats-{pid}.json"
+
+ENABLED = False
+_mode = None
+_output = None
+_profiler = None
+_started = None
+
+timers = {}     # name -> [calls, total seconds, max seconds]
+counters = {}   # name -> count
+
+
+# -----------------------
+# Recording
+# -----------------------
+def record(name, seconds):
+    stat = timers.get(name)
+    if stat is None:
+        timers[name] = [1, seconds, seconds]
+    else:
+        stat[0] += 1
+        stat[1] += seconds
+        if seconds > stat[2]:
+            stat[2] = seconds
+
+
+def count(name, n=1):
+    if ENABLED:
+        counters[name] = counters.get(name, 0) + n
+
+
+def timed(name=None):
+    """Decorator timing every call of a function under `name` (default: its qualified name)."""
+    def decorate(func):
+        label = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(label, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_TIMER = _NoTimer()
+
+
+def timer(name):
+    """Context manager timing a block under `name`."""
+    return _Timer(name) if ENABLED else _NO_TIMER
+
+
+# -----------------------
+# Control
+# -----------------------
+def enable(mode="stats", output=None):
+    """Starts recording (and profiling, for the cprofile and tracemalloc modes); dumps on exit."""
+    global ENABLED, _mode, _output, _profiler, _started
+    if mode not in MODES:
+        raise ValueError(f"Unknown instrumentation mode {mode!r}, expected one of {', '.join(MODES)}")
+    if ENABLED:
+        return
+    ENABLED, _mode, _started = True, mode, time.perf_counter()
+    _output = (output or DEFAULT_OUTPUT).replace("{pid}", str(os.getpid()))
+    if mode == "cprofile":
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    elif mode == "tracemalloc":
+        import tracemalloc
+        tracemalloc.start(25)
+    atexit.register(dump)
+
+
+def stats():
+    """The aggregated timers and counters as a JSON-friendly dict."""
+    return {
+        "timers": {name: {"calls": calls, "total": round(total, 6), "mean": round(total / calls, 6),
+                          "max": round(longest, 6)}
+                   for name, (calls, total, longest) in sorted(timers.items(), key=lambda item: -item[1][1])},
+        "counters": dict(sorted(counters.items())),
+    }
+
+
+def dump(path=None):
+    """Writes the stats (and the profile or allocation sites) to `path` or the configured file."""
+    path = path or _output or DEFAULT_OUTPUT.replace("{pid}", str(os.getpid()))
+    report = {"pid": os.getpid(), "mode": _mode,
+              "wall": round(time.perf_counter() - _started, 3) if _started else None}
+    report.update(stats())
+    if _mode == "cprofile" and _profiler is not None:
+        _profiler.disable()
+        profile_path = os.path.splitext(path)[0] + ".prof"
+        _profiler.dump_stats(profile_path)
+        report["profile"] = profile_path
+    elif _mode == "tracemalloc":
+        import tracemalloc
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:30]
+            report["memory"] = {"current": current, "peak": peak,
+                                "top": [{"where": str(stat.traceback), "size": stat.size, "count": stat.count}
+                                        for stat in top]}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def reset():
+    timers.clear()
+    counters.clear()
+
+
+if os.environ.get("SMARTHOME_INSTRUMENT"):
+    # Every entry point imports this module: a bad setting must not stop them from starting
+    try:
+        enable(os.environ["SMARTHOME_INSTRUMENT"], os.environ.get("SMARTHOME_INSTRUMENT_FILE"))
+    except ValueError as e:
+        print(f"SMARTHOME_INSTRUMENT ignored: {e}", file=sys.stderr)
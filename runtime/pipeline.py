@@ -0,0 +1,220 @@
+import asyncio
+from dataclasses import dataclass, asdict
+
+
+# -----------------------
+# Actuators
+# -----------------------
+class Actuator:
+    """
+    Sends commands to real devices. `execute` receives a batch of Actions that
+    all target the same device, in the order they were fired.
+    """
+
+    async def execute(self, device, actions):
+        raise NotImplementedError
+
+
+class FakeActuator(Actuator):
+    """In-memory actuator that records every batch; optionally slow per device."""
+
+    def __init__(self, delay=0.0, delays=None):
+        self.delay = delay
+        self.delays = delays or {}
+        self.calls = []
+
+    async def execute(self, device, actions):
+        delay = self.delays.get(device, self.delay)
+        if delay:
+            await asyncio.sleep(delay)
+        self.calls.append((device, list(actions)))
+
+    @property
+    def actions(self):
+        return [action for _, batch in self.calls for action in batch]
+
+
+# -----------------------
+# Metrics
+# -----------------------
+@dataclass
+class PipelineMetrics:
+    events_submitted: int = 0
+    events_processed: int = 0
+    events_rejected: int = 0      # submit_nowait() on a full queue
+    event_errors: int = 0         # events whose handling raised
+    state_errors: int = 0         # failures to record a reading or action in the device states
+    blocked_submits: int = 0      # submit() had to wait for room
+    blocked_actions: int = 0      # an event worker had to wait for room in a device's action queue
+    actions_dispatched: int = 0
+    batches: int = 0
+    actuator_errors: int = 0
+    max_event_backlog: int = 0
+    max_action_backlog: int = 0
+
+    def as_dict(self):
+        return asdict(self)
+
+
+# -----------------------
+# Event Pipeline
+# -----------------------
+class EventPipeline:
+    """
+    Feeds sensor events through a RuleEngine and sends the fired actions to an
+    Actuator without letting slow devices hold up event handling.
+
+    - Events go into bounded queues sharded by device, so events from one
+      device are always handled in order by the same worker, and producers are
+      slowed down (backpressure) once a shard is full.
+    - Fired actions are queued per target device. Each device has its own
+      dispatcher that sends whatever is waiting as one batch, so a slow
+      `Camera record` only delays that camera's commands. These queues are
+      bounded by `maxsize` too: once a device is that far behind, the event
+      worker firing at it waits, and the wait reaches producers through the
+      event queues.
+
+    If `states` (a DeviceStates, see runtime/state.py) is given, it records
+    every temperature reading and the effect of every action sent.
+    """
+
+    def __init__(self, engine, actuator, workers=4, maxsize=1000, batch_size=32, states=None):
+        self.engine = engine
+        self.actuator = actuator
+        self.states = states
+        self.workers = workers
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.metrics = PipelineMetrics()
+        self._event_queues = []
+        self._action_queues = {}
+        self._tasks = []
+        self._running = False
+
+    async def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._event_queues = [asyncio.Queue(self.maxsize) for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._event_worker(q)) for q in self._event_queues]
+
+    async def stop(self):
+        """Waits until every queued event and action is handled, then stops the workers."""
+        await self.drain()
+        self._running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._action_queues = {}
+
+    async def drain(self):
+        for queue in self._event_queues:
+            await queue.join()
+        for queue in list(self._action_queues.values()):
+            await queue.join()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    # -----------------------------
+    # Ingestion
+    # -----------------------------
+    def _shard(self, event):
+        if not self._running:
+            raise RuntimeError("pipeline not started")
+        return self._event_queues[hash(event.device) % len(self._event_queues)]
+
+    def _track_event_backlog(self, queue):
+        if queue.qsize() > self.metrics.max_event_backlog:
+            self.metrics.max_event_backlog = queue.qsize()
+
+    async def submit(self, event):
+        """Queues an event, waiting for room if its shard is full. The pipeline must be started."""
+        queue = self._shard(event)
+        if queue.full():
+            self.metrics.blocked_submits += 1
+        await queue.put(event)
+        self.metrics.events_submitted += 1
+        self._track_event_backlog(queue)
+
+    def submit_nowait(self, event):
+        """Queues an event or raises asyncio.QueueFull if its shard is full. The pipeline must be started."""
+        queue = self._shard(event)
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.metrics.events_rejected += 1
+            raise
+        self.metrics.events_submitted += 1
+        self._track_event_backlog(queue)
+
+    async def _event_worker(self, queue):
+        while True:
+            event = await queue.get()
+            if self.states is not None:
+                try:
+                    self.states.observe(event)
+                except Exception:
+                    # e.g. a failing listener; the event is still handled
+                    self.metrics.state_errors += 1
+            try:
+                for action in self.engine.dispatch(event):
+                    await self._queue_action(action)
+                self.metrics.events_processed += 1
+            except Exception:
+                # One bad event must not stop the shard; drain() waits on it
+                self.metrics.event_errors += 1
+            finally:
+                queue.task_done()
+
+    # -----------------------------
+    # Action dispatch
+    # -----------------------------
+    async def _queue_action(self, action):
+        queue = self._action_queues.get(action.device)
+        if queue is None:
+            queue = self._action_queues[action.device] = asyncio.Queue(self.maxsize)
+            self._tasks.append(asyncio.create_task(self._device_dispatcher(action.device, queue)))
+        if queue.full():
+            self.metrics.blocked_actions += 1
+        await queue.put(action)
+        if queue.qsize() > self.metrics.max_action_backlog:
+            self.metrics.max_action_backlog = queue.qsize()
+
+    async def _device_dispatcher(self, device, queue):
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await self.actuator.execute(device, batch)
+                self.metrics.actions_dispatched += len(batch)
+                self.metrics.batches += 1
+            except Exception:
+                self.metrics.actuator_errors += 1
+            else:
+                if self.states is not None:
+                    self._record_actions(batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    def _record_actions(self, batch):
+        # Separate from the actuator's errors: the device did accept the batch
+        for action in batch:
+            try:
+                self.states.apply(action)
+            except Exception:
+                self.metrics.state_errors += 1
+
+    def backlog(self):
+        """Current queue depths: events waiting per shard and actions waiting per device."""
+        return {
+            "events": [q.qsize() for q in self._event_queues],
+            "actions": {device: q.qsize() for device, q in self._action_queues.items() if q.qsize()},
+        }
@@ -0,0 +1,149 @@
+"""
+Scene execution.
+
+A scene's actions are parsed once into a ScenePlan: one batch per target
+device, in order of first use, with redundant commands collapsed (a later
+command of the same kind replaces an earlier one on the same device, so
+"Light turn_on" then "Light turn_off" only sends turn_off). Running a scene
+sends every device's batch through an Actuator concurrently, at most
+`concurrency` devices at a time, so a scene over 200 independent devices
+takes about one device round-trip rather than 200.
+"""
+import asyncio
+import time
+from collections import namedtuple
+from dataclasses import asdict, dataclass
+
+from runtime.engine import parse_action
+
+# Commands that set a device state; within one device and scene only the
+# last command of each kind matters. Others (announce, send_alert) are
+# one-off events and are always sent.
+COMMAND_KINDS = {
+    "turn_on": "power", "turn_off": "power",
+    "lock": "lock", "unlock": "lock",
+    "activate": "alarm", "deactivate": "alarm",
+    "record": "recording", "stop": "recording",
+    "set_to_temperature": "temperature",
+    "play_music": "music",
+}
+
+# `batches` is a tuple of (device, tuple of Actions); `collapsed` the number
+# of actions dropped because a later one overrides them.
+ScenePlan = namedtuple("ScenePlan", ["scene", "batches", "collapsed"])
+
+# `errors` lists (device, exception) for the batches the actuator failed on
+SceneResult = namedtuple("SceneResult", ["scene", "latency", "batches", "actions", "errors"])
+
+
+def plan_scene(scene):
+    """Parses and groups the actions of a scene. Raises ValueError on an invalid action."""
+    by_device = {}
+    for text in scene.actions:
+        action = parse_action(text)
+        by_device.setdefault(action.device, []).append(action)
+
+    batches, collapsed = [], 0
+    for device, actions in by_device.items():
+        # Keep the last action of each state kind, in the order the kept actions were given
+        last = {}
+        for i, action in enumerate(actions):
+            kind = COMMAND_KINDS.get(action.command)
+            if kind is not None:
+                last[kind] = i
+        kept = tuple(action for i, action in enumerate(actions)
+                     if COMMAND_KINDS.get(action.command) is None or last[COMMAND_KINDS[action.command]] == i)
+        collapsed += len(actions) - len(kept)
+        batches.append((device, kept))
+    return ScenePlan(scene, tuple(batches), collapsed)
+
+
+@dataclass
+class SceneMetrics:
+    runs: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+    last_latency: float = 0.0
+    state_errors: int = 0   # actions accepted by a device but not recorded in the device states
+
+    def as_dict(self):
+        return asdict(self)
+
+
+class SceneExecutor:
+    """
+    Runs scenes through an Actuator (see runtime/pipeline.py).
+
+    Plans are cached per scene object; call invalidate() after changing a
+    scene's actions. `metrics` maps each scene name to its SceneMetrics.
+    If `states` (a DeviceStates, see runtime/state.py) is given, it records
+    the effect of every batch the actuator accepted.
+    """
+
+    def __init__(self, actuator, concurrency=256, states=None):
+        self.actuator = actuator
+        self.concurrency = concurrency
+        self.states = states
+        self.plans = {}         # id(scene) -> ScenePlan
+        self.metrics = {}       # scene name -> SceneMetrics
+        self._semaphore = None
+        self._loop = None
+
+    def plan(self, scene):
+        plan = self.plans.get(id(scene))
+        if plan is None or plan.scene is not scene:
+            plan = self.plans[id(scene)] = plan_scene(scene)
+        return plan
+
+    def invalidate(self, scene=None):
+        if scene is None:
+            self.plans.clear()
+        else:
+            self.plans.pop(id(scene), None)
+
+    def _limit(self):
+        # The semaphore is shared by every scene running on the same event loop
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def run(self, scene):
+        """Activates a scene and returns its SceneResult."""
+        plan = self.plan(scene)
+        limit = self._limit()
+
+        async def send(device, actions):
+            async with limit:
+                await self.actuator.execute(device, actions)
+
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(*(send(device, actions) for device, actions in plan.batches),
+                                        return_exceptions=True)
+        latency = time.perf_counter() - start
+
+        errors = [(device, outcome) for (device, _), outcome in zip(plan.batches, outcomes)
+                  if isinstance(outcome, Exception)]
+        metrics = self.metrics.get(scene.name)
+        if metrics is None:
+            metrics = self.metrics[scene.name] = SceneMetrics()
+        metrics.runs += 1
+        if self.states is not None:
+            # Only the batches the devices accepted; a failure here is not the device's
+            for (_, actions), outcome in zip(plan.batches, outcomes):
+                if not isinstance(outcome, Exception):
+                    for action in actions:
+                        try:
+                            self.states.apply(action)
+                        except Exception:
+                            metrics.state_errors += 1
+        metrics.total_latency += latency
+        metrics.max_latency = max(metrics.max_latency, latency)
+        metrics.last_latency = latency
+        return SceneResult(scene, latency, len(plan.batches),
+                           sum(len(actions) for _, actions in plan.batches), errors)
+
+    def run_sync(self, scene):
+        """run() for callers outside an event loop."""
+        return asyncio.run(self.run(scene))
@@ -0,0 +1,295 @@
+"""
+Current state of every device of a place, in typed columns.
+
+Devices are numbered 0..n-1 (their index). Each attribute is one array
+holding a value per device: booleans (a light is on, a lock locked) are
+signed bytes, temperatures 16-bit ints, and a device type that lacks an
+attribute simply never sets it. Reading or writing a state is an array
+access, and a million devices take a byte per boolean attribute and two
+per temperature attribute, about 9 MB in all, instead of a dict per
+device. snapshot() and restore() copy the columns in bulk.
+
+    attribute            column   device types   set by
+    on                   bool     Light, AC      turn_on / turn_off
+    locked               bool     Lock           lock / unlock
+    active               bool     Alarm          activate / deactivate
+    recording            bool     Camera         record / stop
+    target_temperature   int16    AC             set_to_temperature
+    temperature          int16    Thermostat     temperature readings
+
+A state nothing has set yet is unknown: get() returns None for it.
+Temperatures are whole degrees: a float is rounded to the nearest one
+(halves to even, as round() does). Values that are not numbers, or that
+fall outside the int16 range, are rejected.
+
+Snapshot layout (little-endian): header (magic, version, device count),
+uint8[count] device type codes, then every column in ATTRIBUTES order.
+"""
+import struct
+import sys
+from array import array
+
+from models.constants import DEVICE_TYPES
+
+MAGIC = b"SHLSTATE"
+VERSION = 1
+HEADER = struct.Struct("<8sHI")
+
+# Stored for states that are not known yet
+UNKNOWN = -1
+UNKNOWN_TEMPERATURE = -2 ** 15
+TEMPERATURE_MIN, TEMPERATURE_MAX = -2 ** 15 + 1, 2 ** 15 - 1
+
+# attribute -> (array typecode, unknown value, device types having it)
+ATTRIBUTES = {
+    "on": ("b", UNKNOWN, ("Light", "AC")),
+    "locked": ("b", UNKNOWN, ("Lock",)),
+    "active": ("b", UNKNOWN, ("Alarm",)),
+    "recording": ("b", UNKNOWN, ("Camera",)),
+    "target_temperature": ("h", UNKNOWN_TEMPERATURE, ("AC",)),
+    "temperature": ("h", UNKNOWN_TEMPERATURE, ("Thermostat",)),
+}
+
+# command -> (attribute, value); None takes the value from the action
+COMMANDS = {
+    "turn_on": ("on", True), "turn_off": ("on", False),
+    "lock": ("locked", True), "unlock": ("locked", False),
+    "activate": ("active", True), "deactivate": ("active", False),
+    "record": ("recording", True), "stop": ("recording", False),
+    "set_to_temperature": ("target_temperature", None),
+}
+
+# Device type codes: 0 for a type this module does not know
+TYPE_CODES = {device_type: code for code, device_type in enumerate(DEVICE_TYPES, 1)}
+
+
+class StateError(Exception):
+    pass
+
+
+def _temperature(value):
+    # bool is an int, but True is not a temperature
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"Temperature is not a number: {value!r}")
+    try:
+        value = round(value) if isinstance(value, float) else value
+    except (ValueError, OverflowError):
+        raise ValueError(f"Temperature is not a number: {value!r}") from None
+    if not TEMPERATURE_MIN <= value <= TEMPERATURE_MAX:
+        raise ValueError(f"Temperature out of range: {value!r}")
+    return value
+
+
+class DeviceStates:
+    """
+    The states of a fixed list of devices, by device index.
+
+    Listeners added with subscribe() are called as listener(index,
+    attribute, old, new) after every set() that changed a value (None
+    standing for unknown), and once as listener(None, None, None, None)
+    after restore() and reset(), when any state may have changed.
+
+    `names`, if given, lists the device names in index order, so that
+    index() and apply() can find a device by name, as rule actions and
+    sensor events name them. A name used by several devices resolves to
+    the first. apply() and observe() never raise for a value they cannot
+    store, which would come from outside; they skip it and count it in
+    `rejected`.
+    """
+
+    def __init__(self, device_types, names=None):
+        self.types = array("B", (TYPE_CODES.get(device_type, 0) for device_type in device_types))
+        self.columns = {attribute: array(code, [unknown]) * len(self.types)
+                        for attribute, (code, unknown, _) in ATTRIBUTES.items()}
+        # attribute -> 256 flags, the type codes that have it
+        self.supported = {attribute: bytes(code in {TYPE_CODES[t] for t in types} for code in range(256))
+                          for attribute, (_, _, types) in ATTRIBUTES.items()}
+        self.indexes = None
+        if names is not None:
+            self.indexes = {}
+            for i, name in enumerate(names):
+                self.indexes.setdefault(name, i)
+        self.listeners = []
+        self.rejected = 0       # values apply() and observe() could not store
+
+    @classmethod
+    def for_place(cls, place):
+        """States of every device of a place, indexed in location order."""
+        devices = [device for location in place.locations for device in location.devices]
+        return cls([device.device_type for device in devices], [device.name for device in devices])
+
+    def __len__(self):
+        return len(self.types)
+
+    def index(self, name):
+        """The index of the device called `name`; KeyError if there is none."""
+        if self.indexes is None:
+            raise KeyError(name)
+        return self.indexes[name]
+
+    def nbytes(self):
+        """Bytes held by the type codes and state columns (not the name index)."""
+        return sum(column.itemsize * len(column) for column in self.columns.values()) + len(self.types)
+
+    # -----------------------------
+    # Reading
+    # -----------------------------
+    def get(self, index, attribute):
+        """The state of a device, True/False or an int, or None when unknown or not applicable."""
+        code, unknown, _ = ATTRIBUTES[attribute]
+        value = self.columns[attribute][index]
+        if value == unknown:
+            return None
+        return bool(value) if code == "b" else value
+
+    def state(self, index):
+        """The known states of a device, as {attribute: value}."""
+        state = {}
+        type_code = self.types[index]
+        for attribute in ATTRIBUTES:
+            if self.supported[attribute][type_code]:
+                value = self.get(index, attribute)
+                if value is not None:
+                    state[attribute] = value
+        return state
+
+    def column(self, attribute):
+        """The array of an attribute, for bulk reads (unknown states hold UNKNOWN or UNKNOWN_TEMPERATURE)."""
+        return self.columns[attribute]
+
+    # -----------------------------
+    # Writing
+    # -----------------------------
+    def set(self, index, attribute, value):
+        """
+        Sets a device's state (None makes it unknown) and returns whether it
+        changed. Raises ValueError if the device's type has no such
+        attribute or the value is not a valid temperature (see above).
+        """
+        code, unknown, _ = ATTRIBUTES[attribute]
+        if not self.supported[attribute][self.types[index]]:
+            raise ValueError(f"Device {index} has no {attribute!r} state")
+        if value is None:
+            stored = unknown
+        elif code == "b":
+            stored = 1 if value else 0
+        else:
+            stored = _temperature(value)
+        column = self.columns[attribute]
+        old = column[index]
+        if old == stored:
+            return False
+        column[index] = stored
+        if self.listeners:
+            old = None if old == unknown else (bool(old) if code == "b" else old)
+            new = None if value is None else (bool(stored) if code == "b" else stored)
+            for listener in self.listeners:
+                listener(index, attribute, old, new)
+        return True
+
+    def apply(self, action):
+        """
+        Records the effect of an Action sent to a device (see
+        runtime/engine.py) and returns whether a state changed. Commands that
+        change no state (announce, play_music, send_alert) and devices not
+        in this store are ignored, as are values that cannot be stored.
+        """
+        effect = COMMANDS.get(action.command)
+        if effect is None or self.indexes is None:
+            return False
+        index = self.indexes.get(action.device)
+        if index is None:
+            return False
+        attribute, value = effect
+        if not self.supported[attribute][self.types[index]]:
+            return False
+        return self._record(index, attribute, action.value if value is None else value)
+
+    def observe(self, event):
+        """
+        Records a thermostat's temperature reading from a SensorEvent and
+        returns whether it changed. Readings that cannot be stored are
+        ignored.
+        """
+        if event.event != "temperature" or event.value is None or self.indexes is None:
+            return False
+        index = self.indexes.get(event.device)
+        if index is None or not self.supported["temperature"][self.types[index]]:
+            return False
+        return self._record(index, "temperature", event.value)
+
+    def _record(self, index, attribute, value):
+        try:
+            return self.set(index, attribute, value)
+        except ValueError:
+            self.rejected += 1
+            return False
+
+    def reset(self):
+        """Makes every state unknown."""
+        for attribute, (_, unknown, _) in ATTRIBUTES.items():
+            column = self.columns[attribute]
+            column[:] = array(column.typecode, [unknown]) * len(column)
+        self._notify_all()
+
+    # -----------------------------
+    # Notifications
+    # -----------------------------
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+        return listener
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def _notify_all(self):
+        for listener in self.listeners:
+            listener(None, None, None, None)
+
+    # -----------------------------
+    # Snapshots
+    # -----------------------------
+    def snapshot(self):
+        """Every state as bytes, for restore() on a store of the same devices."""
+        parts = [HEADER.pack(MAGIC, VERSION, len(self.types)), self.types.tobytes()]
+        for attribute in ATTRIBUTES:
+            column = self.columns[attribute]
+            if sys.byteorder != "little" and column.itemsize > 1:
+                column = array(column.typecode, column)
+                column.byteswap()
+            parts.append(column.tobytes())
+        return b"".join(parts)
+
+    def restore(self, data):
+        """
+        Replaces every state with those of a snapshot(). Raises StateError if
+        it is not a snapshot of the same number and types of devices.
+        """
+        if len(data) < HEADER.size:
+            raise StateError("Not a device state snapshot")
+        magic, version, count = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise StateError("Not a device state snapshot")
+        if version != VERSION:
+            raise StateError(f"Unsupported device state snapshot version {version}")
+        if count != len(self.types):
+            raise StateError(f"Snapshot of {count} devices, expected {len(self.types)}")
+        view = memoryview(data)
+        offset = HEADER.size + count
+        if view[HEADER.size:offset] != self.types.tobytes():
+            raise StateError("Snapshot of different device types")
+        columns = {}
+        for attribute, (code, _, _) in ATTRIBUTES.items():
+            column = array(code)
+            size = column.itemsize * count
+            if len(view) < offset + size:
+                raise StateError("Truncated device state snapshot")
+            column.frombytes(view[offset:offset + size])
+            if sys.byteorder != "little" and column.itemsize > 1:
+                column.byteswap()
+            columns[attribute] = column
+            offset += size
+        if offset != len(view):
+            raise StateError("Trailing data in device state snapshot")
+        self.columns = columns
+        self._notify_all()
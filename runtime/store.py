@@ -0,0 +1,390 @@
+"""
+Read-only, memory-mapped place store.
+
+A store file holds the places of a .shl file as fixed-width int32 tables
+plus a sorted string table, so any row can be read in place. Worker
+processes that open the same store share its pages through the OS page
+cache instead of each parsing the file and holding its own Place graph;
+Device, Location, Rule and CompiledRule objects are only built for the rows
+a process actually touches.
+
+Layout (little-endian), every section 4-byte aligned:
+
+    header        magic, version, source SHA-256, string count, blob size, row counts
+    strings       int32[strings + 1] byte offsets into the blob, then the UTF-8 blob,
+                  strings sorted so that ids compare like the strings themselves
+    places        name, first location, locations, first rule, rules, first scene, scenes
+    locations     name, first device, devices
+    devices       name, type, location
+    rules         name, condition, first action, actions, compiled,
+                  condition device, functionality, op, value kind, value
+    actions       text, device, command, value kind, value
+    scenes        name, location, first action, actions
+    device names  device rows sorted by name
+    rule keys     compiled rule rows sorted by (condition device, functionality, row)
+"""
+import mmap
+import os
+import struct
+import sys
+from bisect import bisect_left, bisect_right
+
+from dsl import snapshot
+from models.models import Device, Location, Place, Rule, Scene
+from runtime.conditions import Condition
+from runtime.engine import Action, CompiledRule, RuleEngine
+
+MAGIC = b"SHLSTORE"
+VERSION = 1
+SUFFIX = ".store"
+
+HEADER = struct.Struct("<8sHH32s11I")
+TABLES = ("places", "locations", "devices", "rules", "actions", "scenes", "device_names", "rule_keys")
+WIDTHS = {"places": 7, "locations": 3, "devices": 3, "rules": 10, "actions": 5, "scenes": 4,
+          "device_names": 1, "rule_keys": 1}
+OPS = snapshot.OPS
+NONE, INT, STR, BIG_INT = snapshot.NONE, snapshot.INT, snapshot.STR, snapshot.BIG_INT
+INT32_MIN, INT32_MAX = snapshot.INT32_MIN, snapshot.INT32_MAX
+
+
+class StoreError(Exception):
+    pass
+
+
+def store_path(source):
+    return source + SUFFIX
+
+
+# -----------------------
+# Writing
+# -----------------------
+def _value(value, sid):
+    if value is None:
+        return NONE, 0
+    if isinstance(value, int):
+        if INT32_MIN <= value <= INT32_MAX:
+            return INT, value
+        return BIG_INT, sid(str(value))
+    return STR, sid(value)
+
+
+def write_store(places, compiled, path, source_hash):
+    """Writes `places` and their compiled rules (as in a snapshot.Snapshot) to `path`."""
+    strings = set()
+    for place, place_compiled in zip(places, compiled):
+        strings.add(place.name)
+        for location in place.locations:
+            strings.add(location.name)
+            for device in location.devices:
+                strings.update((device.name, device.device_type))
+        for rule, item in zip(place.rules, place_compiled):
+            strings.update((rule.name, rule.condition))
+            strings.update(rule.actions)
+            if isinstance(item, CompiledRule):
+                strings.update((item.condition.device, item.condition.functionality))
+                values = [item.condition.value] + [a.value for a in item.actions]
+                strings.update(str(v) if isinstance(v, int) else v for v in values if v is not None)
+                for action in item.actions:
+                    strings.update((action.device, action.command))
+        for scene in place.scenes:
+            strings.update((scene.name, scene.location))
+            strings.update(scene.actions)
+    strings = sorted(strings)
+    sid = {s: i for i, s in enumerate(strings)}.__getitem__
+
+    tables = {name: [] for name in TABLES}
+    places_t, locations_t, devices_t = tables["places"], tables["locations"], tables["devices"]
+    rules_t, actions_t, scenes_t = tables["rules"], tables["actions"], tables["scenes"]
+    for place, place_compiled in zip(places, compiled):
+        places_t.append((sid(place.name), len(locations_t), len(place.locations), len(rules_t),
+                         len(place.rules), len(scenes_t), len(place.scenes)))
+        for location in place.locations:
+            locations_t.append((sid(location.name), len(devices_t), len(location.devices)))
+            for device in location.devices:
+                devices_t.append((sid(device.name), sid(device.device_type), len(locations_t) - 1))
+        for rule, item in zip(place.rules, place_compiled):
+            first_action = len(actions_t)
+            if isinstance(item, CompiledRule):
+                condition = item.condition
+                rules_t.append((sid(rule.name), sid(rule.condition), first_action, len(rule.actions), 1,
+                                sid(condition.device), sid(condition.functionality), OPS.index(condition.op),
+                                *_value(condition.value, sid)))
+                for text, action in zip(rule.actions, item.actions):
+                    actions_t.append((sid(text), sid(action.device), sid(action.command),
+                                      *_value(action.value, sid)))
+            else:
+                rules_t.append((sid(rule.name), sid(rule.condition), first_action, len(rule.actions),
+                                0, 0, 0, 0, 0, 0))
+                actions_t.extend((sid(text), 0, 0, NONE, 0) for text in rule.actions)
+        for scene in place.scenes:
+            scenes_t.append((sid(scene.name), sid(scene.location), len(actions_t), len(scene.actions)))
+            actions_t.extend((sid(text), 0, 0, NONE, 0) for text in scene.actions)
+    tables["device_names"] = [(row,) for row in sorted(range(len(devices_t)), key=lambda r: devices_t[r][0])]
+    keyed = [row for row in range(len(rules_t)) if rules_t[row][4]]
+    tables["rule_keys"] = [(row,) for row in sorted(keyed, key=lambda r: (rules_t[r][5], rules_t[r][6], r))]
+
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = [0]
+    for b in encoded:
+        offsets.append(offsets[-1] + len(b))
+    blob = b"".join(encoded)
+    blob += b"\0" * (-len(blob) % 4)
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, source_hash, len(strings), len(blob),
+                                *(len(tables[name]) for name in TABLES), 0))
+            f.write(struct.pack(f"<{len(offsets)}i", *offsets))
+            f.write(blob)
+            for name in TABLES:
+                rows = tables[name]
+                f.write(struct.pack(f"<{len(rows) * WIDTHS[name]}i", *(v for row in rows for v in row)))
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+# -----------------------
+# Reading
+# -----------------------
+class PlaceStore:
+    """
+    A store file opened read-only through mmap. Rows are read straight from
+    the mapping; objects are built on first access and then reused, so the
+    same row always gives the same object within a process.
+
+    A PlaceStore pickles as its path, so it can be handed to worker
+    processes, which map the same file again.
+    """
+
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise StoreError("Place stores can only be read on little-endian machines")
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._map_sections()
+        except Exception:
+            self.close()
+            raise
+        self._strings = {}
+        self._locations = {}
+        self._devices = {}
+        self._rules = {}
+        self._compiled = {}
+        self._scenes = {}
+
+    def _map_sections(self):
+        data = self._data = memoryview(self._mmap)
+        if len(data) < HEADER.size:
+            raise StoreError("Truncated place store")
+        magic, version, _, self.source_hash, n_strings, blob_size, *counts = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise StoreError("Not a place store or unsupported version")
+        pos = HEADER.size
+        self._offsets = data[pos:pos + 4 * (n_strings + 1)].cast("i")
+        pos += 4 * (n_strings + 1)
+        self._blob = data[pos:pos + blob_size]
+        pos += blob_size
+        for name, count in zip(TABLES, counts):
+            size = 4 * WIDTHS[name] * count
+            if pos + size > len(data):
+                raise StoreError("Truncated place store")
+            setattr(self, f"_t_{name}", data[pos:pos + size].cast("i"))
+            pos += size
+        self.n_strings = n_strings
+
+    def close(self):
+        for name in ("_offsets", "_blob") + tuple(f"_t_{t}" for t in TABLES) + ("_data",):
+            view = getattr(self, name, None)
+            if view is not None:
+                view.release()
+                setattr(self, name, None)
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+    # -----------------------------
+    # Strings
+    # -----------------------------
+    def string(self, i):
+        s = self._strings.get(i)
+        if s is None:
+            s = self._strings[i] = sys.intern(bytes(self._blob[self._offsets[i]:self._offsets[i + 1]]).decode("utf-8"))
+        return s
+
+    def string_id(self, s):
+        """Id of a string in the table, or None. Binary search over the sorted strings."""
+        i = bisect_left(range(self.n_strings), s, key=self.string)
+        return i if i < self.n_strings and self.string(i) == s else None
+
+    def _row(self, table, width, row):
+        return table[row * width:(row + 1) * width]
+
+    def _value(self, kind, payload):
+        if kind == INT:
+            return payload
+        if kind == STR:
+            return self.string(payload)
+        if kind == BIG_INT:
+            return int(self.string(payload))
+        return None
+
+    # -----------------------------
+    # Rows to objects
+    # -----------------------------
+    def __len__(self):
+        return len(self._t_places) // WIDTHS["places"]
+
+    @property
+    def n_devices(self):
+        return len(self._t_devices) // WIDTHS["devices"]
+
+    @property
+    def n_rules(self):
+        return len(self._t_rules) // WIDTHS["rules"]
+
+    def location(self, row):
+        location = self._locations.get(row)
+        if location is None:
+            name, first, count = self._row(self._t_locations, 3, row)
+            location = self._locations[row] = Location(name=self.string(name))
+            for device_row in range(first, first + count):
+                name, device_type, _ = self._row(self._t_devices, 3, device_row)
+                device = Device(name=self.string(name), device_type=self.string(device_type), location=location)
+                location.devices.append(device)
+                self._devices[device_row] = device
+        return location
+
+    def device(self, row):
+        device = self._devices.get(row)
+        if device is None:
+            self.location(self._t_devices[row * 3 + 2])
+            device = self._devices[row]
+        return device
+
+    def find_device(self, name):
+        """The first device with this name (in name order), or None, without building the others."""
+        sid = self.string_id(name)
+        if sid is None:
+            return None
+        names, devices = self._t_device_names, self._t_devices
+        i = bisect_left(names, sid, key=lambda row: devices[row * 3])
+        if i < len(names) and devices[names[i] * 3] == sid:
+            return self.device(names[i])
+        return None
+
+    def rule(self, row):
+        rule = self._rules.get(row)
+        if rule is None:
+            name, condition, first, count = self._row(self._t_rules, 10, row)[:4]
+            actions = self._t_actions
+            rule = self._rules[row] = Rule(name=self.string(name), condition=self.string(condition),
+                                           actions=[self.string(actions[r * 5]) for r in range(first, first + count)])
+        return rule
+
+    def compiled_rule(self, row):
+        """The CompiledRule of a rule row, or None if the rule could not be compiled."""
+        compiled = self._compiled.get(row)
+        if compiled is None:
+            _, _, first, count, ok, device, functionality, op, kind, value = self._row(self._t_rules, 10, row)
+            if not ok:
+                return None
+            condition = Condition(self.string(device), self.string(functionality), OPS[op], self._value(kind, value))
+            actions = []
+            for r in range(first, first + count):
+                _, a_device, a_command, a_kind, a_value = self._row(self._t_actions, 5, r)
+                actions.append(Action(self.string(a_device), self.string(a_command), self._value(a_kind, a_value)))
+            compiled = self._compiled[row] = CompiledRule(self.rule(row), condition, actions)
+        return compiled
+
+    def rules_for(self, device, functionality, place=0):
+        """CompiledRules of `place` whose condition listens to (device, functionality), in rule order."""
+        device_id, functionality_id = self.string_id(device), self.string_id(functionality)
+        if device_id is None or functionality_id is None:
+            return []
+        rules, keys = self._t_rules, self._t_rule_keys
+        key = lambda row: (rules[row * 10 + 5], rules[row * 10 + 6])
+        lo = bisect_left(keys, (device_id, functionality_id), key=key)
+        hi = bisect_right(keys, (device_id, functionality_id), lo=lo, key=key)
+        _, _, _, first, count, _, _ = self._row(self._t_places, 7, place)
+        return [self.compiled_rule(keys[i]) for i in range(lo, hi) if first <= keys[i] < first + count]
+
+    def scene(self, row):
+        scene = self._scenes.get(row)
+        if scene is None:
+            name, location, first, count = self._row(self._t_scenes, 4, row)
+            actions = self._t_actions
+            scene = self._scenes[row] = Scene(name=self.string(name), location=self.string(location),
+                                              actions=[self.string(actions[r * 5]) for r in range(first, first + count)])
+        return scene
+
+    def place(self, row=0):
+        """Builds the whole Place of a row (every location, device, rule and scene)."""
+        name, first_location, n_locations, first_rule, n_rules, first_scene, n_scenes = self._row(self._t_places, 7, row)
+        place = Place(self.string(name))
+        for r in range(first_location, first_location + n_locations):
+            place.add_location(self.location(r))
+        place.rules.extend(self.rule(r) for r in range(first_rule, first_rule + n_rules))
+        place.scenes.extend(self.scene(r) for r in range(first_scene, first_scene + n_scenes))
+        return place
+
+
+class StoreRuleEngine(RuleEngine):
+    """
+    RuleEngine over one place of a PlaceStore. The rules listening to a
+    (device, event) pair are built and indexed the first time such an event
+    is dispatched, so a worker only materializes the rules it needs.
+    """
+
+    def __init__(self, store, place=0):
+        super().__init__(None, compiled=[])
+        self.store = store
+        self.place_row = place
+        self.loaded = set()
+
+    def dispatch(self, event):
+        key = (event.device, event.event)
+        if key not in self.loaded:
+            self.loaded.add(key)
+            for compiled in self.store.rules_for(event.device, event.event, self.place_row):
+                self.add_compiled(compiled)
+        return super().dispatch(event)
+
+
+# -----------------------
+# Entry points
+# -----------------------
+def open_store(source):
+    """
+    Opens the PlaceStore of a .shl file ("<file>.shl.store"), first building
+    it from the file (or its snapshot) if it is missing or out of date.
+    """
+    source_hash = snapshot.hash_file(source)
+    path = store_path(source)
+    try:
+        store = PlaceStore(path)
+    except (OSError, StoreError):
+        store = None
+    if store is not None and store.source_hash != source_hash:
+        store.close()
+        store = None
+    if store is None:
+        places, compiled = snapshot.load(source)
+        write_store(places, compiled, path, source_hash)
+        store = PlaceStore(path)
+    return store
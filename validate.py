@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from dsl.metamodel import GRAMMAR_FILE, get_metamodel
+from dsl.parallel import validate_places
+
+
+# -----------------------------
+# Worker side
+# -----------------------------
+def _init_worker(grammar_file):
+    # Compile once per worker; every file handled by this process reuses it
+    get_metamodel(grammar_file)
+
+
+def validate_file(path, grammar_file=GRAMMAR_FILE, workers=1, pool=None):
+    """
+    Validates one file as the editor does (dsl.parallel.validate_places):
+    syntax and semantic problems are listed under "problems", and "error"
+    reports a file that could not be checked at all. With `workers` other
+    than 1 or a `pool`, its places are checked in parallel.
+    """
+    result = {"file": path, "valid": True}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            code = f.read()
+        errors = validate_places(code, workers, grammar_file, pool)
+        if errors:
+            result["valid"] = False
+            result["problems"] = [{"message": message, "line": line, "col": col} for message, line, col in errors]
+    except Exception as e:
+        result["valid"] = False
+        result["error"] = str(e)
+        line = getattr(e, "line", None)
+        if line is not None:
+            result["line"] = line
+            result["col"] = getattr(e, "col", None)
+    return result
+
+
+# -----------------------------
+# Driver side
+# -----------------------------
+def find_shl_files(paths):
+    for path in paths:
+        if not os.path.isdir(path):
+            # A missing file is reported by validate_file() rather than skipped
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(".shl"):
+                    yield os.path.join(root, name)
+
+
+def validate_paths(paths, grammar_file=GRAMMAR_FILE, workers=None, chunksize=16):
+    """
+    Validates every .shl file under the given paths in a process pool and
+    yields one result dict per file, in input order.
+    """
+    files = list(find_shl_files(paths))
+    if not files:
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(grammar_file,)) as pool:
+        yield from pool.map(validate_file, files, [grammar_file] * len(files), chunksize=chunksize)
+
+
+def validate_paths_per_place(paths, grammar_file=GRAMMAR_FILE, workers=None):
+    """
+    Validates every .shl file under the given paths one after the other,
+    the places of each file in parallel, and yields one result dict per
+    file. One process pool serves every file.
+    """
+    files = list(find_shl_files(paths))
+    if not files:
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(grammar_file,)) as pool:
+        for path in files:
+            yield validate_file(path, grammar_file, workers, pool)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate SmartHome .shl files without the GUI.")
+    parser.add_argument("paths", nargs="+", help=".shl files or directories to scan recursively")
+    parser.add_argument("--grammar", default=GRAMMAR_FILE, help="textX grammar file (default: grammar.tx)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunksize", type=int, default=16, help="files handed to a worker at a time")
+    parser.add_argument("--per-place", action="store_true",
+                        help="validate the places of each file in parallel instead of the files")
+    args = parser.parse_args(argv)
+
+    total = invalid = 0
+    start = time.perf_counter()
+    if args.per_place:
+        results = validate_paths_per_place(args.paths, args.grammar, args.workers)
+    else:
+        results = validate_paths(args.paths, args.grammar, args.workers, args.chunksize)
+    for result in results:
+        total += 1
+        invalid += not result["valid"]
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+    elapsed = time.perf_counter() - start
+
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"{total} files, {invalid} invalid, {elapsed:.2f}s ({rate:.1f} files/sec)", file=sys.stderr)
+    return 1 if invalid else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())